@@ -1,3 +1,4 @@
 from barcode_api.controller.albums_controller import albums_router
+from barcode_api.controller.metrics_controller import metrics_router
 
-CONTROLLERS = [albums_router]
+CONTROLLERS = [albums_router, metrics_router]
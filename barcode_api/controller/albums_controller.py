@@ -1,11 +1,32 @@
+import asyncio
+import math
+from collections.abc import AsyncIterator
+from http import HTTPStatus
 from typing import Annotated
 
-from fastapi import APIRouter, Depends, HTTPException, Query, Request
+from fastapi import APIRouter, Depends, Header, HTTPException, Query, Request, Response
+from fastapi.responses import JSONResponse
 
+from barcode_api.core import http_cache
+from barcode_api.core.cache import LRUCache, response_cache
+from barcode_api.core.database import sessionmanager
+from barcode_api.core.dependencies.auth import verify_token
 from barcode_api.core.dependencies.database import DBSessionDep
+from barcode_api.core.streaming import NDJSONStreamingResponse, read_lines
+from barcode_api.models import Album, LookupJob
 from barcode_api.schemas.dto.albums_dto import Album as AlbumDTO
+from barcode_api.schemas.dto.albums_dto import (
+    BatchSearchRequest,
+    BatchSearchResponse,
+    BatchSearchResult,
+    FindResponse,
+    GenreResponse,
+)
 from barcode_api.schemas.dto.errors_dto import ErrorResponse
-from barcode_api.services import AlbumService
+from barcode_api.schemas.dto.jobs_dto import LookupJob as LookupJobDTO
+from barcode_api.services import AlbumService, LookupJobService
+from barcode_api.services.album_service import BARCODE_MAX_LENGTH, HttpxService
+from barcode_api.services.job_service import ACTIVE_STATUSES
 
 
 # async for being used as an async dependency
@@ -15,17 +36,239 @@ async def get_album_service(request: Request, db_session: DBSessionDep):  # noqa
 
 AlbumServiceDependency = Annotated[AlbumService, Depends(get_album_service)]
 
-albums_router = APIRouter(prefix="/album", dependencies=[Depends(get_album_service)])
+
+async def get_lookup_job_service(request: Request, db_session: DBSessionDep):  # noqa: RUF029
+    return LookupJobService(config=request.state.config, logger=request.state.logger, db_session=db_session)
+
+
+LookupJobServiceDependency = Annotated[LookupJobService, Depends(get_lookup_job_service)]
+
+albums_router = APIRouter(prefix="/album", dependencies=[Depends(verify_token), Depends(get_album_service)])
 
 
 BarcodeQuery = Annotated[str, Query(title="The Barcode to search")]
+FindQuery = Annotated[str, Query(min_length=1, title="Words to search cached album artists and names for")]
+
+
+UPSTREAM_ERROR_RESPONSES = {"502": {"model": ErrorResponse}, "503": {"model": ErrorResponse}}
+
+
+def upstream_http_exception(exc: HttpxService.UpstreamError) -> HTTPException:
+    """
+    Maps an upstream failure to a 503 (with a Retry-After) if the upstream is rate limited or its circuit is open,
+    otherwise a 502
+    """
+    if isinstance(exc, HttpxService.UnavailableError):
+        return HTTPException(
+            status_code=HTTPStatus.SERVICE_UNAVAILABLE,
+            detail=str(exc),
+            headers={"Retry-After": str(math.ceil(exc.retry_after))},
+        )
+    return HTTPException(status_code=HTTPStatus.BAD_GATEWAY, detail=str(exc))
+
+
+class RawJSONResponse(Response):
+    """A response for a body that is already encoded JSON, sent as is"""
+
+    media_type = "application/json"
+
+
+def album_body(album: Album, cache: LRUCache | None = None) -> tuple[bytes, str]:
+    """The encoded AlbumDTO for album and its ETag, built once per row"""
+    cache = cache if cache is not None else response_cache
+    # by barcode, albums in the write behind buffer don't have an id yet
+    key = (Album.__tablename__, album.barcode)
+    cached = cache.get(key)
+    # a rewritten album is a new row object, even when sqlite gives it the same last_update to the second
+    if cached is not None and cached[0] is album:
+        return cached[1], cached[2]
+    body = AlbumDTO.model_validate(album).model_dump_json().encode()
+    tag = http_cache.etag(body)
+    cache.set(key, (album, body, tag))
+    return body, tag
+
+
+def prefers_async(prefer: str | None) -> bool:
+    """True if a Prefer header (RFC 7240) asks for respond-async"""
+    if prefer is None:
+        return False
+    return any(preference.split(";", 1)[0].strip().lower() == "respond-async" for preference in prefer.split(","))
+
+
+async def job_response(
+    request: Request, job_service: LookupJobService, job: LookupJob, status_code: int = HTTPStatus.OK
+) -> JSONResponse:
+    body = LookupJobDTO.model_validate(job)
+    if (album := await job_service.album(job)) is not None:
+        body.album = AlbumDTO.model_validate(album)
+    headers = {"Location": str(request.url_for("get_lookup_job", job_id=job.id))}
+    if job.status in ACTIVE_STATUSES:
+        headers["Retry-After"] = "1"
+    return JSONResponse(body.model_dump(mode="json"), status_code=status_code, headers=headers)
+
 
+@albums_router.get(
+    "/search",
+    response_model=AlbumDTO,
+    responses={
+        "202": {"model": LookupJobDTO, "description": "The barcode is being looked up, see the Location header"},
+        "304": {"description": "Not Modified"},
+        "404": {"model": ErrorResponse},
+        **UPSTREAM_ERROR_RESPONSES,
+    },
+)
+async def get_album_by_barcode(
+    barcode: BarcodeQuery,
+    request: Request,
+    album_service: AlbumServiceDependency,
+    job_service: LookupJobServiceDependency,
+    prefer: Annotated[str | None, Header(description="respond-async to look uncached barcodes up as a job")] = None,
+) -> Response:
+    """
+    Looks an album up by barcode
 
-@albums_router.get("/search", responses={"404": {"model": ErrorResponse}})
-async def get_album_by_barcode(barcode: BarcodeQuery, album_service: AlbumServiceDependency) -> AlbumDTO:
+    With a Prefer: respond-async header an uncached barcode isn't looked up while the request waits, instead a
+    lookup job is started and a 202 is returned with the job, poll the job's Location for the result.
+    """
+    config = request.state.config
     try:
-        album = await album_service.search(barcode=barcode)
+        if not prefers_async(prefer):
+            album = await album_service.search(barcode=barcode)
+        elif (album := await album_service.search_cached(barcode=barcode)) is None:
+            job = await job_service.create(barcode)
+            response = await job_response(request, job_service, job, HTTPStatus.ACCEPTED)
+            response.headers["Preference-Applied"] = "respond-async"
+            return response
     except AlbumService.NotFoundError as exc:
-        raise HTTPException(status_code=404, detail=str(exc)) from exc
+        raise HTTPException(
+            status_code=404,
+            detail=str(exc),
+            headers={"Cache-Control": http_cache.cache_control(config.album_not_found_http_max_age)},
+        ) from exc
+    except HttpxService.UpstreamError as exc:
+        raise upstream_http_exception(exc) from exc
+    except LookupJobService.QueueFullError as exc:
+        raise HTTPException(
+            status_code=HTTPStatus.SERVICE_UNAVAILABLE, detail=str(exc), headers={"Retry-After": "1"}
+        ) from exc
+
+    # the body is encoded once per album row, skipping response model validation on every hit
+    body, tag = album_body(album)
+    headers = http_cache.validator_headers(album, tag, config.album_http_max_age)
+    if http_cache.is_not_modified(request.headers, album, tag):
+        return Response(status_code=HTTPStatus.NOT_MODIFIED, headers=headers)
+    return RawJSONResponse(body, headers=headers)
+
+
+@albums_router.get("/jobs/{job_id}", response_model=LookupJobDTO, responses={"404": {"model": ErrorResponse}})
+async def get_lookup_job(
+    job_id: str,
+    request: Request,
+    job_service: LookupJobServiceDependency,
+    wait: Annotated[float, Query(ge=0, description="Seconds to wait for the job to finish before responding")] = 0,
+) -> JSONResponse:
+    """A lookup job started by GET /album/search. With wait, responds as soon as the job finishes (a long poll)"""
+    try:
+        job = await job_service.wait(job_id, min(wait, request.state.config.lookup_job_max_wait))
+    except LookupJobService.NotFoundError as exc:
+        raise HTTPException(status_code=HTTPStatus.NOT_FOUND, detail=str(exc)) from exc
+    return await job_response(request, job_service, job)
+
+
+@albums_router.get("/find")
+async def find_albums(
+    q: FindQuery,
+    album_service: AlbumServiceDependency,
+    limit: Annotated[int, Query(ge=1, le=100)] = 20,
+    offset: Annotated[int, Query(ge=0)] = 0,
+) -> FindResponse:
+    albums = await album_service.find(q, limit=limit, offset=offset)
+    return FindResponse(
+        query=q, limit=limit, offset=offset, results=[AlbumDTO.model_validate(album) for album in albums]
+    )
+
+
+@albums_router.get("/by-genre")
+async def get_albums_by_genre(
+    genre: Annotated[str, Query(min_length=1, title="The genre, as Discogs names it, e.g. Rock or Electronic")],
+    album_service: AlbumServiceDependency,
+    limit: Annotated[int, Query(ge=1, le=100)] = 20,
+    offset: Annotated[int, Query(ge=0)] = 0,
+) -> GenreResponse:
+    albums = await album_service.by_genre(genre, limit=limit, offset=offset)
+    return GenreResponse(
+        genre=genre, limit=limit, offset=offset, results=[AlbumDTO.model_validate(album) for album in albums]
+    )
+
+
+def batch_result(barcode: str, album: Album | Exception) -> BatchSearchResult:
+    """
+    The result for one barcode of a batch. Errors other than the service's own are logged where they happen and
+    reported as a 500 without their message, which may hold internals
+    """
+    if isinstance(album, AlbumService.NotFoundError):
+        return BatchSearchResult(barcode=barcode, status_code=HTTPStatus.NOT_FOUND, error=str(album))
+    if isinstance(album, AlbumService.InvalidBarcodeError):
+        return BatchSearchResult(barcode=barcode, status_code=HTTPStatus.UNPROCESSABLE_ENTITY, error=str(album))
+    if isinstance(album, HttpxService.UnavailableError):
+        return BatchSearchResult(barcode=barcode, status_code=HTTPStatus.SERVICE_UNAVAILABLE, error=str(album))
+    if isinstance(album, HttpxService.UpstreamError):
+        return BatchSearchResult(barcode=barcode, status_code=HTTPStatus.BAD_GATEWAY, error=str(album))
+    if isinstance(album, Exception):
+        return BatchSearchResult(
+            barcode=barcode, status_code=HTTPStatus.INTERNAL_SERVER_ERROR, error=HTTPStatus.INTERNAL_SERVER_ERROR.phrase
+        )
+    return BatchSearchResult(barcode=barcode, status_code=HTTPStatus.OK, album=AlbumDTO.model_validate(album))
+
+
+@albums_router.post("/search/batch", responses={"422": {"model": ErrorResponse}})
+async def get_albums_by_barcodes(
+    batch: BatchSearchRequest, request: Request, album_service: AlbumServiceDependency
+) -> BatchSearchResponse:
+    max_size = request.state.config.batch_max_size
+    if len(batch.barcodes) > max_size:
+        raise HTTPException(
+            status_code=HTTPStatus.UNPROCESSABLE_ENTITY, detail=f"Batches are limited to {max_size} barcodes"
+        )
+
+    albums = await album_service.search_many(batch.barcodes)
+    return BatchSearchResponse(results=[batch_result(barcode, albums[barcode]) for barcode in batch.barcodes])
+
+
+@albums_router.post(
+    "/search/stream",
+    response_class=NDJSONStreamingResponse,
+    openapi_extra={
+        "requestBody": {"required": True, "content": {"text/plain": {"schema": {"type": "string"}}}},
+    },
+    responses={
+        "200": {
+            "description": "A BatchSearchResult per barcode, one JSON object per line",
+            "content": {"application/x-ndjson": {"schema": {"$ref": "#/components/schemas/BatchSearchResult"}}},
+        }
+    },
+)
+async def stream_albums_by_barcodes(request: Request) -> NDJSONStreamingResponse:
+    """
+    Looks up barcodes sent one per line, streaming a BatchSearchResult line back for each as soon as it resolves
+
+    Cached albums are sent as soon as their line is read, upstream lookups follow in the order they finish. The
+    request body is read as it arrives, so results start before the client has finished sending barcodes.
+    """
+    config = request.state.config
+    logger = request.state.logger
+    body_read = asyncio.Event()
+
+    async def batches() -> AsyncIterator[list[str]]:
+        async for batch in read_lines(request.stream(), BARCODE_MAX_LENGTH, config.batch_max_size):
+            yield batch
+        body_read.set()
+
+    async def results() -> AsyncIterator[bytes]:
+        # the request's db session is closed once the endpoint returns, the stream outlives it
+        async with sessionmanager.session() as db_session:
+            album_service = AlbumService(config=config, logger=logger, db_session=db_session)
+            async for barcode, album in album_service.search_stream(batches()):
+                yield batch_result(barcode, album).model_dump_json().encode() + b"\n"
 
-    return AlbumDTO.model_validate(album)
+    return NDJSONStreamingResponse(results(), body_read=body_read)
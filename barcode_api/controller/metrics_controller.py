@@ -0,0 +1,16 @@
+from fastapi import APIRouter, Depends
+from fastapi.responses import PlainTextResponse
+
+from barcode_api.core.dependencies.auth import verify_token
+from barcode_api.core.metrics import registry
+
+metrics_router = APIRouter(dependencies=[Depends(verify_token)])
+
+
+class PrometheusResponse(PlainTextResponse):
+    media_type = "text/plain; version=0.0.4"
+
+
+@metrics_router.get("/metrics", response_class=PrometheusResponse, include_in_schema=False)
+async def get_metrics() -> PrometheusResponse:
+    return PrometheusResponse(registry.render())
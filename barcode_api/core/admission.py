@@ -0,0 +1,126 @@
+import asyncio
+import time
+from collections import deque
+from contextlib import asynccontextmanager
+
+from barcode_api.core.config import Config, get_config
+from barcode_api.core.errors import BarcodeAPIBaseException
+from barcode_api.core.metrics import StatsCollector, registry
+
+
+class AdmissionController:
+    """
+    Bounds how much work is let through to a slow resource, and sheds the rest instead of letting it pile up
+
+    At most concurrency callers are admitted at a time. Up to max_queue more wait for a slot, in arrival order, for
+    at most max_wait seconds. A caller that finds the queue full, or waits too long, gets a RejectedError with an
+    estimate of when to retry. A concurrency of 0 admits everyone.
+    """
+
+    class RejectedError(BarcodeAPIBaseException):
+        def __init__(self, message: str, retry_after: float) -> None:
+            super().__init__(message)
+            self.retry_after = retry_after
+
+    def __init__(self, name: str, concurrency: int, max_queue: int, max_wait: float):
+        self.name = name
+        self.concurrency = concurrency
+        self.max_queue = max_queue
+        self.max_wait = max_wait
+        self._waiters: deque[asyncio.Future] = deque()
+        # moving average of how long admitted callers hold their slot
+        self._hold_time = 0.0
+
+        self.running = 0
+        self.admitted = 0
+        self.shed = 0
+        self.timed_out = 0
+
+    @property
+    def queue_depth(self) -> int:
+        return len(self._waiters)
+
+    @property
+    def retry_after(self) -> float:
+        """Rough seconds until a new caller would be admitted, from the queue and recent hold times"""
+        if self.concurrency <= 0:
+            return 0.0
+        return max(self._hold_time * (self.queue_depth + 1) / self.concurrency, 1.0)
+
+    @asynccontextmanager
+    async def admit(self):
+        """Holds a slot for the duration of the block, raising RejectedError if one can't be had"""
+        if self.concurrency <= 0:
+            yield
+            return
+        await self._acquire()
+        started = time.monotonic()
+        try:
+            yield
+        finally:
+            self._release(time.monotonic() - started)
+
+    def stats(self) -> dict[str, float]:
+        return {
+            "running": self.running,
+            "queue_depth": self.queue_depth,
+            "admitted": self.admitted,
+            "shed": self.shed,
+            "timed_out": self.timed_out,
+            "hold_seconds_avg": self._hold_time,
+        }
+
+    async def _acquire(self) -> None:
+        if self.running < self.concurrency and not self._waiters:
+            self.running += 1
+            self.admitted += 1
+            return
+        if self.queue_depth >= self.max_queue:
+            self.shed += 1
+            err_msg = f"Too many {self.name} requests are waiting, try again later"
+            raise self.RejectedError(err_msg, retry_after=self.retry_after)
+
+        future = asyncio.get_running_loop().create_future()
+        self._waiters.append(future)
+        try:
+            async with asyncio.timeout(self.max_wait):
+                await future
+        except BaseException as exc:
+            if future.done() and not future.cancelled():
+                # handed a slot just as we gave up on it, pass it on
+                self._release(0.0)
+            elif future in self._waiters:
+                self._waiters.remove(future)
+            if not isinstance(exc, TimeoutError):
+                raise
+            self.timed_out += 1
+            err_msg = f"Timed out waiting to start a {self.name} request, try again later"
+            raise self.RejectedError(err_msg, retry_after=self.retry_after) from None
+        self.admitted += 1
+
+    def _release(self, held: float) -> None:
+        if held > 0:
+            self._hold_time = held if self._hold_time == 0 else 0.8 * self._hold_time + 0.2 * held
+        while self._waiters:
+            future = self._waiters.popleft()
+            # the slot goes straight to the next waiter, running doesn't change
+            if not future.done():
+                future.set_result(None)
+                return
+        self.running -= 1
+
+
+config: Config = get_config()
+# cache misses looked up on Discogs and Spotify, see AlbumService._lookup_album
+upstream_admission = AdmissionController(
+    "upstream", config.upstream_max_concurrency, config.upstream_max_queue, config.upstream_max_queue_wait
+)
+registry.register(
+    StatsCollector(
+        "barcode_api_upstream_admission",
+        "Admission control of upstream lookups, lookups past the queue are shed with a 503",
+        "path",
+        {upstream_admission.name: upstream_admission.stats},
+        counters=("admitted", "shed", "timed_out"),
+    )
+)
@@ -0,0 +1,95 @@
+import asyncio
+from collections.abc import Awaitable, Callable, Hashable
+from contextlib import asynccontextmanager
+
+import structlog
+from fastapi import FastAPI
+
+from barcode_api.core.config import Config, get_config
+from barcode_api.core.metrics import StatsCollector, registry
+
+
+class BackgroundTaskPool:
+    """
+    Runs fire-and-forget work off the request path
+
+    Work is deduplicated by key: submitting a key that is already pending or running is a no-op. At most
+    max_concurrency tasks run at a time and at most max_pending are accepted, anything over that is dropped so
+    background work can never pile up behind a slow upstream.
+    """
+
+    def __init__(self, name: str, max_concurrency: int, max_pending: int):
+        self.name = name
+        self.max_pending = max_pending
+        self._semaphore = asyncio.Semaphore(max_concurrency)
+        self._tasks: dict[Hashable, asyncio.Task] = dict()
+        self._logger = structlog.stdlib.get_logger("app")
+        self.completed = 0
+        self.failed = 0
+        self.dropped = 0
+
+    def __len__(self) -> int:
+        return len(self._tasks)
+
+    def __contains__(self, key: Hashable) -> bool:
+        return key in self._tasks
+
+    def submit(self, key: Hashable, fn: Callable[[], Awaitable[None]]) -> bool:
+        """Schedules fn to run in the background, returns False if it was deduplicated or dropped"""
+        if key in self._tasks:
+            return False
+        if len(self._tasks) >= self.max_pending:
+            self.dropped += 1
+            return False
+        self._tasks[key] = asyncio.create_task(self._run(key, fn))
+        return True
+
+    async def close(self) -> None:
+        """Cancels any pending or running work"""
+        tasks = list(self._tasks.values())
+        for task in tasks:
+            task.cancel()
+        await asyncio.gather(*tasks, return_exceptions=True)
+        self._tasks.clear()
+
+    def stats(self) -> dict[str, int]:
+        return {
+            "pending": len(self._tasks),
+            "completed": self.completed,
+            "failed": self.failed,
+            "dropped": self.dropped,
+        }
+
+    async def _run(self, key: Hashable, fn: Callable[[], Awaitable[None]]) -> None:
+        try:
+            async with self._semaphore:
+                await fn()
+            self.completed += 1
+        except Exception:
+            self.failed += 1
+            self._logger.exception("Background task failed", pool=self.name, key=str(key))
+        finally:
+            self._tasks.pop(key, None)
+
+
+config: Config = get_config()
+# refreshes of stale cached albums, see AlbumService._revalidate
+refresh_pool = BackgroundTaskPool("refresh", config.refresh_max_concurrency, config.refresh_max_pending)
+registry.register(
+    StatsCollector(
+        "barcode_api_background_tasks",
+        "Background task pool",
+        "pool",
+        {refresh_pool.name: refresh_pool.stats},
+        counters=("completed", "failed", "dropped"),
+    )
+)
+
+
+@asynccontextmanager
+async def background_lifespan(app: FastAPI):
+    """
+    Cancels outstanding background work on shutdown
+    """
+    yield
+    await refresh_pool.close()
@@ -0,0 +1,93 @@
+import time
+from collections import OrderedDict
+from collections.abc import Callable, Hashable
+from typing import Any
+
+from barcode_api.core.config import Config, get_config
+from barcode_api.core.metrics import StatsCollector, registry
+
+
+class LRUCache:
+    """
+    Bounded in-memory LRU cache with a TTL on every entry
+
+    Keeps hit, miss, eviction (dropped to make room) and expiration (dropped for age) counters.
+    A maxsize of 0 disables the cache, every get is a miss and set is a no-op.
+    """
+
+    def __init__(self, maxsize: int, ttl: float | None = None):
+        self.maxsize = maxsize
+        self.ttl = ttl
+        self._data: OrderedDict[Hashable, tuple[float, Any]] = OrderedDict()
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+        self.expirations = 0
+
+    def __len__(self) -> int:
+        return len(self._data)
+
+    def get(self, key: Hashable, default: Any = None) -> Any:
+        entry = self._data.get(key)
+        if entry is None:
+            self.misses += 1
+            return default
+        expires_at, value = entry
+        if expires_at < time.monotonic():
+            del self._data[key]
+            self.expirations += 1
+            self.misses += 1
+            return default
+        self._data.move_to_end(key)
+        self.hits += 1
+        return value
+
+    def set(self, key: Hashable, value: Any) -> None:
+        if self.maxsize <= 0:
+            return
+        expires_at = time.monotonic() + self.ttl if self.ttl is not None else float("inf")
+        self._data[key] = (expires_at, value)
+        self._data.move_to_end(key)
+        while len(self._data) > self.maxsize:
+            self._data.popitem(last=False)
+            self.evictions += 1
+
+    def invalidate(self, key: Hashable) -> None:
+        self._data.pop(key, None)
+
+    def invalidate_values(self, predicate: Callable[[Any], bool]) -> None:
+        """Drops every entry whose value predicate is true for, a scan of the whole cache"""
+        for key in [key for key, (_, value) in self._data.items() if predicate(value)]:
+            del self._data[key]
+
+    def clear(self) -> None:
+        self._data.clear()
+
+    def stats(self) -> dict[str, int]:
+        return {
+            "size": len(self._data),
+            "maxsize": self.maxsize,
+            "hits": self.hits,
+            "misses": self.misses,
+            "evictions": self.evictions,
+            "expirations": self.expirations,
+        }
+
+
+config: Config = get_config()
+# process wide cache of rows looked up by the barcode services, keyed by (table name, lookup key, value)
+l1_cache = LRUCache(maxsize=config.l1_cache_size, ttl=config.l1_cache_ttl)
+# encoded response bodies keyed by (table name, barcode), with the row they were built from. A body is only reused for
+# that same row object, a rewritten or reloaded row is encoded again
+response_cache = LRUCache(maxsize=config.response_cache_size)
+# ids of api tokens that verified, keyed by a sha256 of the presented token so the cache never holds a usable token
+token_cache = LRUCache(maxsize=config.auth_cache_size, ttl=config.auth_cache_ttl)
+registry.register(
+    StatsCollector(
+        "barcode_api_l1_cache",
+        "In-process cache of looked up rows, response bodies and verified api tokens",
+        "cache",
+        {"l1": l1_cache.stats, "response": response_cache.stats, "tokens": token_cache.stats},
+        counters=("hits", "misses", "evictions", "expirations"),
+    )
+)
@@ -36,10 +36,132 @@ class Config(BaseSettings):
     postgres_pass: str | None = None
     postgres_db: str | None = None
     echo_sql: bool = False
+    # connection pool, size/overflow/timeout are ignored for in-memory sqlite
+    db_pool_size: int = 5
+    db_max_overflow: int = 10
+    db_pool_timeout: float = 30.0
+    # checks connections before handing them out, worth it for postgres, an extra round trip per checkout on sqlite
+    db_pool_pre_ping: bool = False
+    # seconds before a pooled connection is replaced, -1 never recycles
+    db_pool_recycle: int = 3600
+    # sqlite pragmas applied to every new connection. WAL lets readers and a writer work at the same time
+    sqlite_journal_mode: str = "wal"
+    sqlite_synchronous: str = "normal"
+    sqlite_busy_timeout_ms: int = 5000
+    sqlite_mmap_size: int = 268435456
+    # negative values are KiB, positive values are pages
+    sqlite_cache_size: int = -64000
+
+    # in-process cache in front of the db, a size of 0 disables it
+    l1_cache_size: int = 1024
+    l1_cache_ttl: int = 300
+    # encoded /album/search response bodies kept in memory, a size of 0 disables it
+    response_cache_size: int = 1024
+    # seconds to remember that a barcode couldn't be found upstream, 0 disables negative caching
+    negative_cache_ttl: int = 86400
+    # cached albums older than the soft ttl (seconds) are served and refreshed in the background, older than the
+    # hard ttl are refetched before being served. 0 disables either check
+    album_soft_ttl: int = 2592000
+    album_hard_ttl: int = 0
+    # background refreshes, at most max_concurrency run at a time and anything past max_pending is dropped
+    refresh_max_concurrency: int = 2
+    refresh_max_pending: int = 100
+    # seconds to wait before retrying a refresh that failed
+    refresh_retry_after: int = 300
+
+    # write behind: albums and lookup misses found by a request are returned before they are written, and written
+    # in one transaction every write_behind_interval seconds or as soon as write_behind_max_rows are waiting.
+    # Lookups by barcode see unwritten rows, /album/find and /album/by-genre only once they are written. Rows still
+    # waiting if the process dies without shutting down are lost
+    write_behind: bool = False
+    write_behind_interval: float = 0.2
+    write_behind_max_rows: int = 100
+
+    # Cache-Control max-age (seconds) sent with found albums and with not found results, 0 sends no-cache
+    album_http_max_age: int = 3600
+    album_not_found_http_max_age: int = 300
+
+    # batch lookups
+    batch_max_size: int = 500
+    # max upstream lookups a single batch request runs at once
+    batch_lookup_concurrency: int = 8
+
+    # lookup jobs, started by GET /album/search with a Prefer: respond-async header for uncached barcodes
+    lookup_job_workers: int = 4
+    # jobs waiting for a worker, past this new jobs are refused with a 503
+    lookup_job_max_pending: int = 1000
+    # times a job is retried while its upstream is rate limited or its circuit is open
+    lookup_job_max_attempts: int = 5
+    # longest a GET /album/jobs/{id}?wait= long poll is held open, in seconds
+    lookup_job_max_wait: float = 30.0
+    # seconds finished jobs are kept before they are deleted
+    lookup_job_ttl: int = 86400
+    # seconds a job may be running before it is taken to be lost with the process that was running it, and is queued
+    # again. Keep it well above the longest a lookup can take, including its waits for rate limits and admission
+    lookup_job_lease: int = 300
+
+    # api tokens, sent as Authorization: Bearer <token> and managed with barcode-token. When enabled every /album
+    # and /metrics request needs a token that hasn't been revoked
+    auth_enabled: bool = False
+    # tokens that verified are remembered in memory for auth_cache_ttl seconds, keyed by a sha256 of the token, so
+    # later requests with them skip the database. A size of 0 verifies every request
+    auth_cache_size: int = 1024
+    auth_cache_ttl: int = 300
+    # seconds between checks for tokens revoked by another process, like barcode-token revoke
+    auth_revocation_poll: float = 5.0
+
+    # upstream http client config
+    # limits are applied per upstream host, each host gets its own keep-alive pool
+    http_max_connections_per_host: int = 20
+    http_max_keepalive_connections_per_host: int = 10
+    http_keepalive_expiry: float = 30.0
+    http_timeout: float = 10.0
+    http_connect_timeout: float = 5.0
+    # http2 requires the h2 package to be installed (pip install httpx[http2])
+    http2: bool = False
+
+    # upstream rate limits. discogs allows 60 authenticated requests a minute and reports what is left in its
+    # response headers, spotify doesn't publish a limit and returns 429s with a Retry-After
+    discogs_requests_per_minute: int = 60
+    discogs_burst: int = 5
+    spotify_requests_per_minute: int = 180
+    spotify_burst: int = 10
+    # times a 429ed request is retried after waiting out its Retry-After
+    upstream_max_retries: int = 2
+    # seconds to back off on a 429 without a Retry-After
+    upstream_default_retry_after: float = 5.0
+    # longest a lookup waits out an upstream's 429 pause, a longer pause fails it right away with a 503 and a
+    # Retry-After. Background work (refreshes, warm ups, lookup jobs) waits out any pause
+    upstream_max_pause_wait: float = 2.0
+    # seconds a single upstream request may take once it has its rate limit token, including any hedge
+    discogs_deadline: float = 5.0
+    spotify_deadline: float = 3.0
+    # a request still running after this percentile of recent latencies is hedged with a second identical request,
+    # the first response wins. 0 disables hedging. hedges spend rate limit tokens, leave it off near the limits
+    discogs_hedge_percentile: float = 0.0
+    spotify_hedge_percentile: float = 0.0
+    # recent requests needed before the percentile is trusted
+    hedge_min_samples: int = 20
+    # a provider's circuit opens when error_rate of at least min_requests in the last window seconds failed. while
+    # open lookups fail fast, stale cached albums are still served, and a trial request is let through every
+    # reset_timeout seconds
+    breaker_error_rate: float = 0.5
+    breaker_min_requests: int = 10
+    breaker_window: float = 30.0
+    breaker_reset_timeout: float = 30.0
+    # admission control of cache misses: at most upstream_max_concurrency upstream lookups run at once, and up to
+    # upstream_max_queue more wait up to upstream_max_queue_wait seconds for a turn. Lookups past that get a 503
+    # with a Retry-After instead of piling up while an upstream is slow. Cache hits never wait here, a concurrency
+    # of 0 disables it
+    upstream_max_concurrency: int = 32
+    upstream_max_queue: int = 64
+    upstream_max_queue_wait: float = 10.0
 
     # spotify config
     spotify_client_id: str
     spotify_client_secret: str
+    # seconds before the access token expires to start refreshing it in the background
+    spotify_token_refresh_margin: int = 60
 
     # discogs config
     discogs_token: str
@@ -52,6 +174,16 @@ class Config(BaseSettings):
             url = f"{self.sqlalchemy_driver}://{self.postgres_user}:{self.postgres_pass}@{self.postgres_host}:{self.postgres_port}/{self.postgres_db}"
         return url
 
+    @property
+    def sqlite_pragmas(self) -> dict[str, str | int]:
+        return {
+            "journal_mode": self.sqlite_journal_mode,
+            "synchronous": self.sqlite_synchronous,
+            "busy_timeout": self.sqlite_busy_timeout_ms,
+            "mmap_size": self.sqlite_mmap_size,
+            "cache_size": self.sqlite_cache_size,
+        }
+
 
 @lru_cache
 def get_config() -> Config:
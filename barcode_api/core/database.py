@@ -1,9 +1,11 @@
 import contextlib
 from collections.abc import AsyncIterator
 from contextlib import asynccontextmanager
+from functools import partial
 from typing import Any, ClassVar
 
 from fastapi import FastAPI
+from sqlalchemy import event
 from sqlalchemy.ext.asyncio import (
     AsyncConnection,
     AsyncSession,
@@ -13,6 +15,7 @@ from sqlalchemy.ext.asyncio import (
 from sqlalchemy.orm import DeclarativeBase
 
 from barcode_api.core.config import Config, get_config
+from barcode_api.core.metrics import StatsCollector, instrument_engine, registry
 
 ERROR_MESSAGES: dict[str, str] = {"NOT_INITIALIZED": "DatabaseSessionManager is not initialized"}
 
@@ -22,12 +25,41 @@ class Base(DeclarativeBase):
     __mapper_args__: ClassVar[dict[str, Any]] = {"eager_defaults": True}
 
 
+def set_sqlite_pragmas(pragmas: dict[str, Any], dbapi_connection, connection_record) -> None:
+    """Engine connect event handler that applies pragmas to each new sqlite connection"""
+    cursor = dbapi_connection.cursor()
+    for pragma, value in pragmas.items():
+        cursor.execute(f"PRAGMA {pragma}={value}")
+    cursor.close()
+
+
+def engine_kwargs_from_config(config: Config) -> dict[str, Any]:
+    engine_kwargs = {
+        "echo": config.echo_sql,
+        "pool_pre_ping": config.db_pool_pre_ping,
+        "pool_recycle": config.db_pool_recycle,
+    }
+    # in-memory sqlite uses a single static connection, there is no pool to size
+    if ":memory:" not in config.sqlalchemy_url:
+        engine_kwargs |= {
+            "pool_size": config.db_pool_size,
+            "max_overflow": config.db_max_overflow,
+            "pool_timeout": config.db_pool_timeout,
+        }
+    return engine_kwargs
+
+
 # Heavily inspired by https://praciano.com.br/fastapi-and-async-sqlalchemy-20-with-pytest-done-right.html
 class DatabaseSessionManager:
-    def __init__(self, host: str, engine_kwargs: dict[str, Any] | None = None):
+    def __init__(
+        self, host: str, engine_kwargs: dict[str, Any] | None = None, sqlite_pragmas: dict[str, Any] | None = None
+    ):
         if engine_kwargs is None:
             engine_kwargs = dict()
         self._engine = create_async_engine(host, **engine_kwargs)
+        if sqlite_pragmas and self._engine.dialect.name == "sqlite":
+            event.listen(self._engine.sync_engine, "connect", partial(set_sqlite_pragmas, sqlite_pragmas))
+        instrument_engine(self._engine.sync_engine)
         self._sessionmaker = async_sessionmaker(autocommit=False, bind=self._engine, expire_on_commit=False)
 
     async def close(self):
@@ -38,6 +70,18 @@ class DatabaseSessionManager:
         self._engine = None
         self._sessionmaker = None
 
+    def pool_stats(self) -> dict[str, int]:
+        """Size and usage of the connection pool, empty if the pool doesn't track them"""
+        pool = self._engine.pool if self._engine is not None else None
+        if not hasattr(pool, "checkedout"):
+            return {}
+        return {
+            "size": pool.size(),
+            "checked_out": pool.checkedout(),
+            "checked_in": pool.checkedin(),
+            "overflow": pool.overflow(),
+        }
+
     @contextlib.asynccontextmanager
     async def connect(self) -> AsyncIterator[AsyncConnection]:
         if self._engine is None:
@@ -66,7 +110,12 @@ class DatabaseSessionManager:
 
 
 config: Config = get_config()
-sessionmanager = DatabaseSessionManager(config.sqlalchemy_url, {"echo": config.echo_sql})
+sessionmanager = DatabaseSessionManager(
+    config.sqlalchemy_url, engine_kwargs_from_config(config), sqlite_pragmas=config.sqlite_pragmas
+)
+registry.register(
+    StatsCollector("barcode_api_db_pool", "Database connection pool", "pool", {"default": sessionmanager.pool_stats})
+)
 
 
 async def get_db_session():
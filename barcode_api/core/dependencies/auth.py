@@ -0,0 +1,37 @@
+from http import HTTPStatus
+from typing import Annotated
+
+from fastapi import Depends, HTTPException, Request
+from fastapi.security import HTTPAuthorizationCredentials, HTTPBearer
+
+from barcode_api.core.cache import token_cache
+from barcode_api.core.database import sessionmanager
+from barcode_api.services.token_service import TokenService, token_digest
+
+bearer_token = HTTPBearer(auto_error=False, description="An api token from barcode-token create")
+
+
+async def verify_token(
+    request: Request,
+    credentials: Annotated[HTTPAuthorizationCredentials | None, Depends(bearer_token)],
+) -> int | None:
+    """
+    Rejects the request with a 401 unless it has a valid api token, returns the token's id. Does nothing when auth
+    is disabled. A token that verified recently is answered from memory without touching the database
+    """
+    config = request.state.config
+    if not config.auth_enabled:
+        return None
+    token_id = None
+    if credentials is not None:
+        token_id = token_cache.get(token_digest(credentials.credentials))
+        if token_id is None:
+            async with sessionmanager.session() as db_session:
+                token_id = await TokenService(config, request.state.logger, db_session).verify(credentials.credentials)
+    if token_id is None:
+        raise HTTPException(
+            status_code=HTTPStatus.UNAUTHORIZED,
+            detail="A valid api token is required",
+            headers={"WWW-Authenticate": "Bearer"},
+        )
+    return token_id
@@ -0,0 +1,62 @@
+import hashlib
+from datetime import UTC, datetime
+from email.utils import format_datetime, parsedate_to_datetime
+
+from starlette.datastructures import Headers
+
+from barcode_api.models.albums import CacheTable
+
+
+def etag(body: bytes) -> str:
+    """
+    A strong ETag for an encoded response body. It is a hash of the body rather than of the row's last_update, which
+    sqlite only stores to the second, so a row rewritten twice in a second still gets a new ETag
+    """
+    return f'"{hashlib.sha256(body).hexdigest()[:32]}"'
+
+
+def last_modified(row: CacheTable) -> datetime:
+    # last_update is stored as a naive UTC timestamp
+    return row.last_update.replace(tzinfo=UTC)
+
+
+def cache_control(max_age: int) -> str:
+    return f"max-age={max_age}" if max_age > 0 else "no-cache"
+
+
+def validator_headers(row: CacheTable, tag: str, max_age: int) -> dict[str, str]:
+    """ETag, Last-Modified and Cache-Control headers for a response built from row, tag is the response's etag()"""
+    return {
+        "ETag": tag,
+        "Last-Modified": format_datetime(last_modified(row), usegmt=True),
+        "Cache-Control": cache_control(max_age),
+    }
+
+
+def _strip_weak(tag: str) -> str:
+    return tag.removeprefix("W/")
+
+
+def is_not_modified(request_headers: Headers, row: CacheTable, tag: str) -> bool:
+    """
+    True if the client's copy of row, whose response has the ETag tag, is current and it can be answered with a 304
+
+    If-None-Match is compared with a weak comparison and, when present, If-Modified-Since is ignored (RFC 9110
+    13.1.3).
+    """
+    if_none_match = request_headers.get("if-none-match")
+    if if_none_match is not None:
+        tags = {_strip_weak(tag.strip()) for tag in if_none_match.split(",")}
+        return "*" in tags or tag in tags
+
+    if_modified_since = request_headers.get("if-modified-since")
+    if if_modified_since is None:
+        return False
+    try:
+        since = parsedate_to_datetime(if_modified_since)
+    except (TypeError, ValueError):
+        return False
+    if since.tzinfo is None:
+        since = since.replace(tzinfo=UTC)
+    # http dates have a one second resolution
+    return last_modified(row).replace(microsecond=0) <= since
@@ -0,0 +1,60 @@
+from contextlib import asynccontextmanager
+from typing import Any
+
+from fastapi import FastAPI
+from httpx import URL, AsyncClient, Limits, Timeout
+
+from barcode_api.core.config import Config, get_config
+
+
+class HttpClientManager:
+    """
+    Owns the app-lifetime httpx clients used to talk to upstream apis
+
+    One AsyncClient is kept per upstream host so connection limits apply per host and keep-alive connections
+    (and their TLS sessions) are reused across requests instead of being set up for every call.
+    """
+
+    def __init__(self, client_kwargs: dict[str, Any] | None = None):
+        self.client_kwargs: dict[str, Any] = client_kwargs if client_kwargs is not None else dict()
+        self._clients: dict[str, AsyncClient] = dict()
+
+    def get_client(self, url: str | URL) -> AsyncClient:
+        """Returns the shared client for the host of url, creating it on first use"""
+        host = URL(url).host
+        client = self._clients.get(host)
+        if client is None or client.is_closed:
+            client = AsyncClient(**self.client_kwargs)
+            self._clients[host] = client
+        return client
+
+    async def close(self):
+        clients = list(self._clients.values())
+        self._clients.clear()
+        for client in clients:
+            await client.aclose()
+
+
+def client_kwargs_from_config(config: Config) -> dict[str, Any]:
+    return {
+        "http2": config.http2,
+        "limits": Limits(
+            max_connections=config.http_max_connections_per_host,
+            max_keepalive_connections=config.http_max_keepalive_connections_per_host,
+            keepalive_expiry=config.http_keepalive_expiry,
+        ),
+        "timeout": Timeout(config.http_timeout, connect=config.http_connect_timeout),
+    }
+
+
+config: Config = get_config()
+httpclientmanager = HttpClientManager(client_kwargs_from_config(config))
+
+
+@asynccontextmanager
+async def http_client_lifespan(app: FastAPI):
+    """
+    Closes the shared upstream http clients on shutdown
+    """
+    yield
+    await httpclientmanager.close()
@@ -0,0 +1,238 @@
+import bisect
+import time
+from abc import ABC, abstractmethod
+from collections.abc import Callable, Iterable, Mapping
+from typing import Any, ClassVar, TypeVar
+
+from sqlalchemy import Engine, event
+
+# latency buckets in seconds, from a warm cache hit up to a slow, retried upstream lookup
+DEFAULT_BUCKETS = (0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0)
+
+Labels = tuple[tuple[str, str], ...]
+
+
+def _escape(value: str) -> str:
+    return value.replace("\\", "\\\\").replace('"', '\\"').replace("\n", "\\n")
+
+
+def _format_sample(name: str, labels: Labels, value: float) -> str:
+    if labels:
+        label_text = ",".join(f'{label}="{_escape(label_value)}"' for label, label_value in labels)
+        name = f"{name}{{{label_text}}}"
+    return f"{name} {value!r}"
+
+
+class Metric(ABC):
+    """
+    A named metric in the Prometheus text exposition format
+
+    Samples are kept per combination of labelnames values, passed as keyword arguments when updating the metric.
+    """
+
+    TYPE: ClassVar[str]
+
+    def __init__(self, name: str, documentation: str, labelnames: Iterable[str] = ()):
+        self.name = name
+        self.documentation = documentation
+        self.labelnames = tuple(labelnames)
+
+    def _labels(self, labels: Mapping[str, Any]) -> Labels:
+        if set(labels) != set(self.labelnames):
+            err_msg = f"{self.name} expects labels {self.labelnames}, got {tuple(labels)}"
+            raise ValueError(err_msg)
+        return tuple((label, str(labels[label])) for label in self.labelnames)
+
+    @abstractmethod
+    def samples(self) -> Iterable[tuple[str, Labels, float]]:
+        """(name, labels, value) of every sample, name is the metric name plus any suffix like _bucket"""
+
+    def render(self) -> str:
+        lines = [f"# HELP {self.name} {self.documentation}", f"# TYPE {self.name} {self.TYPE}"]
+        lines.extend(_format_sample(name, labels, value) for name, labels, value in self.samples())
+        return "\n".join(lines)
+
+
+class Counter(Metric):
+    TYPE = "counter"
+
+    def __init__(self, name: str, documentation: str, labelnames: Iterable[str] = ()):
+        super().__init__(name, documentation, labelnames)
+        self._values: dict[Labels, float] = dict()
+
+    def inc(self, amount: float = 1.0, **labels: Any) -> None:
+        key = self._labels(labels)
+        self._values[key] = self._values.get(key, 0.0) + amount
+
+    def samples(self) -> Iterable[tuple[str, Labels, float]]:
+        for labels, value in self._values.items():
+            yield self.name, labels, value
+
+
+class Gauge(Counter):
+    TYPE = "gauge"
+
+    def set(self, value: float, **labels: Any) -> None:
+        self._values[self._labels(labels)] = value
+
+    def dec(self, amount: float = 1.0, **labels: Any) -> None:
+        self.inc(-amount, **labels)
+
+
+class Histogram(Metric):
+    TYPE = "histogram"
+
+    def __init__(
+        self, name: str, documentation: str, labelnames: Iterable[str] = (), buckets: Iterable[float] = DEFAULT_BUCKETS
+    ):
+        super().__init__(name, documentation, labelnames)
+        self.buckets = tuple(sorted(buckets))
+        # labels -> (count per bucket with a final +Inf bucket, sum of observations)
+        self._values: dict[Labels, tuple[list[int], float]] = dict()
+
+    def observe(self, value: float, **labels: Any) -> None:
+        key = self._labels(labels)
+        counts, total = self._values.get(key) or ([0] * (len(self.buckets) + 1), 0.0)
+        counts[bisect.bisect_left(self.buckets, value)] += 1
+        self._values[key] = (counts, total + value)
+
+    def samples(self) -> Iterable[tuple[str, Labels, float]]:
+        for labels, (counts, total) in self._values.items():
+            cumulative = 0
+            for bound, count in zip((*self.buckets, float("inf")), counts, strict=True):
+                cumulative += count
+                le = "+Inf" if bound == float("inf") else repr(bound)
+                yield f"{self.name}_bucket", (*labels, ("le", le)), cumulative
+            yield f"{self.name}_sum", labels, total
+            yield f"{self.name}_count", labels, cumulative
+
+
+class StatsCollector:
+    """
+    Exposes the stats() dicts of existing objects, like the l1 cache or the upstream schedulers, as metrics
+
+    sources maps a value of the label to a stats function. Each stats key becomes a {prefix}_{key} metric, a counter
+    if the key is in counters and a gauge otherwise. Values are read when the metrics are rendered.
+    """
+
+    def __init__(
+        self,
+        prefix: str,
+        documentation: str,
+        label: str,
+        sources: Mapping[str, Callable[[], Mapping[str, float]]],
+        counters: Iterable[str] = (),
+    ):
+        self.prefix = prefix
+        self.documentation = documentation
+        self.label = label
+        self.sources = sources
+        self.counters = set(counters)
+
+    def render(self) -> str:
+        # stats key -> (metric type, samples)
+        metrics: dict[str, tuple[str, list[tuple[str, Labels, float]]]] = dict()
+        for source, stats in self.sources.items():
+            for key, value in stats().items():
+                name = f"{self.prefix}_{key}"
+                metric_type = "gauge"
+                if key in self.counters:
+                    metric_type = "counter"
+                    name = name if name.endswith("_total") else f"{name}_total"
+                metrics.setdefault(key, (metric_type, []))[1].append((name, ((self.label, source),), value))
+
+        lines = []
+        for key, (metric_type, samples) in metrics.items():
+            name = samples[0][0]
+            lines.extend((f"# HELP {name} {self.documentation}, {key}", f"# TYPE {name} {metric_type}"))
+            lines.extend(_format_sample(*sample) for sample in samples)
+        return "\n".join(lines)
+
+
+MetricType = TypeVar("MetricType", Metric, StatsCollector)
+
+
+class MetricsRegistry:
+    def __init__(self) -> None:
+        self._metrics: dict[str, Metric | StatsCollector] = dict()
+
+    def register(self, metric: MetricType) -> MetricType:
+        name = metric.name if isinstance(metric, Metric) else metric.prefix
+        if name in self._metrics:
+            err_msg = f"A metric named {name} is already registered"
+            raise ValueError(err_msg)
+        self._metrics[name] = metric
+        return metric
+
+    def render(self) -> str:
+        return "\n".join(metric.render() for metric in self._metrics.values()) + "\n"
+
+
+def instrument_engine(engine: Engine) -> None:
+    """Records query time and connection pool checkouts for engine. Pass the sync_engine of an async engine"""
+
+    @event.listens_for(engine, "before_cursor_execute", named=True)
+    def before_cursor_execute(conn, **kwargs) -> None:
+        conn.info.setdefault("query_start_time", []).append(time.perf_counter())
+
+    @event.listens_for(engine, "after_cursor_execute", named=True)
+    def after_cursor_execute(conn, statement, **kwargs) -> None:
+        elapsed = time.perf_counter() - conn.info["query_start_time"].pop()
+        db_query_duration.observe(elapsed, operation=statement.split(maxsplit=1)[0].upper())
+
+    @event.listens_for(engine, "handle_error")
+    def handle_error(context) -> None:
+        # after_cursor_execute isn't called for a failed statement
+        if context.connection is not None and context.connection.info.get("query_start_time"):
+            context.connection.info["query_start_time"].pop()
+        db_query_errors.inc()
+
+    @event.listens_for(engine, "checkout")
+    def checkout(dbapi_connection, connection_record, connection_proxy) -> None:
+        db_pool_checkouts.inc()
+
+    @event.listens_for(engine, "connect")
+    def connect(dbapi_connection, connection_record) -> None:
+        db_pool_connections.inc()
+
+
+registry = MetricsRegistry()
+
+http_request_duration = registry.register(
+    Histogram(
+        "barcode_api_http_request_duration_seconds",
+        "Time to respond to a request, by route and status code",
+        ("method", "route", "status"),
+    )
+)
+upstream_request_duration = registry.register(
+    Histogram(
+        "barcode_api_upstream_request_duration_seconds",
+        "Time for a single upstream http request, not including time queued by the rate limiter",
+        ("upstream",),
+    )
+)
+upstream_errors = registry.register(
+    Counter(
+        "barcode_api_upstream_errors_total",
+        "Upstream http requests that failed, by http status or the exception raised",
+        ("upstream", "reason"),
+    )
+)
+album_cache_lookups = registry.register(
+    Counter(
+        "barcode_api_album_cache_lookups_total",
+        "Album searches answered from the cache (hit) or that needed an upstream lookup (miss)",
+        ("result",),
+    )
+)
+db_query_duration = registry.register(
+    Histogram("barcode_api_db_query_duration_seconds", "Time to execute a database statement", ("operation",))
+)
+db_query_errors = registry.register(Counter("barcode_api_db_query_errors_total", "Database statements that failed"))
+db_pool_checkouts = registry.register(
+    Counter("barcode_api_db_pool_checkouts_total", "Connections checked out of the database pool")
+)
+db_pool_connections = registry.register(
+    Counter("barcode_api_db_pool_connections_total", "New database connections opened by the pool")
+)
@@ -1,23 +1,20 @@
-from collections.abc import Callable
-
-from starlette.middleware.base import BaseHTTPMiddleware
-from starlette.requests import Request
-from starlette.responses import Response
+from starlette.types import ASGIApp, Receive, Scope, Send
 
 from barcode_api.core.config import Config, get_config
 
 
-class ConfigMiddleware(BaseHTTPMiddleware):
+class ConfigMiddleware:
     """
     Adds an app config object to the request state
 
     """
 
-    def __init__(self, app, config: Config | None = None):
-        super().__init__(app)
+    def __init__(self, app: ASGIApp, config: Config | None = None):
+        self.app = app
         self.config = config if config is not None else get_config()
 
-    async def dispatch(self, request: Request, call_next: Callable) -> Response:
-        request.state.config = self.config
-        response: Response = await call_next(request)
-        return response
+    async def __call__(self, scope: Scope, receive: Receive, send: Send) -> None:
+        if scope["type"] in {"http", "websocket"}:
+            # request.state is backed by scope["state"]
+            scope.setdefault("state", {})["config"] = self.config
+        await self.app(scope, receive, send)
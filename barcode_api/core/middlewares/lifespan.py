@@ -0,0 +1,32 @@
+from contextlib import AsyncExitStack, asynccontextmanager
+
+from fastapi import FastAPI
+
+from barcode_api.core.background import background_lifespan
+from barcode_api.core.database import database_lifespan
+from barcode_api.core.http_client import http_client_lifespan
+from barcode_api.services._base import write_behind_lifespan
+from barcode_api.services.job_service import lookup_jobs_lifespan
+from barcode_api.services.token_service import token_auth_lifespan
+
+# Lifespans are entered in order and exited in reverse order, the write behind buffer is flushed after everything
+# that writes to it has stopped and before the database is closed
+LIFESPANS = [
+    database_lifespan,
+    write_behind_lifespan,
+    http_client_lifespan,
+    background_lifespan,
+    lookup_jobs_lifespan,
+    token_auth_lifespan,
+]
+
+
+@asynccontextmanager
+async def app_lifespan(app: FastAPI):
+    """
+    Combines all of the app's lifespan handlers into the single lifespan FastAPI accepts
+    """
+    async with AsyncExitStack() as stack:
+        for lifespan in LIFESPANS:
+            await stack.enter_async_context(lifespan(app))
+        yield
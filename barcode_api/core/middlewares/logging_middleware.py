@@ -1,61 +1,85 @@
 # This code is modified from https://gist.github.com/nymous/f138c7f06062b7c43c060bf03759c29e
 
 import time
-from collections.abc import Callable
 
 import structlog
 from asgi_correlation_id import correlation_id
-from starlette.middleware.base import BaseHTTPMiddleware
-from starlette.requests import Request
-from starlette.responses import Response
+from starlette.datastructures import URL, MutableHeaders
+from starlette.types import ASGIApp, Message, Receive, Scope, Send
 from uvicorn.protocols.utils import get_path_with_query_string
 
 from barcode_api.core.logging import configure_logger
+from barcode_api.core.timing import request_timings, server_timing_header
 
 
-class CustomLoggingMiddleware(BaseHTTPMiddleware):
+class CustomLoggingMiddleware:
     """
     Adds an access log using the struclog formatted loggers
 
     Adds the app logger to each request's state so controllers can access it
+
+    Time spent in each phase of the request (see barcode_api.core.timing) is sent in a Server-Timing header and
+    added to the access log
     """
 
-    def __init__(self, app, enable_json_logs: bool = False, log_level: str = "INFO"):
-        super().__init__(app)
+    def __init__(self, app: ASGIApp, enable_json_logs: bool = False, log_level: str = "INFO"):
+        self.app = app
         configure_logger(enable_json_logs=enable_json_logs, log_level=log_level)
         self.access_logger = structlog.stdlib.get_logger("api.access")
         self.api_error_logger = structlog.stdlib.get_logger("api.error")
         self.app_logger = structlog.stdlib.get_logger("app")
 
-    async def dispatch(self, request: Request, call_next: Callable) -> Response:
-        request.state.logger = self.app_logger
-        request.state.error_logger = self.api_error_logger
+    async def __call__(self, scope: Scope, receive: Receive, send: Send) -> None:
+        if scope["type"] != "http":
+            await self.app(scope, receive, send)
+            return
+
+        state = scope.setdefault("state", {})
+        state["logger"] = self.app_logger
+        state["error_logger"] = self.api_error_logger
         structlog.contextvars.clear_contextvars()
         # These context vars will be added to all log entries emitted during the request
         request_id = correlation_id.get()
         structlog.contextvars.bind_contextvars(request_id=request_id)
+        timings: dict[str, float] = dict()
+        timings_token = request_timings.set(timings)
 
         start_time = time.perf_counter_ns()
+        # if the app raises before starting a response, the server will answer with a 500
+        status_code = 500
+        process_time: int | None = None
+
+        async def send_with_process_time(message: Message) -> None:
+            nonlocal status_code, process_time
+            if message["type"] == "http.response.start":
+                status_code = message["status"]
+                process_time = time.perf_counter_ns() - start_time
+                headers = MutableHeaders(scope=message)
+                headers.append("X-Process-Time", str(process_time / 10**9))
+                headers.append("Server-Timing", server_timing_header(timings, total=process_time / 10**9))
+            await send(message)
 
-        response: Response = await call_next(request)
-        process_time = time.perf_counter_ns() - start_time
-        status_code = response.status_code
-        url = get_path_with_query_string(request.scope)
-        client_host = request.client.host
-        http_method = request.method
-        http_version = request.scope["http_version"]
-        # Recreate the Uvicorn access log format, but add all parameters as structured information
-        self.access_logger.info(
-            f"""{client_host} - "{http_method} {url} HTTP/{http_version}" {status_code}""",
-            http={
-                "url": str(request.url),
-                "status_code": status_code,
-                "method": http_method,
-                "request_id": request_id,
-                "version": http_version,
-            },
-            network={"ip": client_host},
-            duration=process_time,
-        )
-        response.headers["X-Process-Time"] = str(process_time / 10**9)
-        return response
+        try:
+            await self.app(scope, receive, send_with_process_time)
+        finally:
+            request_timings.reset(timings_token)
+            if process_time is None:
+                process_time = time.perf_counter_ns() - start_time
+            url = get_path_with_query_string(scope)
+            client_host = scope["client"][0] if scope.get("client") else None
+            http_method = scope["method"]
+            http_version = scope["http_version"]
+            # Recreate the Uvicorn access log format, but add all parameters as structured information
+            self.access_logger.info(
+                f"""{client_host} - "{http_method} {url} HTTP/{http_version}" {status_code}""",
+                http={
+                    "url": str(URL(scope=scope)),
+                    "status_code": status_code,
+                    "method": http_method,
+                    "request_id": request_id,
+                    "version": http_version,
+                },
+                network={"ip": client_host},
+                duration=process_time,
+                timings={phase: round(seconds * 1000, 3) for phase, seconds in timings.items()},
+            )
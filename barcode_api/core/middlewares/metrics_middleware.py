@@ -0,0 +1,45 @@
+import time
+
+from starlette.types import ASGIApp, Message, Receive, Scope, Send
+
+from barcode_api.core.metrics import Histogram, http_request_duration
+
+
+class MetricsMiddleware:
+    """
+    Records each request's latency in a histogram labelled by method, route and status code
+
+    The route is the path template the request matched (/album/search, not the requested url) so label cardinality
+    stays bounded. Requests that don't match a route are recorded as "unmatched".
+    """
+
+    def __init__(self, app: ASGIApp, histogram: Histogram | None = None):
+        self.app = app
+        self.histogram = histogram if histogram is not None else http_request_duration
+
+    async def __call__(self, scope: Scope, receive: Receive, send: Send) -> None:
+        if scope["type"] != "http":
+            await self.app(scope, receive, send)
+            return
+
+        start_time = time.perf_counter()
+        # if the app raises before starting a response, the server will answer with a 500
+        status_code = 500
+
+        async def send_with_status(message: Message) -> None:
+            nonlocal status_code
+            if message["type"] == "http.response.start":
+                status_code = message["status"]
+            await send(message)
+
+        try:
+            await self.app(scope, receive, send_with_status)
+        finally:
+            # the router sets the matched route on the scope
+            route = scope.get("route")
+            self.histogram.observe(
+                time.perf_counter() - start_time,
+                method=scope["method"],
+                route=getattr(route, "path", "unmatched"),
+                status=status_code,
+            )
@@ -0,0 +1,242 @@
+import asyncio
+import heapq
+import itertools
+import time
+from collections.abc import Awaitable, Callable
+from contextvars import ContextVar
+from email.utils import parsedate_to_datetime
+from enum import IntEnum
+from http import HTTPStatus
+
+from httpx import Response
+
+from barcode_api.core.config import Config, get_config
+from barcode_api.core.errors import BarcodeAPIBaseException
+from barcode_api.core.metrics import StatsCollector, registry
+
+
+class Priority(IntEnum):
+    """Lower values are scheduled first"""
+
+    INTERACTIVE = 0
+    BACKGROUND = 10
+
+
+# The priority upstream calls made in the current context are queued with.
+# Background work (cache refreshes, warm ups, job workers) sets this to Priority.BACKGROUND
+upstream_priority: ContextVar[Priority] = ContextVar("upstream_priority", default=Priority.INTERACTIVE)
+
+
+def parse_retry_after(value: str | None, default: float) -> float:
+    """Parses a Retry-After header, which is either a number of seconds or an http date"""
+    if value is None:
+        return default
+    try:
+        return max(float(value), 0.0)
+    except ValueError:
+        pass
+    try:
+        return max(parsedate_to_datetime(value).timestamp() - time.time(), 0.0)
+    except (TypeError, ValueError):
+        return default
+
+
+class UpstreamScheduler:
+    """
+    Token bucket rate limiter for all calls to one upstream provider
+
+    Callers queue for a token by priority, then by arrival. The bucket refills at requests_per_minute and holds at
+    most burst tokens. Responses are fed back through observe so the bucket follows the provider's own view of our
+    budget: remaining/limit headers shrink the bucket or change its rate and a 429 pauses the provider for its
+    Retry-After. Background callers wait out any pause, other callers wait at most max_pause_wait seconds for one
+    (or their own max_wait if that is shorter) and get a PausedError otherwise.
+    """
+
+    class PausedError(BarcodeAPIBaseException):
+        """The provider is paused for longer than the caller may wait, retry_after is when it should be back"""
+
+        def __init__(self, message: str, retry_after: float) -> None:
+            super().__init__(message)
+            self.retry_after = retry_after
+
+    def __init__(  # noqa: PLR0913
+        self,
+        name: str,
+        requests_per_minute: float,
+        burst: int,
+        *,
+        max_retries: int = 2,
+        default_retry_after: float = 5.0,
+        max_pause_wait: float = 2.0,
+        limit_header: str | None = None,
+        remaining_header: str | None = None,
+    ):
+        self.name = name
+        self.rate = requests_per_minute / 60
+        self.burst = burst
+        self.max_retries = max_retries
+        self.default_retry_after = default_retry_after
+        self.max_pause_wait = max_pause_wait
+        self.limit_header = limit_header
+        self.remaining_header = remaining_header
+
+        self._tokens: float = burst
+        self._updated = time.monotonic()
+        self._paused_until = 0.0
+        # (priority, arrival, waiter, latest time the waiter may be served at)
+        self._queue: list[tuple[int, int, asyncio.Future, float]] = []
+        self._sequence = itertools.count()
+        self._dispatcher: asyncio.Task | None = None
+
+        self.requests = 0
+        self.rate_limited = 0
+        self.total_wait = 0.0
+        self.max_wait = 0.0
+
+    @property
+    def queue_depth(self) -> int:
+        return sum(1 for _, _, future, _ in self._queue if not future.done())
+
+    @property
+    def retry_after(self) -> float:
+        """Seconds until the provider is expected to accept requests again"""
+        return max(self._paused_until - time.monotonic(), 0.0)
+
+    async def acquire(self, priority: Priority | None = None, max_wait: float | None = None) -> None:
+        """
+        Waits for a token, callers with a lower priority value are served first. Raises PausedError if the provider
+        is paused for longer than the caller may wait, see the class docs
+        """
+        priority = priority if priority is not None else upstream_priority.get()
+        queued_at = time.monotonic()
+        if priority >= Priority.BACKGROUND:
+            serve_by = float("inf")
+        else:
+            serve_by = queued_at + min(self.max_pause_wait, max_wait if max_wait is not None else float("inf"))
+        if self._paused_until > serve_by:
+            raise self._paused_error()
+        future = asyncio.get_running_loop().create_future()
+        heapq.heappush(self._queue, (priority, next(self._sequence), future, serve_by))
+        if self._dispatcher is None or self._dispatcher.done():
+            self._dispatcher = asyncio.create_task(self._dispatch())
+        await future
+
+        waited = time.monotonic() - queued_at
+        self.requests += 1
+        self.total_wait += waited
+        self.max_wait = max(self.max_wait, waited)
+
+    async def request(
+        self, send: Callable[[], Awaitable[Response]], priority: Priority | None = None, max_wait: float | None = None
+    ) -> Response:
+        """
+        Sends a request once a token is available, retrying it up to max_retries times if it is rate limited.
+        The last response is returned even if it is still a 429, a retry that would wait too long for the pause
+        raises PausedError instead, see acquire
+        """
+        for _ in range(self.max_retries + 1):
+            await self.acquire(priority, max_wait)
+            response = await send()
+            self.observe(response)
+            if response.status_code != HTTPStatus.TOO_MANY_REQUESTS:
+                break
+            self.rate_limited += 1
+        return response
+
+    def observe(self, response: Response) -> None:
+        """Adjusts the bucket to the rate limit information in an upstream response"""
+        if response.status_code == HTTPStatus.TOO_MANY_REQUESTS:
+            self.pause(parse_retry_after(response.headers.get("Retry-After"), self.default_retry_after))
+        if self.limit_header is not None and (limit := response.headers.get(self.limit_header)) is not None:
+            try:
+                self.rate = max(float(limit), 1.0) / 60
+            except ValueError:
+                pass
+        if self.remaining_header is not None and (remaining := response.headers.get(self.remaining_header)) is not None:
+            try:
+                self._refill(time.monotonic())
+                self._tokens = min(self._tokens, float(remaining))
+            except ValueError:
+                pass
+
+    def pause(self, seconds: float) -> None:
+        """Stops handing out tokens for seconds, the bucket starts refilling from empty afterwards"""
+        self._paused_until = max(self._paused_until, time.monotonic() + seconds)
+        self._tokens = 0.0
+        self._updated = max(self._updated, self._paused_until)
+
+    def stats(self) -> dict[str, float]:
+        return {
+            "queue_depth": self.queue_depth,
+            "requests": self.requests,
+            "rate_limited": self.rate_limited,
+            "wait_seconds_total": self.total_wait,
+            "wait_seconds_max": self.max_wait,
+            "wait_seconds_avg": self.total_wait / self.requests if self.requests else 0.0,
+            "tokens": self._tokens,
+        }
+
+    def _paused_error(self) -> PausedError:
+        err_msg = f"{self.name} is rate limiting requests"
+        return self.PausedError(err_msg, retry_after=self.retry_after)
+
+    def _shed_impatient(self) -> None:
+        """Fails the waiters that can't wait out the current pause, and drops cancelled ones"""
+        for _, _, future, serve_by in self._queue:
+            if not future.done() and serve_by < self._paused_until:
+                future.set_exception(self._paused_error())
+        self._queue = [entry for entry in self._queue if not entry[2].done()]
+        heapq.heapify(self._queue)
+
+    def _refill(self, now: float) -> None:
+        self._tokens = min(self.burst, self._tokens + max(now - self._updated, 0.0) * self.rate)
+        self._updated = max(now, self._updated)
+
+    async def _dispatch(self) -> None:
+        while self._queue:
+            now = time.monotonic()
+            if now < self._paused_until:
+                self._shed_impatient()
+                if self._queue:
+                    await asyncio.sleep(self._paused_until - now)
+                continue
+            self._refill(now)
+            if self._tokens < 1:
+                await asyncio.sleep((1 - self._tokens) / self.rate)
+                continue
+            _, _, future, _ = heapq.heappop(self._queue)
+            # waiters that were cancelled while queued don't use a token
+            if future.done():
+                continue
+            self._tokens -= 1
+            future.set_result(None)
+
+
+config: Config = get_config()
+discogs_scheduler = UpstreamScheduler(
+    "discogs",
+    config.discogs_requests_per_minute,
+    config.discogs_burst,
+    max_retries=config.upstream_max_retries,
+    default_retry_after=config.upstream_default_retry_after,
+    max_pause_wait=config.upstream_max_pause_wait,
+    limit_header="X-Discogs-Ratelimit",
+    remaining_header="X-Discogs-Ratelimit-Remaining",
+)
+spotify_scheduler = UpstreamScheduler(
+    "spotify",
+    config.spotify_requests_per_minute,
+    config.spotify_burst,
+    max_retries=config.upstream_max_retries,
+    default_retry_after=config.upstream_default_retry_after,
+    max_pause_wait=config.upstream_max_pause_wait,
+)
+registry.register(
+    StatsCollector(
+        "barcode_api_upstream_scheduler",
+        "Upstream rate limit scheduler",
+        "upstream",
+        {scheduler.name: scheduler.stats for scheduler in (discogs_scheduler, spotify_scheduler)},
+        counters=("requests", "rate_limited", "wait_seconds_total"),
+    )
+)
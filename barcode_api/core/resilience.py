@@ -0,0 +1,238 @@
+import asyncio
+import time
+from collections import deque
+from collections.abc import Awaitable, Callable
+from enum import IntEnum
+from typing import NamedTuple, TypeVar
+
+from barcode_api.core.config import Config, get_config
+from barcode_api.core.metrics import StatsCollector, registry
+
+T = TypeVar("T")
+
+
+class LatencyTracker:
+    """The latencies of the last window_size requests to an upstream, for estimating percentiles"""
+
+    def __init__(self, window_size: int = 200):
+        self._latencies: deque[float] = deque(maxlen=window_size)
+
+    def __len__(self) -> int:
+        return len(self._latencies)
+
+    def record(self, latency: float) -> None:
+        self._latencies.append(latency)
+
+    def percentile(self, pct: float) -> float:
+        ordered = sorted(self._latencies)
+        return ordered[min(int(pct / 100 * len(ordered)), len(ordered) - 1)]
+
+
+class CircuitState(IntEnum):
+    CLOSED = 0
+    HALF_OPEN = 1
+    OPEN = 2
+
+
+class CircuitCall(NamedTuple):
+    """A call allowed by a CircuitBreaker, handed back with its outcome"""
+
+    # the breaker's epoch when the call was allowed, it changes every time the circuit opens or closes
+    epoch: int
+    trial: bool
+
+
+class CircuitBreaker:
+    """
+    Fails calls to an upstream fast while it is erroring, instead of every caller waiting out its deadline
+
+    The circuit opens when at least min_requests calls were made in the last window seconds and error_rate of them
+    failed. While open every call is rejected. After reset_timeout seconds a single trial call is let through, if it
+    succeeds the circuit closes, if it fails it opens for another reset_timeout. Outcomes of calls that were allowed
+    before the circuit last opened or closed are ignored, only the trial decides whether an open circuit closes.
+    """
+
+    def __init__(self, name: str, *, error_rate: float, min_requests: int, window: float, reset_timeout: float):
+        self.name = name
+        self.error_rate = error_rate
+        self.min_requests = min_requests
+        self.window = window
+        self.reset_timeout = reset_timeout
+
+        self.state = CircuitState.CLOSED
+        self._epoch = 0
+        self._opened_at = 0.0
+        self._trial_in_flight = False
+        # (time, succeeded) of recent calls
+        self._outcomes: deque[tuple[float, bool]] = deque()
+
+        self.opened = 0
+        self.rejected = 0
+
+    @property
+    def retry_after(self) -> float:
+        """Seconds until the next trial call is allowed, 0 if calls are allowed now"""
+        if self.state != CircuitState.OPEN:
+            return 0.0
+        return max(self._opened_at + self.reset_timeout - time.monotonic(), 0.0)
+
+    def allow(self) -> CircuitCall | None:
+        """
+        Returns a CircuitCall if a call may be made now, None if not. A call that is allowed must be followed by
+        record_success, record_failure or release with the CircuitCall
+        """
+        if self.state == CircuitState.OPEN and self.retry_after <= 0:
+            self.state = CircuitState.HALF_OPEN
+        if self.state == CircuitState.CLOSED:
+            return CircuitCall(self._epoch, trial=False)
+        if self.state == CircuitState.HALF_OPEN and not self._trial_in_flight:
+            self._trial_in_flight = True
+            return CircuitCall(self._epoch, trial=True)
+        self.rejected += 1
+        return None
+
+    def record_success(self, call: CircuitCall) -> None:
+        if self._is_trial(call):
+            self._close()
+        elif self._is_current(call):
+            self._record(succeeded=True)
+
+    def record_failure(self, call: CircuitCall) -> None:
+        if self._is_trial(call):
+            self._open()
+            return
+        if not self._is_current(call):
+            return
+        self._record(succeeded=False)
+        failures = sum(1 for _, succeeded in self._outcomes if not succeeded)
+        if len(self._outcomes) >= self.min_requests and failures / len(self._outcomes) >= self.error_rate:
+            self._open()
+
+    def release(self, call: CircuitCall) -> None:
+        """Gives back an allowed call that ended without an outcome, e.g. because it was cancelled"""
+        if self._is_trial(call):
+            self._trial_in_flight = False
+
+    def _is_trial(self, call: CircuitCall) -> bool:
+        return call.trial and call.epoch == self._epoch and self.state == CircuitState.HALF_OPEN
+
+    def _is_current(self, call: CircuitCall) -> bool:
+        """True for a call made while the circuit has been closed, since it last closed"""
+        return not call.trial and call.epoch == self._epoch and self.state == CircuitState.CLOSED
+
+    def _record(self, succeeded: bool) -> None:
+        now = time.monotonic()
+        self._outcomes.append((now, succeeded))
+        while self._outcomes and self._outcomes[0][0] < now - self.window:
+            self._outcomes.popleft()
+
+    def _open(self) -> None:
+        self.state = CircuitState.OPEN
+        self._epoch += 1
+        self._opened_at = time.monotonic()
+        self._trial_in_flight = False
+        self.opened += 1
+
+    def _close(self) -> None:
+        self.state = CircuitState.CLOSED
+        self._epoch += 1
+        self._trial_in_flight = False
+        self._outcomes.clear()
+
+    def stats(self) -> dict[str, float]:
+        return {"state": int(self.state), "opened": self.opened, "rejected": self.rejected}
+
+
+class UpstreamPolicy:
+    """
+    How calls to one upstream provider are bounded: a deadline on every request, an optional hedged second request
+    when the first is slower than hedge_percentile of recent requests, and a circuit breaker
+    """
+
+    def __init__(  # noqa: PLR0913
+        self,
+        name: str,
+        deadline: float,
+        breaker: CircuitBreaker,
+        *,
+        hedge_percentile: float = 0.0,
+        hedge_min_samples: int = 20,
+        latencies: LatencyTracker | None = None,
+    ):
+        self.name = name
+        self.deadline = deadline
+        self.breaker = breaker
+        self.hedge_percentile = hedge_percentile
+        self.hedge_min_samples = hedge_min_samples
+        self.latencies = latencies if latencies is not None else LatencyTracker()
+        self.hedges = 0
+
+    def hedge_delay(self) -> float | None:
+        """Seconds to wait for a request before hedging it, None if it shouldn't be hedged"""
+        if self.hedge_percentile <= 0 or len(self.latencies) < self.hedge_min_samples:
+            return None
+        return self.latencies.percentile(self.hedge_percentile)
+
+    def stats(self) -> dict[str, float]:
+        return {**self.breaker.stats(), "hedges": self.hedges}
+
+
+async def hedged(
+    call: Callable[[], Awaitable[T]], delay: float | None, hedge: Callable[[], Awaitable[T]] | None = None
+) -> T:
+    """
+    Awaits call, and if it hasn't finished after delay seconds, races it against hedge (call again by default)
+
+    The first of them to succeed wins and the other is cancelled. If both fail the first failure is raised.
+    """
+    if delay is None:
+        return await call()
+    first = asyncio.ensure_future(call())
+    pending = {first}
+    try:
+        done, pending = await asyncio.wait(pending, timeout=delay)
+        if done:
+            return first.result()
+        second = asyncio.ensure_future((hedge or call)())
+        pending = {first, second}
+        failures = []
+        while pending:
+            done, pending = await asyncio.wait(pending, return_when=asyncio.FIRST_COMPLETED)
+            for task in done:
+                if task.exception() is None:
+                    return task.result()
+                failures.append(task.exception())
+        raise failures[0]
+    finally:
+        for task in pending:
+            task.cancel()
+
+
+def policy_from_config(name: str, config: Config) -> UpstreamPolicy:
+    return UpstreamPolicy(
+        name,
+        getattr(config, f"{name}_deadline"),
+        CircuitBreaker(
+            name,
+            error_rate=config.breaker_error_rate,
+            min_requests=config.breaker_min_requests,
+            window=config.breaker_window,
+            reset_timeout=config.breaker_reset_timeout,
+        ),
+        hedge_percentile=getattr(config, f"{name}_hedge_percentile"),
+        hedge_min_samples=config.hedge_min_samples,
+    )
+
+
+config: Config = get_config()
+discogs_policy = policy_from_config("discogs", config)
+spotify_policy = policy_from_config("spotify", config)
+registry.register(
+    StatsCollector(
+        "barcode_api_upstream_circuit",
+        "Upstream circuit breaker and hedging, state is 0 closed, 1 half open, 2 open",
+        "upstream",
+        {policy.name: policy.stats for policy in (discogs_policy, spotify_policy)},
+        counters=("opened", "rejected", "hedges"),
+    )
+)
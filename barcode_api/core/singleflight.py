@@ -0,0 +1,59 @@
+import asyncio
+from collections.abc import Awaitable, Callable, Hashable
+from typing import TypeVar
+
+T = TypeVar("T")
+
+
+class _LeaderCancelledError(Exception):
+    pass
+
+
+class SingleFlight:
+    """
+    Deduplicates concurrent calls for the same key
+
+    The first caller for a key runs the work; anyone calling with the same key while it is running awaits that
+    result (or exception) instead of doing the work again. If the first caller is cancelled, one of the waiting
+    callers takes over and runs the work itself.
+    """
+
+    def __init__(self) -> None:
+        self._calls: dict[Hashable, asyncio.Future] = dict()
+
+    def __len__(self) -> int:
+        return len(self._calls)
+
+    async def do(self, key: Hashable, fn: Callable[[], Awaitable[T]]) -> T:
+        while (future := self._calls.get(key)) is not None:
+            try:
+                # shield so a cancelled waiter doesn't cancel the shared result for everyone else
+                return await asyncio.shield(future)
+            except _LeaderCancelledError:
+                continue
+
+        future = asyncio.get_running_loop().create_future()
+        self._calls[key] = future
+        try:
+            result = await fn()
+        except asyncio.CancelledError:
+            self._finish(future, exception=_LeaderCancelledError())
+            raise
+        except Exception as exc:
+            self._finish(future, exception=exc)
+            raise
+        else:
+            self._finish(future, result=result)
+            return result
+        finally:
+            if self._calls.get(key) is future:
+                del self._calls[key]
+
+    @staticmethod
+    def _finish(future: asyncio.Future, result=None, exception: BaseException | None = None) -> None:
+        if exception is None:
+            future.set_result(result)
+            return
+        future.set_exception(exception)
+        # there may be no waiters, mark the exception as retrieved so asyncio doesn't log it as lost
+        future.exception()
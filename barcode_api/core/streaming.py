@@ -0,0 +1,116 @@
+import asyncio
+from collections.abc import AsyncIterable, AsyncIterator
+
+import anyio
+from starlette.responses import StreamingResponse
+from starlette.types import Receive, Scope, Send
+
+
+class TooLongLine(str):
+    """The start of a line read_lines found to be longer than its max_line_length, followed by an ellipsis"""
+
+    __slots__ = ()
+
+
+class _LineBuffer:
+    """
+    The line read_lines is in the middle of, stripped of leading whitespace as it arrives and holding at most
+    max_length + 1 bytes of it
+    """
+
+    def __init__(self, max_length: int) -> None:
+        self.max_length = max_length
+        self._data = bytearray()
+        # past max_length, only whitespace has been seen so far, any more content makes the line too long
+        self._full = False
+        self._too_long = False
+
+    def add(self, part: bytes) -> None:
+        if self._too_long:
+            return
+        if not self._data:
+            part = part.lstrip()
+        if self._full:
+            self._too_long = len(part.strip()) > 0
+            return
+        self._data += part
+        if len(self._data) > self.max_length:
+            self._too_long = len(self._data.rstrip()) > self.max_length
+            self._full = True
+            del self._data[self.max_length + 1 :]
+
+    def pop(self) -> str:
+        """The stripped line, or a TooLongLine, and starts the next line"""
+        if self._too_long:
+            line = TooLongLine(self._data[: self.max_length].decode(errors="replace") + "\u2026")
+        else:
+            line = self._data.decode(errors="replace").strip()
+        self._data.clear()
+        self._full = self._too_long = False
+        return line
+
+
+async def read_lines(
+    chunks: AsyncIterable[bytes], max_line_length: int, max_batch_size: int
+) -> AsyncIterator[list[str]]:
+    """
+    Splits a stream of bytes into batches of stripped, non blank lines, a batch for every max_batch_size lines or
+    chunk of the stream, whichever is smaller
+
+    Only one line is buffered at a time. A line longer than max_line_length bytes once stripped is yielded as a
+    TooLongLine holding its start, so callers can report it without holding all of it in memory.
+    """
+    line = _LineBuffer(max_line_length)
+    async for chunk in chunks:
+        lines = []
+        *complete, rest = chunk.split(b"\n")
+        for part in complete:
+            line.add(part)
+            lines.append(line.pop())
+        line.add(rest)
+        lines = [text for text in lines if text]
+        for start in range(0, len(lines), max_batch_size):
+            yield lines[start : start + max_batch_size]
+    if last := line.pop():
+        yield [last]
+
+
+class NDJSONStreamingResponse(StreamingResponse):
+    """
+    Streams newline delimited JSON, possibly while the endpoint is still reading the request body
+
+    StreamingResponse listens for the client disconnecting by reading from receive while the body is streamed,
+    which would swallow any request body the endpoint hasn't read yet, and doesn't listen at all on asgi 2.4
+    servers. This waits for body_read to be set before listening, and always listens, so a client that goes away
+    cancels the stream (and whatever it is waiting on) instead of being noticed on the next write.
+    """
+
+    media_type = "application/x-ndjson"
+
+    def __init__(
+        self, content: AsyncIterable[bytes], body_read: asyncio.Event, status_code: int = 200, **kwargs
+    ) -> None:
+        super().__init__(content, status_code, **kwargs)
+        self.body_read = body_read
+
+    async def listen_for_disconnect(self, receive: Receive) -> None:
+        await self.body_read.wait()
+        await super().listen_for_disconnect(receive)
+
+    async def __call__(self, scope: Scope, receive: Receive, send: Send) -> None:
+        async with anyio.create_task_group() as task_group:
+
+            async def stream() -> None:
+                try:
+                    await self.stream_response(send)
+                except OSError:
+                    # asgi 2.4 servers raise on sending to a client that has gone away
+                    pass
+                task_group.cancel_scope.cancel()
+
+            task_group.start_soon(stream)
+            await self.listen_for_disconnect(receive)
+            task_group.cancel_scope.cancel()
+
+        if self.background is not None:
+            await self.background()
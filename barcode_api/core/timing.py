@@ -0,0 +1,51 @@
+import contextlib
+import functools
+import time
+from collections.abc import Awaitable, Callable, Iterator
+from contextvars import ContextVar
+from typing import ParamSpec, TypeVar
+
+P = ParamSpec("P")
+T = TypeVar("T")
+
+# phase name -> total seconds spent in it for the current request, None outside of a request
+request_timings: ContextVar[dict[str, float] | None] = ContextVar("request_timings", default=None)
+
+
+@contextlib.contextmanager
+def phase_timer(phase: str) -> Iterator[None]:
+    """
+    Adds the time spent in the block to the current request's timing for phase
+
+    A phase entered more than once in a request accumulates. Outside of a request this does nothing.
+    """
+    timings = request_timings.get()
+    if timings is None:
+        yield
+        return
+    start_time = time.perf_counter()
+    try:
+        yield
+    finally:
+        timings[phase] = timings.get(phase, 0.0) + time.perf_counter() - start_time
+
+
+def timed(phase: str) -> Callable[[Callable[P, Awaitable[T]]], Callable[P, Awaitable[T]]]:
+    """Decorates an async function so each call is timed as phase, see phase_timer"""
+
+    def decorator(fn: Callable[P, Awaitable[T]]) -> Callable[P, Awaitable[T]]:
+        @functools.wraps(fn)
+        async def wrapper(*args: P.args, **kwargs: P.kwargs) -> T:
+            with phase_timer(phase):
+                return await fn(*args, **kwargs)
+
+        return wrapper
+
+    return decorator
+
+
+def server_timing_header(timings: dict[str, float], total: float | None = None) -> str:
+    """Formats timings, in seconds, as a Server-Timing header value with durations in milliseconds"""
+    if total is not None:
+        timings = {**timings, "total": total}
+    return ", ".join(f"{phase};dur={seconds * 1000:.3f}" for phase, seconds in timings.items())
@@ -0,0 +1,100 @@
+import asyncio
+import contextlib
+from collections.abc import Awaitable, Callable, Hashable
+from typing import Generic, TypeVar
+
+import structlog
+
+T = TypeVar("T")
+
+
+class WriteBehindBuffer(Generic[T]):
+    """
+    Holds writes in memory and hands them to write in batches, so callers don't wait on the database
+
+    Items are keyed, a newer item for a key replaces one that hasn't been written yet. Pending items are written
+    every interval seconds, or as soon as max_rows are pending. If writes fall behind (the database is slow or
+    failing) and twice max_rows are pending, add waits for a flush so the buffer can't grow without bound. Items
+    that fail to write stay pending and are retried with the next flush.
+    """
+
+    def __init__(self, name: str, write: Callable[[list[T]], Awaitable[None]], interval: float, max_rows: int):
+        self.name = name
+        self.interval = interval
+        self.max_rows = max_rows
+        self._write = write
+        self._pending: dict[Hashable, T] = dict()
+        self._lock = asyncio.Lock()
+        self._flusher: asyncio.Task | None = None
+        self._timer: asyncio.Task | None = None
+        self._logger = structlog.stdlib.get_logger("app")
+        self.flushes = 0
+        self.rows_written = 0
+        self.failures = 0
+
+    def __len__(self) -> int:
+        return len(self._pending)
+
+    def get(self, key: Hashable) -> T | None:
+        """The pending item for key, if it hasn't been written yet"""
+        return self._pending.get(key)
+
+    async def add(self, key: Hashable, item: T) -> None:
+        self._pending[key] = item
+        if len(self._pending) >= 2 * self.max_rows:
+            await self.flush()
+        elif len(self._pending) >= self.max_rows and (self._flusher is None or self._flusher.done()):
+            self._flusher = asyncio.create_task(self._flush_logged())
+
+    async def flush(self) -> None:
+        """Writes everything pending in one call to write, raising if it fails"""
+        async with self._lock:
+            batch = dict(self._pending)
+            if len(batch) == 0:
+                return
+            try:
+                await self._write(list(batch.values()))
+            except Exception:
+                self.failures += 1
+                raise
+            self.flushes += 1
+            self.rows_written += len(batch)
+            for key, item in batch.items():
+                # leave anything that was replaced while it was being written for the next flush
+                if self._pending.get(key) is item:
+                    del self._pending[key]
+
+    def start(self) -> None:
+        """Starts flushing every interval seconds"""
+        if self._timer is None or self._timer.done():
+            self._timer = asyncio.create_task(self._flush_periodically())
+
+    async def close(self) -> None:
+        """Stops the periodic flush and writes anything still pending"""
+        if self._timer is not None:
+            self._timer.cancel()
+            with contextlib.suppress(asyncio.CancelledError):
+                await self._timer
+        if self._flusher is not None:
+            await self._flusher
+        self._timer = self._flusher = None
+        await self._flush_logged()
+
+    def stats(self) -> dict[str, int]:
+        return {
+            "pending": len(self._pending),
+            "flushes": self.flushes,
+            "rows_written": self.rows_written,
+            "failures": self.failures,
+        }
+
+    async def _flush_logged(self) -> None:
+        try:
+            await self.flush()
+        except Exception:
+            self._logger.exception("Write behind flush failed", buffer=self.name, pending=len(self._pending))
+
+    async def _flush_periodically(self) -> None:
+        while True:
+            await asyncio.sleep(self.interval)
+            await self._flush_logged()
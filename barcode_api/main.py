@@ -3,14 +3,16 @@ from fastapi import FastAPI
 
 from barcode_api.controller import CONTROLLERS
 from barcode_api.core.config import get_config
-from barcode_api.core.database import database_lifespan
 from barcode_api.core.middlewares.config_middleware import ConfigMiddleware
+from barcode_api.core.middlewares.lifespan import app_lifespan
 from barcode_api.core.middlewares.logging_middleware import CustomLoggingMiddleware
+from barcode_api.core.middlewares.metrics_middleware import MetricsMiddleware
 
 config = get_config()
-app = FastAPI(lifespan=database_lifespan, title=config.api_name, docs_url=config.docs_url)
+app = FastAPI(lifespan=app_lifespan, title=config.api_name, docs_url=config.docs_url)
 
 app.add_middleware(ConfigMiddleware, config=config)
+app.add_middleware(MetricsMiddleware)
 app.add_middleware(CustomLoggingMiddleware, enable_json_logs=config.log_json, log_level=config.log_level.value.upper())
 app.add_middleware(CorrelationIdMiddleware)
 
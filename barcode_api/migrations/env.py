@@ -7,6 +7,7 @@ from sqlalchemy.ext.asyncio import async_engine_from_config
 
 from barcode_api.core.config import get_config
 from barcode_api.models import Base
+from barcode_api.models.search import SEARCH_COLUMN, SEARCH_TABLE_PREFIX
 
 app_config = get_config()
 
@@ -16,12 +17,21 @@ config = context.config
 config.set_main_option("sqlalchemy_url", app_config.sqlalchemy_url)
 
 # Interpret the config file for Python logging.
-# This line sets up loggers basically.
-fileConfig(config.config_file_name)  # type: ignore
+# This line sets up loggers basically. Callers that run migrations in process, like the tests, keep their own
+if config.attributes.get("configure_logger", True):
+    fileConfig(config.config_file_name)  # type: ignore
 
 # add your model's MetaData object here
 target_metadata = Base.metadata
 
+
+def include_object(object_, name, type_, reflected, compare_to) -> bool:
+    """Leaves the full text search index, which isn't part of the models, out of autogenerate"""
+    if type_ == "table" and name.startswith(SEARCH_TABLE_PREFIX):
+        return False
+    return not (type_ == "column" and name == SEARCH_COLUMN)
+
+
 # other values from the config, defined by the needs of env.py,
 # can be acquired:
 # my_important_option = config.get_main_option("my_important_option")
@@ -44,6 +54,7 @@ def run_migrations_offline() -> None:
     context.configure(
         url=url,
         target_metadata=target_metadata,
+        include_object=include_object,
         literal_binds=True,
         dialect_opts={"paramstyle": "named"},
     )
@@ -53,7 +64,7 @@ def run_migrations_offline() -> None:
 
 
 def do_run_migrations(connection) -> None:
-    context.configure(connection=connection, target_metadata=target_metadata)
+    context.configure(connection=connection, target_metadata=target_metadata, include_object=include_object)
 
     with context.begin_transaction():
         context.run_migrations()
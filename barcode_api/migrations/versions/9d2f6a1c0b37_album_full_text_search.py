@@ -0,0 +1,75 @@
+"""Album full text search
+
+Revision ID: 9d2f6a1c0b37
+Revises: 5b0e9c2d7a41
+Create Date: 2026-10-17 22:02:51.904116
+
+"""
+
+from collections.abc import Sequence
+
+from alembic import op
+
+# revision identifiers, used by Alembic.
+revision: str = "9d2f6a1c0b37"
+down_revision: str | None = "5b0e9c2d7a41"
+branch_labels: str | Sequence[str] | None = None
+depends_on: str | Sequence[str] | None = None
+
+SQLITE_UPGRADE = (
+    "CREATE VIRTUAL TABLE albums_fts USING fts5("
+    "artist, name, content='albums', content_rowid='id', tokenize='unicode61 remove_diacritics 2')",
+    "CREATE TRIGGER albums_fts_insert AFTER INSERT ON albums BEGIN "
+    "INSERT INTO albums_fts(rowid, artist, name) VALUES (new.id, new.artist, new.name); END",
+    "CREATE TRIGGER albums_fts_delete AFTER DELETE ON albums BEGIN "
+    "INSERT INTO albums_fts(albums_fts, rowid, artist, name) VALUES ('delete', old.id, old.artist, old.name); END",
+    "CREATE TRIGGER albums_fts_update AFTER UPDATE OF artist, name ON albums BEGIN "
+    "INSERT INTO albums_fts(albums_fts, rowid, artist, name) VALUES ('delete', old.id, old.artist, old.name); "
+    "INSERT INTO albums_fts(rowid, artist, name) VALUES (new.id, new.artist, new.name); END",
+    "INSERT INTO albums_fts(albums_fts) VALUES ('rebuild')",
+)
+SQLITE_DOWNGRADE = (
+    "DROP TRIGGER albums_fts_update",
+    "DROP TRIGGER albums_fts_delete",
+    "DROP TRIGGER albums_fts_insert",
+    "DROP TABLE albums_fts",
+)
+
+POSTGRES_UPGRADE = (
+    "ALTER TABLE albums ADD COLUMN search_vector tsvector",
+    "CREATE FUNCTION albums_search_vector_update() RETURNS trigger AS $$ BEGIN "
+    "NEW.search_vector := setweight(to_tsvector('simple', coalesce(NEW.artist, '')), 'A') "
+    "|| setweight(to_tsvector('simple', coalesce(NEW.name, '')), 'B'); "
+    "RETURN NEW; END $$ LANGUAGE plpgsql",
+    "CREATE TRIGGER albums_search_vector_update BEFORE INSERT OR UPDATE OF artist, name ON albums "
+    "FOR EACH ROW EXECUTE FUNCTION albums_search_vector_update()",
+    "UPDATE albums SET artist = artist",
+    "CREATE INDEX ix_albums_search_vector ON albums USING gin (search_vector)",
+)
+POSTGRES_DOWNGRADE = (
+    "DROP INDEX ix_albums_search_vector",
+    "DROP TRIGGER albums_search_vector_update ON albums",
+    "DROP FUNCTION albums_search_vector_update()",
+    "ALTER TABLE albums DROP COLUMN search_vector",
+)
+
+
+def _execute(statements: Sequence[str]) -> None:
+    for statement in statements:
+        op.execute(statement)
+
+
+def upgrade() -> None:
+    dialect = op.get_bind().dialect.name
+    if dialect == "sqlite":
+        _execute(SQLITE_UPGRADE)
+    elif dialect == "postgresql":
+        _execute(POSTGRES_UPGRADE)
+
+
+def downgrade() -> None:
+    dialect = op.get_bind().dialect.name
+    if dialect == "sqlite":
+        _execute(SQLITE_DOWNGRADE)
+    elif dialect == "postgresql":
+        _execute(POSTGRES_DOWNGRADE)
@@ -0,0 +1,107 @@
+"""Album genres
+
+Revision ID: c4e8b1f5a902
+Revises: 9d2f6a1c0b37
+Create Date: 2026-10-17 22:31:07.552190
+
+"""
+
+import json
+from collections.abc import Sequence
+
+import sqlalchemy as sa
+from alembic import op
+
+# revision identifiers, used by Alembic.
+revision: str = "c4e8b1f5a902"
+down_revision: str | None = "9d2f6a1c0b37"
+branch_labels: str | Sequence[str] | None = None
+depends_on: str | Sequence[str] | None = None
+
+SQLITE_TRIGGERS = (
+    "CREATE TRIGGER album_genres_insert AFTER INSERT ON albums BEGIN "
+    "INSERT INTO album_genres(album_id, genre) SELECT DISTINCT new.id, value FROM json_each(new.genres); END",
+    "CREATE TRIGGER album_genres_update AFTER UPDATE OF genres ON albums BEGIN "
+    "DELETE FROM album_genres WHERE album_id = old.id; "
+    "INSERT INTO album_genres(album_id, genre) SELECT DISTINCT new.id, value FROM json_each(new.genres); END",
+    "CREATE TRIGGER album_genres_delete AFTER DELETE ON albums BEGIN "
+    "DELETE FROM album_genres WHERE album_id = old.id; END",
+)
+SQLITE_POPULATE = (
+    "INSERT INTO album_genres(album_id, genre) "
+    "SELECT DISTINCT albums.id, json_each.value FROM albums, json_each(albums.genres)"
+)
+SQLITE_DROP_TRIGGERS = (
+    "DROP TRIGGER album_genres_delete",
+    "DROP TRIGGER album_genres_update",
+    "DROP TRIGGER album_genres_insert",
+)
+
+POSTGRES_TRIGGERS = (
+    "CREATE OR REPLACE FUNCTION album_genres_update() RETURNS trigger AS $$ BEGIN "
+    "DELETE FROM album_genres WHERE album_id = NEW.id; "
+    "INSERT INTO album_genres(album_id, genre) "
+    "SELECT DISTINCT NEW.id, json_array_elements_text(NEW.genres::json); "
+    "RETURN NULL; END $$ LANGUAGE plpgsql",
+    "CREATE TRIGGER album_genres_update AFTER INSERT OR UPDATE OF genres ON albums "
+    "FOR EACH ROW EXECUTE FUNCTION album_genres_update()",
+)
+POSTGRES_POPULATE = (
+    "INSERT INTO album_genres(album_id, genre) SELECT DISTINCT id, json_array_elements_text(genres::json) FROM albums"
+)
+POSTGRES_DROP_TRIGGERS = (
+    "DROP TRIGGER album_genres_update ON albums",
+    "DROP FUNCTION album_genres_update()",
+)
+
+albums = sa.table("albums", sa.column("id", sa.Integer), sa.column("genres", sa.String))
+
+
+def _rewrite_genres(convert) -> None:
+    connection = op.get_bind()
+    for album_id, genres in connection.execute(sa.select(albums.c.id, albums.c.genres)).all():
+        connection.execute(albums.update().where(albums.c.id == album_id).values(genres=convert(genres)))
+
+
+def _to_json(genres: str | None) -> str:
+    return json.dumps([genre.strip() for genre in (genres or "").split(",") if genre.strip()])
+
+
+def _to_comma_joined(genres: str | None) -> str:
+    return ",".join(json.loads(genres or "[]"))
+
+
+def upgrade() -> None:
+    # genres goes from a comma joined string to a json array
+    _rewrite_genres(_to_json)
+    op.create_table(
+        "album_genres",
+        sa.Column("album_id", sa.Integer(), nullable=False),
+        sa.Column("genre", sa.String(), nullable=False),
+        sa.ForeignKeyConstraint(["album_id"], ["albums.id"], ondelete="CASCADE"),
+        sa.PrimaryKeyConstraint("album_id", "genre"),
+    )
+    op.create_index(op.f("ix_album_genres_genre"), "album_genres", ["genre"], unique=False)
+
+    dialect = op.get_bind().dialect.name
+    if dialect == "sqlite":
+        for statement in SQLITE_TRIGGERS:
+            op.execute(statement)
+        op.execute(SQLITE_POPULATE)
+    elif dialect == "postgresql":
+        for statement in POSTGRES_TRIGGERS:
+            op.execute(statement)
+        op.execute(POSTGRES_POPULATE)
+
+
+def downgrade() -> None:
+    dialect = op.get_bind().dialect.name
+    if dialect == "sqlite":
+        for statement in SQLITE_DROP_TRIGGERS:
+            op.execute(statement)
+    elif dialect == "postgresql":
+        for statement in POSTGRES_DROP_TRIGGERS:
+            op.execute(statement)
+    op.drop_index(op.f("ix_album_genres_genre"), table_name="album_genres")
+    op.drop_table("album_genres")
+    _rewrite_genres(_to_comma_joined)
@@ -1,5 +1,9 @@
 from barcode_api.core.database import Base
 
-from .albums import Album
+# registers the full text search and album_genres trigger DDL
+from . import genres, search  # noqa: F401
+from .albums import Album, AlbumGenre, AlbumLookupMiss
+from .api_tokens import Token
+from .jobs import LookupJob, LookupJobStatus
 
-__all__ = ["Album", "Base"]
+__all__ = ["Album", "AlbumGenre", "AlbumLookupMiss", "Base", "LookupJob", "LookupJobStatus", "Token"]
@@ -1,11 +1,28 @@
+import json
 from datetime import datetime
 
-from sqlalchemy import func
+from sqlalchemy import ForeignKey, String, func
 from sqlalchemy.orm import Mapped, mapped_column
+from sqlalchemy.types import TypeDecorator
 
 from . import Base
 
 
+class StringList(TypeDecorator):
+    """A list of strings, stored as a JSON array in a text column"""
+
+    impl = String
+    cache_ok = True
+
+    @staticmethod
+    def process_bind_param(value: list[str] | None, dialect) -> str | None:
+        return None if value is None else json.dumps(value)
+
+    @staticmethod
+    def process_result_value(value: str | None, dialect) -> list[str] | None:
+        return None if value is None else json.loads(value)
+
+
 class CacheTable(Base):
     __abstract__ = True
     id: Mapped[int] = mapped_column(primary_key=True, autoincrement=True, index=True)
@@ -20,7 +37,26 @@ class Album(CacheTable):
     artist: Mapped[str] = mapped_column(index=True)
     name: Mapped[str] = mapped_column(index=True)
     year: Mapped[str] = mapped_column()
-    genres: Mapped[str] = mapped_column()
+    # album_genres is the indexed copy of this list, triggers keep it in sync, see barcode_api.models.genres
+    genres: Mapped[list[str]] = mapped_column(StringList)
     spotify_id: Mapped[str] = mapped_column(index=True)
     discogs_url: Mapped[str] = mapped_column(nullable=True)
     cover_image_url: Mapped[str] = mapped_column(nullable=True)
+
+
+class AlbumLookupMiss(CacheTable):
+    """Barcodes that could not be resolved to an album, and which lookup stage failed"""
+
+    __tablename__ = "album_lookup_misses"
+
+    stage: Mapped[str] = mapped_column()
+    detail: Mapped[str] = mapped_column()
+
+
+class AlbumGenre(Base):
+    """One row per genre of each album, for looking albums up by genre"""
+
+    __tablename__ = "album_genres"
+
+    album_id: Mapped[int] = mapped_column(ForeignKey("albums.id", ondelete="CASCADE"), primary_key=True)
+    genre: Mapped[str] = mapped_column(primary_key=True, index=True)
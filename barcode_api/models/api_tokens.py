@@ -1,11 +1,19 @@
+from datetime import datetime
+
+from sqlalchemy import func
 from sqlalchemy.orm import Mapped, mapped_column
 
 from . import Base
 
 
 class Token(Base):
+    """An api token, see barcode_api.services.token_service. Only a hash of the token's secret is stored"""
+
     __tablename__ = "tokens"
 
     id: Mapped[int] = mapped_column(primary_key=True, autoincrement=True, index=True)
     hashed_token: Mapped[str]
     notes: Mapped[str]
+    created: Mapped[datetime] = mapped_column(default=func.now())
+    # set when the token is revoked, revoked tokens are kept so other processes notice the revocation
+    revoked_at: Mapped[datetime] = mapped_column(nullable=True, index=True)
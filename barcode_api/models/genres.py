@@ -0,0 +1,38 @@
+"""
+Triggers that keep album_genres in sync with albums.genres
+
+Albums are written with upserts, so album_genres is maintained by the database rather than the ORM: any insert of an
+album, or update of its genres, replaces that album's album_genres rows with the entries of its genres JSON array.
+The migration that creates them is migrations/versions/c4e8b1f5a902_album_genres.py, the same DDL is attached to the
+album_genres table here so metadata.create_all creates the triggers too.
+"""
+
+from sqlalchemy import DDL, event
+
+from .albums import AlbumGenre
+
+SQLITE_DDL = (
+    "CREATE TRIGGER album_genres_insert AFTER INSERT ON albums BEGIN "
+    "INSERT INTO album_genres(album_id, genre) SELECT DISTINCT new.id, value FROM json_each(new.genres); END",
+    "CREATE TRIGGER album_genres_update AFTER UPDATE OF genres ON albums BEGIN "
+    "DELETE FROM album_genres WHERE album_id = old.id; "
+    "INSERT INTO album_genres(album_id, genre) SELECT DISTINCT new.id, value FROM json_each(new.genres); END",
+    # sqlite only enforces ON DELETE CASCADE with the foreign_keys pragma on
+    "CREATE TRIGGER album_genres_delete AFTER DELETE ON albums BEGIN "
+    "DELETE FROM album_genres WHERE album_id = old.id; END",
+)
+
+POSTGRES_DDL = (
+    "CREATE OR REPLACE FUNCTION album_genres_update() RETURNS trigger AS $$ BEGIN "
+    "DELETE FROM album_genres WHERE album_id = NEW.id; "
+    "INSERT INTO album_genres(album_id, genre) "
+    "SELECT DISTINCT NEW.id, json_array_elements_text(NEW.genres::json); "
+    "RETURN NULL; END $$ LANGUAGE plpgsql",
+    "CREATE TRIGGER album_genres_update AFTER INSERT OR UPDATE OF genres ON albums "
+    "FOR EACH ROW EXECUTE FUNCTION album_genres_update()",
+)
+
+for statement in SQLITE_DDL:
+    event.listen(AlbumGenre.__table__, "after_create", DDL(statement).execute_if(dialect="sqlite"))
+for statement in POSTGRES_DDL:
+    event.listen(AlbumGenre.__table__, "after_create", DDL(statement).execute_if(dialect="postgresql"))
@@ -0,0 +1,31 @@
+from datetime import datetime
+from enum import StrEnum
+
+from sqlalchemy import ForeignKey, func
+from sqlalchemy.orm import Mapped, mapped_column
+
+from . import Base
+
+
+class LookupJobStatus(StrEnum):
+    pending = "pending"
+    running = "running"
+    succeeded = "succeeded"
+    failed = "failed"
+
+
+class LookupJob(Base):
+    """An upstream barcode lookup run by the job workers, see barcode_api.services.job_service"""
+
+    __tablename__ = "lookup_jobs"
+
+    id: Mapped[str] = mapped_column(primary_key=True)
+    barcode: Mapped[str] = mapped_column(index=True)
+    status: Mapped[str] = mapped_column(index=True, default=LookupJobStatus.pending)
+    attempts: Mapped[int] = mapped_column(default=0)
+    # the status code and error GET /album/search would have returned for the barcode
+    status_code: Mapped[int] = mapped_column(nullable=True)
+    error: Mapped[str] = mapped_column(nullable=True)
+    album_id: Mapped[int] = mapped_column(ForeignKey("albums.id", ondelete="SET NULL"), nullable=True)
+    created: Mapped[datetime] = mapped_column(default=func.now())
+    last_update: Mapped[datetime] = mapped_column(onupdate=func.now(), default=func.now())
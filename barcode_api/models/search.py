@@ -0,0 +1,51 @@
+"""
+Full text search index over album artists and names
+
+The index lives outside the ORM models: an external content FTS5 table on sqlite, a tsvector column with a GIN index
+on postgres, both kept in sync with albums by triggers. The migration that creates them is
+migrations/versions/9d2f6a1c0b37_album_full_text_search.py, the same DDL is attached to the albums table here so
+metadata.create_all builds the index too.
+"""
+
+from sqlalchemy import DDL, event
+
+from .albums import Album
+
+# tables and columns that are part of the index, alembic autogenerate ignores them, see migrations/env.py
+SEARCH_TABLE_PREFIX = "albums_fts"
+SEARCH_COLUMN = "search_vector"
+
+SQLITE_DDL = (
+    "CREATE VIRTUAL TABLE albums_fts USING fts5("
+    "artist, name, content='albums', content_rowid='id', tokenize='unicode61 remove_diacritics 2')",
+    "CREATE TRIGGER albums_fts_insert AFTER INSERT ON albums BEGIN "
+    "INSERT INTO albums_fts(rowid, artist, name) VALUES (new.id, new.artist, new.name); END",
+    "CREATE TRIGGER albums_fts_delete AFTER DELETE ON albums BEGIN "
+    "INSERT INTO albums_fts(albums_fts, rowid, artist, name) VALUES ('delete', old.id, old.artist, old.name); END",
+    "CREATE TRIGGER albums_fts_update AFTER UPDATE OF artist, name ON albums BEGIN "
+    "INSERT INTO albums_fts(albums_fts, rowid, artist, name) VALUES ('delete', old.id, old.artist, old.name); "
+    "INSERT INTO albums_fts(rowid, artist, name) VALUES (new.id, new.artist, new.name); END",
+    # index any rows that were already in the table
+    "INSERT INTO albums_fts(albums_fts) VALUES ('rebuild')",
+)
+
+POSTGRES_DDL = (
+    "ALTER TABLE albums ADD COLUMN search_vector tsvector",
+    "CREATE OR REPLACE FUNCTION albums_search_vector_update() RETURNS trigger AS $$ BEGIN "
+    "NEW.search_vector := setweight(to_tsvector('simple', coalesce(NEW.artist, '')), 'A') "
+    "|| setweight(to_tsvector('simple', coalesce(NEW.name, '')), 'B'); "
+    "RETURN NEW; END $$ LANGUAGE plpgsql",
+    "CREATE TRIGGER albums_search_vector_update BEFORE INSERT OR UPDATE OF artist, name ON albums "
+    "FOR EACH ROW EXECUTE FUNCTION albums_search_vector_update()",
+    # fires the trigger for any rows that were already in the table
+    "UPDATE albums SET artist = artist",
+    "CREATE INDEX ix_albums_search_vector ON albums USING gin (search_vector)",
+)
+
+for statement in SQLITE_DDL:
+    event.listen(Album.__table__, "after_create", DDL(statement).execute_if(dialect="sqlite"))
+for statement in POSTGRES_DDL:
+    event.listen(Album.__table__, "after_create", DDL(statement).execute_if(dialect="postgresql"))
+# the fts table isn't in the metadata, drop it with albums. postgres drops the column, index and trigger with the
+# table, the function is replaced when it is created again
+event.listen(Album.__table__, "before_drop", DDL("DROP TABLE IF EXISTS albums_fts").execute_if(dialect="sqlite"))
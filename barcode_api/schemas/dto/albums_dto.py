@@ -1,6 +1,6 @@
 from typing import Any
 
-from pydantic import AnyUrl, BaseModel, ConfigDict
+from pydantic import AnyUrl, BaseModel, ConfigDict, Field
 
 
 class DiscogsAlbum(BaseModel):
@@ -30,8 +30,31 @@ class DiscogsAlbum(BaseModel):
 class Album(DiscogsAlbum):
     spotify_id: str
 
-    @classmethod
-    def model_validate(cls, this_obj) -> "DiscogsAlbum":
-        if isinstance(this_obj.genres, str):
-            this_obj.genres = this_obj.genres.split(",")
-        return super().model_validate(this_obj)
+
+class FindResponse(BaseModel):
+    query: str
+    limit: int
+    offset: int
+    results: list[Album]
+
+
+class GenreResponse(BaseModel):
+    genre: str
+    limit: int
+    offset: int
+    results: list[Album]
+
+
+class BatchSearchRequest(BaseModel):
+    barcodes: list[str] = Field(min_length=1)
+
+
+class BatchSearchResult(BaseModel):
+    barcode: str
+    status_code: int
+    album: Album | None = None
+    error: str | None = None
+
+
+class BatchSearchResponse(BaseModel):
+    results: list[BatchSearchResult]
@@ -0,0 +1,19 @@
+from datetime import datetime
+
+from pydantic import BaseModel, ConfigDict
+
+from barcode_api.schemas.dto.albums_dto import Album
+
+
+class LookupJob(BaseModel):
+    model_config = ConfigDict(from_attributes=True)
+
+    id: str
+    barcode: str
+    status: str
+    # set once the job has finished, what GET /album/search would have returned
+    status_code: int | None = None
+    error: str | None = None
+    album: Album | None = None
+    created: datetime
+    last_update: datetime
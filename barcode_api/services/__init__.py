@@ -1,5 +1,7 @@
 from barcode_api.services.album_service import AlbumService
+from barcode_api.services.job_service import LookupJobService
+from barcode_api.services.token_service import TokenService
 
-SERVICES = [AlbumService]
+SERVICES = [AlbumService, LookupJobService, TokenService]
 
-__all__ = ["SERVICES", "AlbumService"]
+__all__ = ["SERVICES", "AlbumService", "LookupJobService", "TokenService"]
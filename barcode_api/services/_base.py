@@ -1,29 +1,209 @@
+import asyncio
+from collections.abc import Hashable, Iterable
+from contextlib import asynccontextmanager
+from datetime import UTC, datetime
 from logging import Logger
-from typing import TypeVar
+from typing import Any, TypeVar
 
-from sqlalchemy import select
+import structlog
+from fastapi import FastAPI
+from sqlalchemy import func, select
+from sqlalchemy.dialects import postgresql, sqlite
 from sqlalchemy.ext.asyncio import AsyncSession
 
-from barcode_api.core.config import Config
-from barcode_api.core.database import Base
+from barcode_api.core.cache import LRUCache, l1_cache
+from barcode_api.core.config import Config, get_config
+from barcode_api.core.database import Base, sessionmanager
+from barcode_api.core.errors import BarcodeAPIBaseDBException
+from barcode_api.core.metrics import StatsCollector, registry
+from barcode_api.core.timing import timed
+from barcode_api.core.write_behind import WriteBehindBuffer
 
 ModelType = TypeVar("ModelType", bound="Base")
 
+# dialects that support INSERT ... ON CONFLICT DO UPDATE ... RETURNING
+UPSERT_INSERTS = {"sqlite": sqlite.insert, "postgresql": postgresql.insert}
+# columns with values set by the database, they are never written from an instance
+SERVER_MANAGED_COLUMNS = {"id", "last_update", "is_deleted"}
+
 
 class BarcodeServiceBase:
     MODEL: type[ModelType]
 
-    def __init__(self, config: Config, logger: Logger, db_session: AsyncSession) -> None:
+    def __init__(
+        self,
+        config: Config,
+        logger: Logger,
+        db_session: AsyncSession,
+        cache: LRUCache | None = None,
+        write_buffer: WriteBehindBuffer | None = None,
+    ) -> None:
         self._config: Config = config
         self._logger: Logger = logger
         self._db_session = db_session
+        self._l1_cache: LRUCache = cache if cache is not None else l1_cache
+        # None when write behind is off
+        self._write_buffer = write_buffer if write_buffer is not None else write_behind
+        # an AsyncSession can't be used by concurrent tasks, serialize db work for fanned out lookups
+        self._db_lock = asyncio.Lock()
+
+    def _l1_key(self, value: str, key: str = "barcode", model: type[ModelType] | None = None) -> Hashable:
+        model = model if model is not None else self.MODEL
+        return (model.__tablename__, key, value)
+
+    @staticmethod
+    def _age(instance: ModelType) -> float:
+        """Seconds since the row was last written. last_update is stored as a naive UTC timestamp"""
+        return (datetime.now(UTC).replace(tzinfo=None) - instance.last_update).total_seconds()
+
+    @timed("cache")
+    async def _get_fom_cache(
+        self, value: str, key: str = "barcode", model: type[ModelType] | None = None
+    ) -> ModelType | None:
+        model = model if model is not None else self.MODEL
+        result = self._get_pending(value, key, model)
+        if result is None:
+            result = self._l1_cache.get(self._l1_key(value, key, model))
+        if result is not None:
+            return result
+        async with self._db_lock, self._db_session.begin():
+            result = await self._db_session.scalar(select(model).where(getattr(model, key) == value))
+        if result is not None:
+            self._l1_cache.set(self._l1_key(value, key, model), result)
+        return result
+
+    async def _get_many_from_cache(self, values: Iterable[str], key: str = "barcode") -> dict[str, ModelType]:
+        """Looks up many values at once, anything not in the l1 cache is fetched with a single IN query"""
+        found: dict[str, ModelType] = dict()
+        missing: list[str] = []
+        for value in values:
+            result = self._get_pending(value, key)
+            if result is None:
+                result = self._l1_cache.get(self._l1_key(value, key))
+            if result is None:
+                missing.append(value)
+            else:
+                found[value] = result
+        if len(missing) == 0:
+            return found
+
+        column = getattr(self.MODEL, key)
+        async with self._db_lock, self._db_session.begin():
+            results = await self._db_session.scalars(select(self.MODEL).where(column.in_(missing)))
+            for result in results:
+                found[getattr(result, key)] = result
+                self._l1_cache.set(self._l1_key(getattr(result, key), key), result)
+        return found
+
+    @staticmethod
+    def _row_values(instance: ModelType) -> dict[str, Any]:
+        """Column values to write for an instance, leaving out the columns the database manages"""
+        return {
+            column.key: getattr(instance, column.key)
+            for column in instance.__table__.columns
+            if column.key not in SERVER_MANAGED_COLUMNS
+        }
+
+    def _upsert_statement(self, model: type[ModelType], rows: list[dict[str, Any]], key: str):
+        dialect = self._db_session.bind.dialect.name
+        insert = UPSERT_INSERTS.get(dialect)
+        if insert is None:
+            err_msg = f"Upserts are not supported on the {dialect} dialect"
+            raise BarcodeAPIBaseDBException(err_msg)
+        statement = insert(model).values(rows)
+        update = {column: statement.excluded[column] for column in rows[0] if column != key}
+        # a re-written row is live and fresh again, rows from the write behind buffer carry when they were written
+        update.setdefault("last_update", func.now())
+        update["is_deleted"] = False
+        return statement.on_conflict_do_update(index_elements=[key], set_=update).returning(model)
+
+    async def _upsert_rows(self, model: type[ModelType], rows: list[dict[str, Any]], key: str) -> list[ModelType]:
+        """Runs the upsert for rows in the session's current transaction and caches the stored rows"""
+        # a row can only be upserted once per statement, the last one for a key wins
+        rows = list({row[key]: row for row in rows}.values())
+        if len(rows) == 0:
+            return []
+        statement = self._upsert_statement(model, rows, key)
+        results = list(await self._db_session.scalars(statement, execution_options={"populate_existing": True}))
+        for result in results:
+            self._l1_cache.set(self._l1_key(getattr(result, key), key, model), result)
+        return results
 
-    async def _get_fom_cache(self, value: str, key: str = "barcode") -> ModelType | None:
-        async with self._db_session.begin():
-            result = await self._db_session.scalar(select(self.MODEL).where(getattr(self.MODEL, key) == value))
+    async def _upsert(
+        self, model: type[ModelType], rows: Iterable[dict[str, Any]], key: str = "barcode"
+    ) -> list[ModelType]:
+        """
+        Inserts rows, updating any that already exist by key, in a single statement. Returns the stored rows
+        """
+        async with self._db_lock, self._db_session.begin():
+            return await self._upsert_rows(model, list(rows), key)
+
+    async def _write_pending(self, items: list[tuple[ModelType, str]]) -> None:
+        """Writes (instance, key) pairs from the write behind buffer, every model's rows in one transaction"""
+        rows: dict[tuple[type[ModelType], str], list[dict[str, Any]]] = dict()
+        for instance, key in items:
+            row = self._row_values(instance) | {"last_update": instance.last_update}
+            rows.setdefault((type(instance), key), []).append(row)
+        async with self._db_lock, self._db_session.begin():
+            for (model, key), model_rows in rows.items():
+                await self._upsert_rows(model, model_rows, key)
+
+    def _get_pending(self, value: str, key: str = "barcode", model: type[ModelType] | None = None) -> ModelType | None:
+        """An instance waiting in the write behind buffer, which is newer than anything in the l1 cache or db"""
+        if self._write_buffer is None:
+            return None
+        pending = self._write_buffer.get(self._l1_key(value, key, model))
+        return None if pending is None else pending[0]
+
+    @timed("cache_write")
+    async def _add_to_cache(self, instance: ModelType, key: str = "barcode") -> ModelType:
+        """
+        Writes instance to the cache, replacing any existing row with the same key. Returns the stored row
+
+        With write behind on, instance is buffered and returned as is, without an id, and written with the next flush
+        """
+        if self._write_buffer is not None:
+            instance.last_update = datetime.now(UTC).replace(tzinfo=None)
+            instance.is_deleted = False
+            await self._write_buffer.add(self._l1_key(getattr(instance, key), key, type(instance)), (instance, key))
+            return instance
+        (result,) = await self._upsert(type(instance), [self._row_values(instance)], key)
         return result
 
-    async def _add_to_cache(self, instance: ModelType) -> None:
-        async with self._db_session.begin():
-            self._db_session.add(instance)
-            await self._db_session.commit()
+    async def _add_many_to_cache(self, instances: Iterable[ModelType], key: str = "barcode") -> list[ModelType]:
+        """Writes many instances of MODEL to the cache in one statement"""
+        return await self._upsert(self.MODEL, (self._row_values(instance) for instance in instances), key)
+
+
+async def write_pending(items: list[tuple[ModelType, str]]) -> None:
+    async with sessionmanager.session() as db_session:
+        await BarcodeServiceBase(config, structlog.stdlib.get_logger("app"), db_session)._write_pending(items)
+
+
+config: Config = get_config()
+# newly written cache rows, see BarcodeServiceBase._add_to_cache
+write_behind: WriteBehindBuffer[tuple[ModelType, str]] | None = None
+if config.write_behind:
+    write_behind = WriteBehindBuffer("cache", write_pending, config.write_behind_interval, config.write_behind_max_rows)
+    registry.register(
+        StatsCollector(
+            "barcode_api_write_behind",
+            "Write behind buffer",
+            "buffer",
+            {write_behind.name: write_behind.stats},
+            counters=("flushes", "rows_written", "failures"),
+        )
+    )
+
+
+@asynccontextmanager
+async def write_behind_lifespan(app: FastAPI):
+    """
+    Flushes the write behind buffer periodically, and writes anything left in it on shutdown
+    """
+    if write_behind is None:
+        yield
+        return
+    write_behind.start()
+    yield
+    await write_behind.close()
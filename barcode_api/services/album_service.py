@@ -1,17 +1,39 @@
+import asyncio
 import re
+import time
+from collections import deque
+from collections.abc import AsyncIterator, Awaitable, Callable, Iterable
 from functools import cached_property
 from http import HTTPStatus
 from logging import Logger
-from typing import Annotated, Any
+from typing import Annotated, Any, ClassVar
 
 from async_property import async_property
-from httpx import AsyncClient
+from httpx import AsyncClient, HTTPError, Response
 from pydantic import StringConstraints
+from sqlalchemy import select, text
 from sqlalchemy.ext.asyncio import AsyncSession
 
+from barcode_api.core.admission import AdmissionController, upstream_admission
+from barcode_api.core.background import refresh_pool
+from barcode_api.core.cache import LRUCache
 from barcode_api.core.config import Config
-from barcode_api.core.errors import BarcodeAPIBaseException
-from barcode_api.models.albums import Album
+from barcode_api.core.database import sessionmanager
+from barcode_api.core.errors import BarcodeAPIBaseDBException, BarcodeAPIBaseException
+from barcode_api.core.http_client import HttpClientManager, httpclientmanager
+from barcode_api.core.metrics import album_cache_lookups, upstream_errors, upstream_request_duration
+from barcode_api.core.ratelimit import (
+    Priority,
+    UpstreamScheduler,
+    discogs_scheduler,
+    spotify_scheduler,
+    upstream_priority,
+)
+from barcode_api.core.resilience import UpstreamPolicy, discogs_policy, hedged, spotify_policy
+from barcode_api.core.singleflight import SingleFlight
+from barcode_api.core.streaming import TooLongLine
+from barcode_api.core.timing import request_timings, timed
+from barcode_api.models.albums import Album, AlbumGenre, AlbumLookupMiss
 from barcode_api.schemas.dto.albums_dto import DiscogsAlbum
 from barcode_api.services._base import BarcodeServiceBase
 
@@ -19,6 +41,37 @@ SpotifyAlbumID = Annotated[str, StringConstraints(strip_whitespace=True, max_len
 
 # Strips out any (##) from the artist
 DISCOGS_ARTIST_CLEANUP_REGEX = re.compile(r"\(\d+\)")
+# only the words of a find query are searched for, so user input can't inject full text query syntax
+SEARCH_TERM_REGEX = re.compile(r"\w+")
+# longest barcode search_stream will look up, anything longer is rejected without touching the cache or upstream
+BARCODE_MAX_LENGTH = 64
+
+
+def is_barcode_length(barcode: str) -> bool:
+    """False for anything too long to be a barcode, including lines read_lines cut short"""
+    return not isinstance(barcode, TooLongLine) and len(barcode) <= BARCODE_MAX_LENGTH
+
+
+_ALBUM_COLUMNS = ", ".join(f"albums.{column.name}" for column in Album.__table__.columns)
+# ranked full text search queries per dialect, see barcode_api.models.search for the indexes they use
+FIND_QUERIES = {
+    "sqlite": text(
+        f"SELECT {_ALBUM_COLUMNS} FROM albums_fts JOIN albums ON albums.id = albums_fts.rowid "  # noqa: S608
+        "WHERE albums_fts MATCH :query AND NOT albums.is_deleted "
+        # artist matches are weighted above album name matches
+        "ORDER BY bm25(albums_fts, 2.0, 1.0), albums.id LIMIT :limit OFFSET :offset"
+    ),
+    "postgresql": text(
+        f"SELECT {_ALBUM_COLUMNS} FROM albums, to_tsquery('simple', :query) AS query "  # noqa: S608
+        "WHERE albums.search_vector @@ query AND NOT albums.is_deleted "
+        "ORDER BY ts_rank(albums.search_vector, query) DESC, albums.id LIMIT :limit OFFSET :offset"
+    ),
+}
+# builds each dialect's query syntax for "every term, matching as a prefix"
+FIND_QUERY_FORMATS: dict[str, Callable[[list[str]], str]] = {
+    "sqlite": lambda terms: " ".join(f'"{term}"*' for term in terms),
+    "postgresql": lambda terms: " & ".join(f"{term}:*" for term in terms),
+}
 
 
 class AlbumService(BarcodeServiceBase):
@@ -27,20 +80,51 @@ class AlbumService(BarcodeServiceBase):
 
     class NoSpotifyFoundError(NotFoundError):
         ERROR_TEXT = "No spotify album found for %s - %s"
-        pass
+        STAGE = "spotify"
 
     class NoDiscogsAlbumFoundError(NotFoundError):
         ERROR_TEXT = "No Discogs album found for barcode %s"
-        pass
+        STAGE = "discogs"
+
+    class InvalidBarcodeError(BarcodeAPIBaseException):
+        ERROR_TEXT = "Barcodes are at most %d characters"
 
     MODEL = Album
+    # maps AlbumLookupMiss.stage back to the error that lookup stage raises
+    MISS_STAGES: ClassVar[dict[str, type[NotFoundError]]] = {
+        NoDiscogsAlbumFoundError.STAGE: NoDiscogsAlbumFoundError,
+        NoSpotifyFoundError.STAGE: NoSpotifyFoundError,
+    }
+    # shared by every AlbumService instance in the process, one is built per request
+    _lookups = SingleFlight()
+    # barcode -> when its last background refresh failed, so a failing refresh isn't retried on every hit
+    _refresh_failures = LRUCache(maxsize=1024)
 
-    def __init__(self, config: Config, logger: Logger, db_session: AsyncSession) -> None:
-        super().__init__(config, logger, db_session)
+    def __init__(
+        self,
+        config: Config,
+        logger: Logger,
+        db_session: AsyncSession,
+        cache: LRUCache | None = None,
+        admission: AdmissionController | None = None,
+    ) -> None:
+        super().__init__(config, logger, db_session, cache)
+        self._admission = admission if admission is not None else upstream_admission
         self.spotify_service = SpotifyLookupService(config, logger)
         self.discogs_service = DiscogsLookupService(config, logger)
 
     async def _lookup_album(self, barcode: str) -> Album | None:
+        """
+        Looks barcode up on Discogs and Spotify. Raises OverloadedError without going upstream if too many lookups
+        are already running and waiting, so a slow upstream doesn't pile up requests
+        """
+        try:
+            async with self._admission.admit():
+                return await self._lookup_upstream(barcode)
+        except AdmissionController.RejectedError as exc:
+            raise HttpxService.OverloadedError(str(exc), retry_after=exc.retry_after) from None
+
+    async def _lookup_upstream(self, barcode: str) -> Album | None:
         discogs_albums = await self.discogs_service.search(barcode=barcode)
         if len(discogs_albums) == 0:
             raise self.__class__.NoDiscogsAlbumFoundError(self.__class__.NoDiscogsAlbumFoundError.ERROR_TEXT % barcode)
@@ -57,34 +141,394 @@ class AlbumService(BarcodeServiceBase):
             artist=cleaned_artist,
             name=discogs_albums[0].name,
             year=discogs_albums[0].year,
-            genres=",".join(discogs_albums[0].genres),
+            genres=discogs_albums[0].genres or [],
             spotify_id=spotify_id,
             discogs_url=url,
             cover_image_url=cover_url,
         )
         return album
 
+    async def _check_negative_cache(self, barcode: str) -> None:
+        """Raises the NotFoundError a recent lookup of barcode failed with, if there is one"""
+        if self._config.negative_cache_ttl <= 0:
+            return
+        miss = await self._get_fom_cache(value=barcode, model=AlbumLookupMiss)
+        if miss is not None and self._age(miss) < self._config.negative_cache_ttl:
+            error_class = self.MISS_STAGES.get(miss.stage, self.NotFoundError)
+            raise error_class(miss.detail)
+
+    async def _record_miss(self, barcode: str, exc: NotFoundError) -> None:
+        if self._config.negative_cache_ttl <= 0:
+            return
+        await self._add_to_cache(AlbumLookupMiss(barcode=barcode, stage=exc.STAGE, detail=str(exc)))
+
+    async def _lookup_and_cache(self, barcode: str) -> Album:
+        # another request may have just finished this lookup between our cache miss and getting here
+        album = await self._get_fom_cache(value=barcode)
+        if album is None:
+            await self._check_negative_cache(barcode)
+            try:
+                album = await self._lookup_album(barcode)
+            except (self.NoDiscogsAlbumFoundError, self.NoSpotifyFoundError) as exc:
+                await self._record_miss(barcode, exc)
+                raise
+            album = await self._add_to_cache(album)
+        return album
+
+    async def _refresh(self, album: Album) -> Album:
+        """Re-runs the upstream lookup for a cached album and updates its row, bumping last_update"""
+        return await self._add_to_cache(await self._lookup_album(album.barcode))
+
+    async def _refresh_in_background(self, album: Album) -> None:
+        upstream_priority.set(Priority.BACKGROUND)
+        # the refresh outlives the request that scheduled it, don't add its time to that request's timings
+        request_timings.set(None)
+        async with sessionmanager.session() as db_session:
+            service = self.__class__(self._config, self._logger, db_session, self._l1_cache, self._admission)
+            try:
+                await self._lookups.do(("refresh", album.barcode), lambda: service._refresh(album))
+            except Exception:
+                self._refresh_failures.set(album.barcode, time.monotonic())
+                raise
+
+    def _schedule_refresh(self, album: Album) -> None:
+        failed_at = self._refresh_failures.get(album.barcode)
+        if failed_at is not None and time.monotonic() - failed_at < self._config.refresh_retry_after:
+            return
+        refresh_pool.submit(("refresh", album.barcode), lambda: self._refresh_in_background(album))
+
+    async def _revalidate(self, album: Album) -> Album:
+        """
+        Applies the freshness policy to a cached album
+
+        Albums past the hard ttl are refetched inline, if that fails the stale album is served. Albums past the soft
+        ttl are served as is and refreshed in the background.
+        """
+        age = self._age(album)
+        if 0 < self._config.album_hard_ttl <= age:
+            try:
+                return await self._lookups.do(("refresh", album.barcode), lambda: self._refresh(album))
+            except (self.NotFoundError, HttpxService.UpstreamError) as exc:
+                self._logger.warning("Serving stale album for %s, refresh failed: %s", album.barcode, exc)
+                return album
+        if 0 < self._config.album_soft_ttl <= age:
+            self._schedule_refresh(album)
+        return album
+
+    def _needs_inline_refresh(self, album: Album) -> bool:
+        return 0 < self._config.album_hard_ttl <= self._age(album)
+
     async def search(self, barcode: str) -> tuple[SpotifyAlbumID, DiscogsAlbum]:
         album = await self._get_fom_cache(value=barcode)
+        album_cache_lookups.inc(result="miss" if album is None else "hit")
         if album is None:
-            album = await self._lookup_album(barcode)
-            await self._add_to_cache(album)
+            # concurrent searches for the same barcode share one upstream lookup and insert
+            album = await self._lookups.do(barcode, lambda: self._lookup_and_cache(barcode))
+        else:
+            album = await self._revalidate(album)
 
         return album
 
+    async def search_cached(self, barcode: str) -> Album | None:
+        """
+        search without going upstream. Returns the cached album, or None if barcode needs an upstream lookup or an
+        inline refresh. Raises the NotFoundError a recent lookup failed with
+        """
+        album = await self._get_fom_cache(value=barcode)
+        if album is None:
+            await self._check_negative_cache(barcode)
+            return None
+        if self._needs_inline_refresh(album):
+            return None
+        album_cache_lookups.inc(result="hit")
+        return await self._revalidate(album)
+
+    async def find(self, query: str, limit: int = 20, offset: int = 0) -> list[Album]:
+        """
+        Full text search of cached albums' artists and names, best matches first
+
+        Every word in query has to match the start of a word in the artist or album name.
+        """
+        terms = SEARCH_TERM_REGEX.findall(query.lower())
+        if len(terms) == 0:
+            return []
+        dialect = self._db_session.bind.dialect.name
+        if dialect not in FIND_QUERIES:
+            err_msg = f"Full text search is not supported on the {dialect} dialect"
+            raise BarcodeAPIBaseDBException(err_msg)
+        statement = select(Album).from_statement(FIND_QUERIES[dialect])
+        params = {"query": FIND_QUERY_FORMATS[dialect](terms), "limit": limit, "offset": offset}
+        async with self._db_lock, self._db_session.begin():
+            return list(await self._db_session.scalars(statement, params))
+
+    async def by_genre(self, genre: str, limit: int = 20, offset: int = 0) -> list[Album]:
+        """Cached albums with genre, ordered by artist and name"""
+        statement = (
+            select(Album)
+            .join(AlbumGenre, AlbumGenre.album_id == Album.id)
+            .where(AlbumGenre.genre == genre, Album.is_deleted.is_(False))
+            .order_by(Album.artist, Album.name, Album.id)
+            .limit(limit)
+            .offset(offset)
+        )
+        async with self._db_lock, self._db_session.begin():
+            return list(await self._db_session.scalars(statement))
+
+    async def _resolve(self, barcode: str, cached: Album | None = None) -> Album | Exception:
+        """
+        Finishes a lookup for a barcode that search_many or search_stream couldn't answer from the cache: looks
+        it up upstream, or refreshes the cached album if it is past its hard ttl. Returns the exception instead of
+        raising it
+        """
+        try:
+            if cached is not None:
+                return await self._revalidate(cached)
+            return await self._lookups.do(barcode, lambda: self._lookup_and_cache(barcode))
+        except self.NotFoundError as exc:
+            return exc
+        except Exception as exc:
+            self._logger.exception("Error looking up barcode %s", barcode)
+            return exc
+
+    async def _search_cached(self, barcodes: list[str]) -> tuple[dict[str, Album], list[tuple[str, Album | None]]]:
+        """
+        Splits barcodes into the albums that can be served from the cache right away, and the barcodes (with their
+        cached album, if any) that need an upstream lookup or an inline refresh
+        """
+        cached = await self._get_many_from_cache(barcodes)
+        album_cache_lookups.inc(len(cached), result="hit")
+        album_cache_lookups.inc(len(barcodes) - len(cached), result="miss")
+        found: dict[str, Album] = {}
+        pending: list[tuple[str, Album | None]] = []
+        for barcode in barcodes:
+            album = cached.get(barcode)
+            if album is None or self._needs_inline_refresh(album):
+                pending.append((barcode, album))
+            else:
+                # only schedules background refreshes, never waits on upstream
+                found[barcode] = await self._revalidate(album)
+        return found, pending
+
+    async def _search_batch(
+        self, batch: list[str]
+    ) -> tuple[list[tuple[str, Album | Exception]], list[tuple[str, Album | None]]]:
+        """_search_cached for a batch of search_stream, rejecting anything too long to be a barcode"""
+        ready: list[tuple[str, Album | Exception]] = [
+            (barcode, self.InvalidBarcodeError(self.InvalidBarcodeError.ERROR_TEXT % BARCODE_MAX_LENGTH))
+            for barcode in batch
+            if not is_barcode_length(barcode)
+        ]
+        found, pending = await self._search_cached(
+            list(dict.fromkeys(barcode for barcode in batch if is_barcode_length(barcode)))
+        )
+        return [*ready, *found.items()], pending
+
+    async def search_many(self, barcodes: Iterable[str]) -> dict[str, Album | Exception]:
+        """
+        Searches for many barcodes at once
+
+        Cached barcodes are resolved with a single query, the rest are looked up upstream with at most
+        batch_lookup_concurrency lookups running at a time. Returns the album, or the exception that stopped it
+        from being found, for each barcode.
+        """
+        results: dict[str, Album | Exception]
+        results, pending = await self._search_cached(list(dict.fromkeys(barcodes)))
+        semaphore = asyncio.Semaphore(self._config.batch_lookup_concurrency)
+
+        async def resolve(barcode: str, cached: Album | None) -> None:
+            async with semaphore:
+                results[barcode] = await self._resolve(barcode, cached)
+
+        await asyncio.gather(*(resolve(barcode, cached) for barcode, cached in pending))
+        return results
+
+    async def search_stream(self, batches: AsyncIterator[list[str]]) -> AsyncIterator[tuple[str, Album | Exception]]:
+        """
+        Searches for barcodes as they arrive, yielding each barcode with its album (or the exception that stopped
+        it from being found) as soon as it resolves
+
+        Each batch's cached barcodes are yielded as soon as the batch is read, the rest are looked up upstream with
+        at most batch_lookup_concurrency lookups running at a time and yielded in the order they finish. The next
+        batch isn't read until the previous one's lookups have all started, so memory use is bounded by the batch
+        size rather than the length of the stream. A barcode repeated within a batch is yielded once. Closing the
+        iterator cancels any lookups still running.
+        """
+        concurrency = self._config.batch_lookup_concurrency
+        queued: deque[tuple[str, Album | None]] = deque()
+        running: set[asyncio.Task] = set()
+        reading: asyncio.Future | None = None
+        exhausted = False
+
+        async def resolve(barcode: str, cached: Album | None) -> tuple[str, Album | Exception]:
+            return barcode, await self._resolve(barcode, cached)
+
+        try:
+            while True:
+                while queued and len(running) < concurrency:
+                    running.add(asyncio.create_task(resolve(*queued.popleft())))
+                if reading is None and not queued and not exhausted:
+                    # read the next batch while lookups run, so their results aren't held up by a slow client
+                    reading = asyncio.ensure_future(anext(batches, None))
+                waiting = running if reading is None else {*running, reading}
+                if len(waiting) == 0:
+                    return
+                done, _ = await asyncio.wait(waiting, return_when=asyncio.FIRST_COMPLETED)
+                for task in done:
+                    if task is not reading:
+                        running.discard(task)
+                        yield task.result()
+                        continue
+                    reading = None
+                    batch = task.result()
+                    if batch is None:
+                        exhausted = True
+                        continue
+                    ready, pending = await self._search_batch(batch)
+                    for result in ready:
+                        yield result
+                    queued.extend(pending)
+        finally:
+            for task in running:
+                task.cancel()
+            if reading is not None:
+                reading.cancel()
+
 
 class HttpxService:
-    def __init__(self, config: Config, logger: Logger, httpx_client_config: dict[str, Any] | None = None) -> None:
+    class UpstreamError(BarcodeAPIBaseException):
+        pass
+
+    class UpstreamTimeoutError(UpstreamError):
+        pass
+
+    class UnavailableError(UpstreamError):
+        """The upstream can't be called right now, retry_after is how many seconds until it might be"""
+
+        def __init__(self, message: str, retry_after: float) -> None:
+            super().__init__(message)
+            self.retry_after = retry_after
+
+    class RateLimitedError(UnavailableError):
+        pass
+
+    class CircuitOpenError(UnavailableError):
+        pass
+
+    class OverloadedError(UnavailableError):
+        """Raised by AlbumService when too many upstream lookups are already running and waiting"""
+
+    # every call to this service's upstream goes through its scheduler, see barcode_api.core.ratelimit
+    SCHEDULER: UpstreamScheduler
+    # and is bounded by its policy's deadline and circuit breaker, see barcode_api.core.resilience
+    POLICY: UpstreamPolicy
+
+    def __init__(
+        self,
+        config: Config,
+        logger: Logger,
+        http_client_manager: HttpClientManager | None = None,
+        scheduler: UpstreamScheduler | None = None,
+        *,
+        policy: UpstreamPolicy | None = None,
+    ) -> None:
         self._config: Config = config
         self._logger: Logger = logger
-        self.httpx_client_config = httpx_client_config if httpx_client_config is not None else dict()
+        self._http_client_manager = http_client_manager if http_client_manager is not None else httpclientmanager
+        self._scheduler = scheduler if scheduler is not None else self.SCHEDULER
+        self._policy = policy if policy is not None else self.POLICY
+
+    def _get_httpx_client(self, url: str) -> AsyncClient:
+        """Returns the shared, pooled client for url's host. The client is owned by the manager, do not close it"""
+        return self._http_client_manager.get_client(url)
+
+    async def _attempt(self, client: AsyncClient, method: str, url: str, **kwargs) -> Response:
+        """Sends a single request, recording its latency and any failure"""
+        upstream = self._scheduler.name
+        start_time = time.perf_counter()
+        try:
+            response = await client.request(method, url, **kwargs)
+        except HTTPError as exc:
+            upstream_errors.inc(upstream=upstream, reason=type(exc).__name__)
+            raise
+        finally:
+            upstream_request_duration.observe(time.perf_counter() - start_time, upstream=upstream)
+        if response.is_error:
+            upstream_errors.inc(upstream=upstream, reason=response.status_code)
+        else:
+            self._policy.latencies.record(time.perf_counter() - start_time)
+        return response
+
+    async def _send(self, client: AsyncClient, method: str, url: str, **kwargs) -> Response:
+        """
+        Sends a request within the policy's deadline. If it runs longer than the policy's hedge delay, an identical
+        request is sent (once the scheduler has a token for it) and whichever answers first is used
+        """
 
-    def _get_httpx_client(self):
-        return AsyncClient(**self.httpx_client_config)
+        async def hedge() -> Response:
+            self._policy.hedges += 1
+            await self._scheduler.acquire(max_wait=self._policy.deadline)
+            return await self._attempt(client, method, url, **kwargs)
+
+        try:
+            async with asyncio.timeout(self._policy.deadline):
+                return await hedged(
+                    lambda: self._attempt(client, method, url, **kwargs), self._policy.hedge_delay(), hedge
+                )
+        except TimeoutError as exc:
+            upstream_errors.inc(upstream=self._scheduler.name, reason="deadline")
+            err_msg = f"{self._scheduler.name} did not respond within {self._policy.deadline}s"
+            raise self.UpstreamTimeoutError(err_msg) from exc
+
+    async def _request(self, method: str, url: str, **kwargs) -> Response:
+        """
+        Sends a request through the rate limit scheduler and circuit breaker
+
+        Raises CircuitOpenError without sending anything while the upstream's circuit is open, RateLimitedError if
+        the request stays rate limited or the upstream is paused for longer than it may wait, and UpstreamError if it
+        fails or misses its deadline.
+        """
+        breaker = self._policy.breaker
+        call = breaker.allow()
+        if call is None:
+            err_msg = f"{self._scheduler.name} is failing, requests to it are paused"
+            raise self.CircuitOpenError(err_msg, retry_after=breaker.retry_after)
+
+        client = self._get_httpx_client(url)
+        try:
+            response = await self._scheduler.request(
+                lambda: self._send(client, method, url, **kwargs), max_wait=self._policy.deadline
+            )
+        except UpstreamScheduler.PausedError as exc:
+            # nothing was sent, or what was got a 429, neither says anything about the upstream's health
+            breaker.release(call)
+            raise self.RateLimitedError(str(exc), retry_after=exc.retry_after) from exc
+        except HTTPError as exc:
+            breaker.record_failure(call)
+            err_msg = f"{self._scheduler.name} request failed: {exc!r}"
+            raise self.UpstreamError(err_msg) from exc
+        except self.UpstreamError:
+            breaker.record_failure(call)
+            raise
+        except BaseException:
+            # cancelled, the upstream didn't get a chance to succeed or fail
+            breaker.release(call)
+            raise
+        # 4xxs (including 429s) are about the request, only server errors count against the upstream
+        if response.status_code >= HTTPStatus.INTERNAL_SERVER_ERROR:
+            breaker.record_failure(call)
+        else:
+            breaker.record_success(call)
+
+        if response.status_code == HTTPStatus.TOO_MANY_REQUESTS:
+            err_msg = f"{self._scheduler.name} is rate limiting requests"
+            raise self.RateLimitedError(err_msg, retry_after=self._scheduler.retry_after)
+        return response
 
 
 class DiscogsLookupService(HttpxService):
     DISCOGS_SEARCH_URL = "https://api.discogs.com/database/search"
+    SCHEDULER = discogs_scheduler
+    POLICY = discogs_policy
 
     @cached_property
     def headers(self):
@@ -93,61 +537,138 @@ class DiscogsLookupService(HttpxService):
             "User-Agent": "HomeBarcodeAPI/0.1 +https://github.com/andrewthetechie/home-barcode-api",
         }
 
+    @timed("discogs")
     async def search(self, barcode: str) -> list[DiscogsAlbum]:
         this_search_url = f"{self.DISCOGS_SEARCH_URL}?barcode={barcode}"
-        async with self._get_httpx_client() as client:
-            response = await client.get(this_search_url, headers=self.headers)
+        response = await self._request("GET", this_search_url, headers=self.headers)
+        if response.status_code != HTTPStatus.OK:
+            self._logger.error("Error searching discogs %s %s", response.status_code, response.text)
+            err_msg = f"Discogs API request failed with status code {response.status_code}"
+            raise self.UpstreamError(err_msg)
         data = response.json()
         albums = data["results"]
         return [DiscogsAlbum.from_api_result(discog_result) for discog_result in albums]
 
 
+class SpotifyTokenManager:
+    """
+    Process wide cache of the Spotify client credentials access token
+
+    The token is kept until the expires_in spotify returned with it. Once it is within refresh_margin seconds of
+    expiring the current token is still handed out while a single background refresh fetches a new one. If there
+    is no usable token, every caller awaits the same in-flight refresh instead of each hitting the auth endpoint.
+    """
+
+    def __init__(self) -> None:
+        self._token: str | None = None
+        self._expires_at: float = 0.0
+        self._refresh_task: asyncio.Task | None = None
+
+    async def get_token(self, fetch: Callable[[], Awaitable[tuple[str, int]]], refresh_margin: float = 60.0) -> str:
+        """
+        Returns a valid token, using fetch to get a new (token, expires_in) pair from spotify when needed
+        """
+        now = time.monotonic()
+        if self._token is not None and now < self._expires_at:
+            if now >= self._expires_at - refresh_margin:
+                self._start_refresh(fetch)
+            return self._token
+        # shield so one cancelled request doesn't cancel the refresh other requests are waiting on
+        return await asyncio.shield(self._start_refresh(fetch))
+
+    def invalidate(self, token: str | None = None) -> None:
+        """Drops the cached token. If token is passed, only drop it if it is still the cached one"""
+        if token is None or token == self._token:
+            self._token = None
+            self._expires_at = 0.0
+
+    def _start_refresh(self, fetch: Callable[[], Awaitable[tuple[str, int]]]) -> asyncio.Task:
+        if self._refresh_task is None or self._refresh_task.done():
+            self._refresh_task = asyncio.create_task(self._refresh(fetch))
+            self._refresh_task.add_done_callback(self._on_refresh_done)
+        return self._refresh_task
+
+    async def _refresh(self, fetch: Callable[[], Awaitable[tuple[str, int]]]) -> str:
+        token, expires_in = await fetch()
+        self._token = token
+        self._expires_at = time.monotonic() + expires_in
+        return token
+
+    @staticmethod
+    def _on_refresh_done(task: asyncio.Task) -> None:
+        # background refreshes may have no one awaiting them, mark the exception as retrieved
+        # the failure is already logged by the fetch function and the next get_token will retry
+        if not task.cancelled():
+            task.exception()
+
+
+spotify_token_manager = SpotifyTokenManager()
+
+
 class SpotifyLookupService(HttpxService):
     SPOTIFY_AUTH_URL = "https://accounts.spotify.com/api/token"
     SPOTIFY_SEARCH_URL = "https://api.spotify.com/v1/search"
+    SCHEDULER = spotify_scheduler
+    POLICY = spotify_policy
 
-    def __init__(self, config: Config, logger: Logger, httpx_client_config: dict[str, Any] | None = None) -> None:
-        super().__init__(config, logger, httpx_client_config)
-        self.__token: str | None = None
+    def __init__(  # noqa: PLR0913
+        self,
+        config: Config,
+        logger: Logger,
+        http_client_manager: HttpClientManager | None = None,
+        scheduler: UpstreamScheduler | None = None,
+        *,
+        policy: UpstreamPolicy | None = None,
+        token_manager: SpotifyTokenManager | None = None,
+    ) -> None:
+        super().__init__(config, logger, http_client_manager, scheduler, policy=policy)
+        self._token_manager = token_manager if token_manager is not None else spotify_token_manager
 
     @async_property
     async def token(self):
-        if self.__token is None:
-            self.__token = await self.get_spotify_token(
-                self._config.spotify_client_id, self._config.spotify_client_secret
-            )
-        return self.__token
+        return await self._token_manager.get_token(
+            self._fetch_token, refresh_margin=self._config.spotify_token_refresh_margin
+        )
 
-    async def get_spotify_token(self, client_id, client_secret):
-        # Function to get Spotify access token
+    async def _fetch_token(self) -> tuple[str, int]:
+        return await self.get_spotify_token(self._config.spotify_client_id, self._config.spotify_client_secret)
+
+    async def get_spotify_token(self, client_id, client_secret) -> tuple[str, int]:
+        # Function to get Spotify access token and the number of seconds it is valid for
         headers = {}
         data = {
             "grant_type": "client_credentials",
             "client_id": client_id,
             "client_secret": client_secret,
         }
-        async with self._get_httpx_client() as client:
-            response = await client.post(self.SPOTIFY_AUTH_URL, headers=headers, data=data)
+        response = await self._request("POST", self.SPOTIFY_AUTH_URL, headers=headers, data=data)
         if response.status_code == HTTPStatus.OK:
-            return response.json()["access_token"]
+            token_data = response.json()
+            return token_data["access_token"], token_data.get("expires_in", 3600)
         else:
-            self._logger.error("Error getting spotify token %s %s", response.status_code, response.json())
+            self._logger.error("Error getting spotify token %s %s", response.status_code, response.text)
             exception_msg = "Failed to get Spotify token"
-            raise Exception(exception_msg)
+            raise self.UpstreamError(exception_msg)
+
+    async def _search(self, token: str, params: dict[str, Any]) -> Response:
+        return await self._request(
+            "GET", self.SPOTIFY_SEARCH_URL, headers={"Authorization": f"Bearer {token}"}, params=params
+        )
 
+    @timed("spotify")
     async def get_album_id(self, artist_name, album_name):
         # Function to search for the album by artist and album name
-
-        headers = {
-            "Authorization": f"Bearer {await self.token}",
-        }
         params = {
             "q": f"album:{album_name} artist:{artist_name}",
             "type": "album",
             "limit": 1,  # We just want the first match
         }
-        async with self._get_httpx_client() as client:
-            response = await client.get(self.SPOTIFY_SEARCH_URL, headers=headers, params=params)
+        token = await self.token
+        response = await self._search(token, params)
+        if response.status_code == HTTPStatus.UNAUTHORIZED:
+            # token was revoked or expired early, get a fresh one and retry once
+            self._token_manager.invalidate(token)
+            response = await self._search(await self.token, params)
 
         if response.status_code == HTTPStatus.OK:
             albums = response.json().get("albums", {}).get("items", [])
@@ -157,6 +678,6 @@ class SpotifyLookupService(HttpxService):
             else:
                 return None  # No album found
         else:
-            self._logger.error("Error getting album ID %s %s", response.status_code, response.json())
+            self._logger.error("Error getting album ID %s %s", response.status_code, response.text)
             err_msg = f"Spotify API request failed with status code {response.status_code}"
-            raise Exception(err_msg)
+            raise self.UpstreamError(err_msg)
@@ -0,0 +1,364 @@
+import asyncio
+import contextlib
+import uuid
+import weakref
+from contextlib import asynccontextmanager
+from datetime import datetime, timedelta
+from http import HTTPStatus
+from logging import Logger
+
+import structlog
+from fastapi import FastAPI
+from sqlalchemy import ColumnElement, delete, func, select, update
+from sqlalchemy.ext.asyncio import AsyncSession
+
+from barcode_api.core.cache import LRUCache
+from barcode_api.core.config import Config, get_config
+from barcode_api.core.database import sessionmanager
+from barcode_api.core.errors import BarcodeAPIBaseException
+from barcode_api.core.metrics import StatsCollector, registry
+from barcode_api.core.ratelimit import Priority, upstream_priority
+from barcode_api.core.singleflight import SingleFlight
+from barcode_api.models import Album, LookupJob, LookupJobStatus
+from barcode_api.services._base import BarcodeServiceBase
+from barcode_api.services.album_service import AlbumService, HttpxService
+
+ACTIVE_STATUSES = (LookupJobStatus.pending, LookupJobStatus.running)
+# seconds between deletes of finished jobs older than lookup_job_ttl
+PRUNE_INTERVAL = 3600
+
+
+class LookupJobWorkers:
+    """
+    Runs lookup jobs in the background, at most concurrency at a time
+
+    Jobs live in the database, the queue only holds their ids, and a worker runs a job only if it is the one that
+    moves it from pending to running. On start every pending job is queued, so jobs survive restarts. A job still
+    running after lease seconds was lost with the process running it, it is put back to pending and queued again.
+    Jobs whose upstream is rate limited or has an open circuit go back to pending and are queued again once it should
+    be available, up to max_attempts times.
+    """
+
+    def __init__(self, concurrency: int, max_pending: int, max_attempts: int, lease: float):
+        self.concurrency = concurrency
+        self.max_pending = max_pending
+        self.max_attempts = max_attempts
+        self.lease = lease
+        self._queue: asyncio.Queue[str] = asyncio.Queue()
+        self._workers: list[asyncio.Task] = []
+        self._retries: dict[str, asyncio.TimerHandle] = dict()
+        # job id -> set when the job finishes in this process, held only as long as a long poll is waiting on it
+        self._finished: weakref.WeakValueDictionary[str, asyncio.Event] = weakref.WeakValueDictionary()
+        self._logger = structlog.stdlib.get_logger("app")
+        # ids of the jobs this process's workers are running
+        self._running_jobs: set[str] = set()
+        self.running = 0
+        self.succeeded = 0
+        self.failed = 0
+        self.retried = 0
+
+    @property
+    def full(self) -> bool:
+        return self._queue.qsize() >= self.max_pending
+
+    def submit(self, job_id: str) -> None:
+        self._retries.pop(job_id, None)
+        self._queue.put_nowait(job_id)
+
+    def finished(self, job_id: str) -> asyncio.Event:
+        """
+        An event set when the job finishes in this process, registered for as long as the caller holds on to it. Jobs
+        finished elsewhere are seen when the caller reads the job again
+        """
+        event = self._finished.get(job_id)
+        if event is None:
+            event = self._finished[job_id] = asyncio.Event()
+        return event
+
+    async def start(self, config: Config) -> None:
+        async with sessionmanager.session() as db_session:
+            service = LookupJobService(config, self._logger, db_session)
+            for job_id in await service.requeue():
+                self.submit(job_id)
+        self._workers = [asyncio.create_task(self._work(config)) for _ in range(self.concurrency)]
+        self._workers.append(asyncio.create_task(self._prune(config)))
+        self._workers.append(asyncio.create_task(self._reclaim(config)))
+
+    async def close(self, config: Config) -> None:
+        """Stops the workers, jobs they were running go back to pending and are picked up again on the next start"""
+        for handle in self._retries.values():
+            handle.cancel()
+        self._retries.clear()
+        interrupted = list(self._running_jobs)
+        for task in self._workers:
+            task.cancel()
+        await asyncio.gather(*self._workers, return_exceptions=True)
+        self._workers.clear()
+        self._queue = asyncio.Queue()
+        if interrupted:
+            async with sessionmanager.session() as db_session:
+                await LookupJobService(config, self._logger, db_session).release(interrupted)
+
+    def stats(self) -> dict[str, int]:
+        return {
+            "queued": self._queue.qsize(),
+            "retrying": len(self._retries),
+            "running": self.running,
+            "succeeded": self.succeeded,
+            "failed": self.failed,
+            "retried": self.retried,
+        }
+
+    async def _work(self, config: Config) -> None:
+        upstream_priority.set(Priority.BACKGROUND)
+        while True:
+            job_id = await self._queue.get()
+            self.running += 1
+            try:
+                await self._run(config, job_id)
+            except Exception:
+                self._logger.exception("Lookup job failed", job_id=job_id)
+            finally:
+                self.running -= 1
+
+    async def _run(self, config: Config, job_id: str) -> None:
+        async with sessionmanager.session() as db_session:
+            service = LookupJobService(config, self._logger, db_session)
+            job = await service.start(job_id)
+            if job is None:
+                return
+            self._running_jobs.add(job_id)
+            try:
+                album = await AlbumService(config, self._logger, db_session).search(job.barcode)
+            except HttpxService.UnavailableError as exc:
+                if job.attempts < self.max_attempts:
+                    await service.finish(job, status=LookupJobStatus.pending)
+                    self._retry(job_id, exc.retry_after)
+                    return
+                await service.finish(job, HTTPStatus.SERVICE_UNAVAILABLE, str(exc))
+            except AlbumService.NotFoundError as exc:
+                await service.finish(job, HTTPStatus.NOT_FOUND, str(exc))
+            except HttpxService.UpstreamError as exc:
+                await service.finish(job, HTTPStatus.BAD_GATEWAY, str(exc))
+            except Exception:
+                self._logger.exception("Lookup job failed", job_id=job_id, barcode=job.barcode)
+                await service.finish(job, HTTPStatus.INTERNAL_SERVER_ERROR, "Internal Server Error")
+            else:
+                await service.finish(job, HTTPStatus.OK, album=album)
+            finally:
+                self._running_jobs.discard(job_id)
+        if job.status == LookupJobStatus.succeeded:
+            self.succeeded += 1
+        else:
+            self.failed += 1
+        self._notify(job_id)
+
+    def _notify(self, job_id: str) -> None:
+        if (event := self._finished.pop(job_id, None)) is not None:
+            event.set()
+
+    def _retry(self, job_id: str, delay: float) -> None:
+        self.retried += 1
+        self._retries[job_id] = asyncio.get_running_loop().call_later(delay, self.submit, job_id)
+
+    async def _prune(self, config: Config) -> None:
+        while True:
+            try:
+                async with sessionmanager.session() as db_session:
+                    await LookupJobService(config, self._logger, db_session).prune()
+            except Exception:
+                self._logger.exception("Pruning finished lookup jobs failed")
+            await asyncio.sleep(PRUNE_INTERVAL)
+
+    async def _reclaim(self, config: Config) -> None:
+        while True:
+            await asyncio.sleep(self.lease)
+            try:
+                async with sessionmanager.session() as db_session:
+                    job_ids = await LookupJobService(config, self._logger, db_session).reclaim(self.lease)
+            except Exception:
+                self._logger.exception("Reclaiming lost lookup jobs failed")
+                continue
+            for job_id in job_ids:
+                self.submit(job_id)
+
+
+class LookupJobService(BarcodeServiceBase):
+    class NotFoundError(BarcodeAPIBaseException):
+        pass
+
+    class QueueFullError(BarcodeAPIBaseException):
+        pass
+
+    MODEL = LookupJob
+    # shared by every LookupJobService instance in the process, so concurrent requests get the same job
+    _creates = SingleFlight()
+
+    def __init__(
+        self,
+        config: Config,
+        logger: Logger,
+        db_session: AsyncSession,
+        cache: LRUCache | None = None,
+        workers: LookupJobWorkers | None = None,
+    ) -> None:
+        super().__init__(config, logger, db_session, cache)
+        self._workers = workers if workers is not None else lookup_job_workers
+
+    async def get(self, job_id: str) -> LookupJob:
+        async with self._db_lock, self._db_session.begin():
+            job = await self._db_session.get(LookupJob, job_id, populate_existing=True)
+        if job is None:
+            err_msg = f"No lookup job {job_id}"
+            raise self.NotFoundError(err_msg)
+        return job
+
+    async def wait(self, job_id: str, max_wait: float) -> LookupJob:
+        """Returns the job once it has finished, or after max_wait seconds if it hasn't"""
+        # registered before the job is read, so a job finishing in between isn't missed
+        finished = self._workers.finished(job_id)
+        job = await self.get(job_id)
+        if job.status in ACTIVE_STATUSES and max_wait > 0:
+            with contextlib.suppress(TimeoutError):
+                await asyncio.wait_for(finished.wait(), max_wait)
+            job = await self.get(job_id)
+        return job
+
+    async def album(self, job: LookupJob) -> Album | None:
+        """The album a succeeded job found"""
+        if job.status != LookupJobStatus.succeeded:
+            return None
+        # by barcode, not album_id, the album may still be in the write behind buffer without an id
+        return await self._get_fom_cache(value=job.barcode, model=Album)
+
+    async def create(self, barcode: str) -> LookupJob:
+        """Queues a lookup of barcode, or returns the job already looking it up"""
+        return await self._creates.do(barcode, lambda: self._create(barcode))
+
+    async def _create(self, barcode: str) -> LookupJob:
+        statement = select(LookupJob).where(LookupJob.barcode == barcode, LookupJob.status.in_(ACTIVE_STATUSES))
+        async with self._db_lock, self._db_session.begin():
+            job = await self._db_session.scalar(statement.limit(1))
+            if job is not None:
+                return job
+            if self._workers.full:
+                err_msg = "Too many lookup jobs are waiting, try again later"
+                raise self.QueueFullError(err_msg)
+            job = LookupJob(id=uuid.uuid4().hex, barcode=barcode)
+            self._db_session.add(job)
+        self._workers.submit(job.id)
+        return job
+
+    async def start(self, job_id: str) -> LookupJob | None:
+        """
+        Marks a pending job as running, returns None if it isn't pending any more. Of workers in any process starting
+        the same job only one gets it
+        """
+        async with self._db_lock, self._db_session.begin():
+            result = await self._db_session.execute(
+                update(LookupJob)
+                .where(LookupJob.id == job_id, LookupJob.status == LookupJobStatus.pending)
+                .values(status=LookupJobStatus.running, attempts=LookupJob.attempts + 1)
+                .execution_options(synchronize_session=False)
+            )
+            if result.rowcount != 1:
+                return None
+            return await self._db_session.get(LookupJob, job_id, populate_existing=True)
+
+    async def finish(
+        self,
+        job: LookupJob,
+        status_code: int | None = None,
+        error: str | None = None,
+        *,
+        album: Album | None = None,
+        status: LookupJobStatus | None = None,
+    ) -> None:
+        """
+        Records a job's result, on a job loaded by this service's session. Its status is succeeded for a 200 and
+        failed otherwise, unless status is given
+        """
+        if status is None:
+            status = LookupJobStatus.succeeded if status_code == HTTPStatus.OK else LookupJobStatus.failed
+        async with self._db_lock, self._db_session.begin():
+            job.status = status
+            job.status_code = status_code
+            job.error = error
+            job.album_id = None if album is None else album.id
+
+    async def requeue(self) -> list[str]:
+        """
+        Resets jobs running for longer than lookup_job_lease to pending, returns every pending job's id, oldest
+        first. Jobs running for less may belong to another process that is still running them
+        """
+        await self.reclaim(self._config.lookup_job_lease)
+        statement = select(LookupJob.id).where(LookupJob.status == LookupJobStatus.pending).order_by(LookupJob.created)
+        async with self._db_lock, self._db_session.begin():
+            return list(await self._db_session.scalars(statement))
+
+    def _seconds_ago(self, seconds: float) -> ColumnElement[datetime]:
+        """
+        The database's time, seconds ago. Jobs' last_update is set by the database with func.now(), so cutoffs
+        for it are worked out by the database too, in whatever time zone it uses
+        """
+        if self._db_session.bind.dialect.name == "sqlite":
+            # sqlite's now is UTC, in the same format as its CURRENT_TIMESTAMP
+            return func.datetime("now", f"-{seconds} seconds")
+        return func.now() - timedelta(seconds=seconds)
+
+    async def release(self, job_ids: list[str]) -> None:
+        """Puts jobs that were interrupted while running back to pending, the interrupted attempt doesn't count"""
+        async with self._db_lock, self._db_session.begin():
+            await self._db_session.execute(
+                update(LookupJob)
+                .where(LookupJob.id.in_(job_ids), LookupJob.status == LookupJobStatus.running)
+                .values(status=LookupJobStatus.pending, attempts=LookupJob.attempts - 1)
+                .execution_options(synchronize_session=False)
+            )
+
+    async def reclaim(self, lease: float) -> list[str]:
+        """Resets jobs that have been running for more than lease seconds to pending, returns their ids"""
+        cutoff = self._seconds_ago(lease)
+        async with self._db_lock, self._db_session.begin():
+            return list(
+                await self._db_session.scalars(
+                    update(LookupJob)
+                    .where(LookupJob.status == LookupJobStatus.running, LookupJob.last_update < cutoff)
+                    .values(status=LookupJobStatus.pending)
+                    .returning(LookupJob.id)
+                    .execution_options(synchronize_session=False)
+                )
+            )
+
+    async def prune(self) -> None:
+        """Deletes finished jobs older than lookup_job_ttl"""
+        cutoff = self._seconds_ago(self._config.lookup_job_ttl)
+        async with self._db_lock, self._db_session.begin():
+            await self._db_session.execute(
+                delete(LookupJob).where(LookupJob.status.not_in(ACTIVE_STATUSES), LookupJob.last_update < cutoff)
+            )
+
+
+config: Config = get_config()
+lookup_job_workers = LookupJobWorkers(
+    config.lookup_job_workers, config.lookup_job_max_pending, config.lookup_job_max_attempts, config.lookup_job_lease
+)
+registry.register(
+    StatsCollector(
+        "barcode_api_lookup_jobs",
+        "Lookup job workers",
+        "workers",
+        {"lookup": lookup_job_workers.stats},
+        counters=("succeeded", "failed", "retried"),
+    )
+)
+
+
+@asynccontextmanager
+async def lookup_jobs_lifespan(app: FastAPI):
+    """
+    Starts the lookup job workers, queueing any jobs left over from the last run, and stops them on shutdown
+    """
+    await lookup_job_workers.start(config)
+    yield
+    await lookup_job_workers.close(config)
@@ -0,0 +1,170 @@
+import asyncio
+import contextlib
+import hashlib
+import hmac
+import secrets
+from contextlib import asynccontextmanager
+from datetime import UTC, datetime, timedelta
+from logging import Logger
+
+import structlog
+from fastapi import FastAPI
+from sqlalchemy import select
+from sqlalchemy.ext.asyncio import AsyncSession
+
+from barcode_api.core.cache import LRUCache, token_cache
+from barcode_api.core.config import Config, get_config
+from barcode_api.core.database import sessionmanager
+from barcode_api.core.errors import BarcodeAPIBaseException
+from barcode_api.core.singleflight import SingleFlight
+from barcode_api.models import Token
+from barcode_api.services._base import BarcodeServiceBase
+
+HASH_ALGORITHM = "sha256"
+# bytes of randomness in a token's secret
+SECRET_BYTES = 32
+# token ids are 64 bit integers, anything bigger can't be a token and overflows the driver
+MAX_TOKEN_ID = 2**63 - 1
+
+
+def hash_secret(secret: str) -> str:
+    """
+    Hashes a token's secret for storage, as algorithm$hash. Secrets are SECRET_BYTES of randomness, they can't be
+    guessed, so a fast unsalted hash is enough and checking one costs nothing but the row read
+    """
+    return f"{HASH_ALGORITHM}${hashlib.sha256(secret.encode()).hexdigest()}"
+
+
+def verify_secret(secret: str, hashed: str) -> bool:
+    algorithm, _, expected = hashed.partition("$")
+    if algorithm != HASH_ALGORITHM:
+        return False
+    return hmac.compare_digest(hashlib.sha256(secret.encode()).hexdigest(), expected)
+
+
+def token_digest(token: str) -> bytes:
+    """The key a verified token is cached under"""
+    return hashlib.sha256(token.encode()).digest()
+
+
+def utcnow() -> datetime:
+    # timestamps are stored as naive UTC
+    return datetime.now(UTC).replace(tzinfo=None)
+
+
+class TokenService(BarcodeServiceBase):
+    """
+    Creates, revokes and verifies api tokens
+
+    A token is {id}.{secret}, only a sha256 of the secret is stored. Tokens that verify are cached by a sha256 of
+    the token for auth_cache_ttl seconds, so requests with them skip the database. Revoking a token
+    drops it from this process's cache right away, other processes drop it within auth_revocation_poll seconds.
+    """
+
+    class NotFoundError(BarcodeAPIBaseException):
+        pass
+
+    MODEL = Token
+    # shared by every TokenService instance in the process, so a burst of requests with a new token reads it once
+    _verifies = SingleFlight()
+
+    def __init__(
+        self,
+        config: Config,
+        logger: Logger,
+        db_session: AsyncSession,
+        cache: LRUCache | None = None,
+        verified: LRUCache | None = None,
+    ) -> None:
+        super().__init__(config, logger, db_session, cache)
+        self._verified = verified if verified is not None else token_cache
+
+    async def create(self, notes: str) -> tuple[Token, str]:
+        """Creates a token, returns it and the token to hand out, which can't be recovered later"""
+        secret = secrets.token_urlsafe(SECRET_BYTES)
+        token = Token(hashed_token=hash_secret(secret), notes=notes)
+        async with self._db_lock, self._db_session.begin():
+            self._db_session.add(token)
+        return token, f"{token.id}.{secret}"
+
+    async def all(self) -> list[Token]:
+        async with self._db_lock, self._db_session.begin():
+            return list(await self._db_session.scalars(select(Token).order_by(Token.id)))
+
+    async def revoke(self, token_id: int) -> Token:
+        async with self._db_lock, self._db_session.begin():
+            token = await self._db_session.get(Token, token_id)
+            if token is None:
+                err_msg = f"No api token {token_id}"
+                raise self.NotFoundError(err_msg)
+            if token.revoked_at is None:
+                token.revoked_at = utcnow()
+        self._verified.invalidate_values(lambda verified_id: verified_id == token_id)
+        return token
+
+    async def revoked_since(self, since: datetime) -> list[int]:
+        statement = select(Token.id).where(Token.revoked_at >= since)
+        async with self._db_lock, self._db_session.begin():
+            return list(await self._db_session.scalars(statement))
+
+    async def verify(self, token: str) -> int | None:
+        """
+        The id of token if it is a valid token that hasn't been revoked, checked against the database and cached if
+        it is. Callers check the cache first, see barcode_api.core.dependencies.auth
+        """
+        digest = token_digest(token)
+        return await self._verifies.do(digest, lambda: self._verify(token, digest))
+
+    async def _verify(self, token: str, digest: bytes) -> int | None:
+        token_id, _, secret = token.partition(".")
+        if not token_id.isascii() or not token_id.isdigit() or not secret:
+            return None
+        # checking the length first keeps int() away from absurdly long ids
+        if len(token_id) > len(str(MAX_TOKEN_ID)) or int(token_id) > MAX_TOKEN_ID:
+            return None
+        async with self._db_lock, self._db_session.begin():
+            row = await self._db_session.get(Token, int(token_id))
+        if row is None or row.revoked_at is not None:
+            return None
+        if not verify_secret(secret, row.hashed_token):
+            return None
+        self._verified.set(digest, row.id)
+        return row.id
+
+
+async def poll_revocations(config: Config, verified: LRUCache) -> None:
+    """Drops tokens revoked by any process from verified, checking every auth_revocation_poll seconds"""
+    logger = structlog.stdlib.get_logger("app")
+    checked = utcnow()
+    while True:
+        await asyncio.sleep(config.auth_revocation_poll)
+        started = utcnow()
+        try:
+            async with sessionmanager.session() as db_session:
+                # overlap the last check by a poll interval, for clock differences between processes
+                since = checked - timedelta(seconds=config.auth_revocation_poll)
+                revoked = set(await TokenService(config, logger, db_session).revoked_since(since))
+        except Exception:
+            logger.exception("Checking for revoked api tokens failed")
+            continue
+        if revoked:
+            verified.invalidate_values(revoked.__contains__)
+        checked = started
+
+
+config: Config = get_config()
+
+
+@asynccontextmanager
+async def token_auth_lifespan(app: FastAPI):
+    """
+    Checks for revoked api tokens in the background while auth is enabled
+    """
+    if not config.auth_enabled:
+        yield
+        return
+    poller = asyncio.create_task(poll_revocations(config, token_cache))
+    yield
+    poller.cancel()
+    with contextlib.suppress(asyncio.CancelledError):
+        await poller
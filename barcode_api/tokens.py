@@ -0,0 +1,77 @@
+"""
+Manages api tokens
+
+Tokens are only checked when the api runs with ba_auth_enabled set. A created token is printed once, only a hash of
+it is stored. A revoked token stops working in this database's api processes within ba_auth_revocation_poll seconds.
+
+    barcode-token create "kitchen scanner"
+    barcode-token list
+    barcode-token revoke 3
+"""
+
+import argparse
+import asyncio
+import sys
+
+import structlog
+
+from barcode_api.core.config import Config, get_config
+from barcode_api.core.database import sessionmanager
+from barcode_api.core.logging import configure_logger
+from barcode_api.services import TokenService
+
+
+async def create(config: Config, notes: str) -> None:
+    async with sessionmanager.session() as db_session:
+        token, secret = await TokenService(config, structlog.stdlib.get_logger("app"), db_session).create(notes)
+    print(f"Created token {token.id}, it won't be shown again:", file=sys.stderr)
+    print(secret)
+
+
+async def list_tokens(config: Config) -> None:
+    async with sessionmanager.session() as db_session:
+        tokens = await TokenService(config, structlog.stdlib.get_logger("app"), db_session).all()
+    for token in tokens:
+        revoked = f"revoked {token.revoked_at:%Y-%m-%d %H:%M:%S}" if token.revoked_at is not None else "active"
+        print(f"{token.id}\t{token.created:%Y-%m-%d %H:%M:%S}\t{revoked}\t{token.notes}")
+
+
+async def revoke(config: Config, token_id: int) -> None:
+    async with sessionmanager.session() as db_session:
+        await TokenService(config, structlog.stdlib.get_logger("app"), db_session).revoke(token_id)
+    print(f"Revoked token {token_id}", file=sys.stderr)
+
+
+async def run(config: Config, args: argparse.Namespace) -> None:
+    try:
+        if args.command == "create":
+            await create(config, args.notes)
+        elif args.command == "list":
+            await list_tokens(config)
+        else:
+            await revoke(config, args.token_id)
+    finally:
+        await sessionmanager.close()
+
+
+def main() -> None:
+    config = get_config()
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    commands = parser.add_subparsers(dest="command", required=True)
+    create_parser = commands.add_parser("create", help="create a token and print it")
+    create_parser.add_argument("notes", help="what the token is for")
+    commands.add_parser("list", help="list tokens, without their secrets")
+    revoke_parser = commands.add_parser("revoke", help="revoke a token by id")
+    revoke_parser.add_argument("token_id", type=int)
+    args = parser.parse_args()
+
+    configure_logger(enable_json_logs=config.log_json, log_level=config.log_level.value.upper())
+    try:
+        asyncio.run(run(config, args))
+    except TokenService.NotFoundError as exc:
+        print(exc, file=sys.stderr)
+        sys.exit(1)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,238 @@
+"""
+Warms the album cache from a list of barcodes
+
+Reads one barcode per line from a file, or stdin, skips barcodes already cached, and looks the rest up on Discogs and
+Spotify with at most --concurrency lookups at a time. Lookups go through the same rate limit schedulers the api uses,
+but those limits are per process, lower them with the ba_*_requests_per_minute settings if the api is running at the
+same time.
+
+Results are written in batches of --batch-size. Every barcode that was written, or could not be found, is appended to
+a checkpoint file after its batch is committed, so an interrupted run picks up where it stopped when started again.
+Barcodes that failed, because of an upstream error or anything else, are not checkpointed and are retried on the next
+run. Lookups run at background priority, they wait out an upstream's 429 pauses rather than failing.
+
+    barcode-warmup barcodes.txt --concurrency 4
+    cat barcodes.txt | barcode-warmup - --checkpoint barcodes.checkpoint
+"""
+
+import argparse
+import asyncio
+import sys
+import time
+from collections.abc import Iterable
+from pathlib import Path
+from typing import TextIO
+
+import structlog
+from sqlalchemy import select
+
+from barcode_api.core.config import Config, get_config
+from barcode_api.core.database import sessionmanager
+from barcode_api.core.http_client import httpclientmanager
+from barcode_api.core.logging import configure_logger
+from barcode_api.core.ratelimit import Priority, upstream_priority
+from barcode_api.models import Album, AlbumLookupMiss
+from barcode_api.services import AlbumService
+from barcode_api.services.album_service import HttpxService
+
+# barcodes per IN query when checking which are already cached
+EXISTING_CHUNK_SIZE = 500
+
+
+def read_barcodes(source: TextIO) -> list[str]:
+    """Barcodes in source in order, without duplicates, blank lines or # comments"""
+    barcodes = (line.split("#", 1)[0].strip() for line in source)
+    return list(dict.fromkeys(barcode for barcode in barcodes if barcode))
+
+
+def read_checkpoint(path: Path) -> set[str]:
+    if not path.exists():
+        return set()
+    with path.open(encoding="utf-8") as checkpoint:
+        return {line.split("\t", 1)[0] for line in checkpoint if line.strip()}
+
+
+class Progress:
+    """Prints throughput and an ETA to stderr, at most once every interval seconds"""
+
+    def __init__(self, total: int, interval: float = 5.0, output: TextIO = sys.stderr):
+        self.total = total
+        self.interval = interval
+        self.output = output
+        self.counts = {"cached": 0, "not_found": 0, "failed": 0}
+        self._started = time.monotonic()
+        self._last_report = 0.0
+
+    @property
+    def done(self) -> int:
+        return sum(self.counts.values())
+
+    def add(self, result: str) -> None:
+        self.counts[result] += 1
+        if time.monotonic() - self._last_report >= self.interval:
+            self.report()
+
+    def report(self) -> None:
+        self._last_report = time.monotonic()
+        elapsed = self._last_report - self._started
+        rate = self.done / elapsed if elapsed > 0 else 0.0
+        eta = f"{(self.total - self.done) / rate:.0f}s" if rate > 0 else "unknown"
+        counts = " ".join(f"{result}={count}" for result, count in self.counts.items())
+        print(
+            f"{self.done}/{self.total} {counts} {rate:.2f} barcodes/s eta {eta}",
+            file=self.output,
+            flush=True,
+        )
+
+
+class Warmup:
+    def __init__(
+        self,
+        service: AlbumService,
+        checkpoint: TextIO,
+        progress: Progress,
+        *,
+        concurrency: int,
+        batch_size: int,
+    ):
+        self.service = service
+        self.checkpoint = checkpoint
+        self.progress = progress
+        self.concurrency = concurrency
+        self.batch_size = batch_size
+        self._albums: list[Album] = []
+        self._misses: list[tuple[str, AlbumService.NotFoundError]] = []
+        self._flush_lock = asyncio.Lock()
+
+    async def existing(self, barcodes: list[str]) -> set[str]:
+        """The barcodes that are already in the albums table"""
+        existing = set()
+        session = self.service._db_session
+        for start in range(0, len(barcodes), EXISTING_CHUNK_SIZE):
+            chunk = barcodes[start : start + EXISTING_CHUNK_SIZE]
+            async with session.begin():
+                existing.update(await session.scalars(select(Album.barcode).where(Album.barcode.in_(chunk))))
+        return existing
+
+    async def run(self, barcodes: Iterable[str]) -> None:
+        pending = iter(barcodes)
+
+        async def worker() -> None:
+            # waits out upstream pauses and yields to interactive lookups, each worker is its own task
+            upstream_priority.set(Priority.BACKGROUND)
+            # the iterator is shared, each barcode is taken by exactly one worker
+            for barcode in pending:
+                await self.lookup(barcode)
+
+        await asyncio.gather(*(worker() for _ in range(self.concurrency)))
+        await self.flush()
+        self.progress.report()
+
+    async def lookup(self, barcode: str) -> None:
+        try:
+            album = await self.service._lookup_album(barcode)
+        except (AlbumService.NoDiscogsAlbumFoundError, AlbumService.NoSpotifyFoundError) as exc:
+            self._misses.append((barcode, exc))
+        except HttpxService.UpstreamError as exc:
+            self.service._logger.warning("Looking up %s failed, it will be retried on the next run: %s", barcode, exc)
+            self.progress.add("failed")
+            return
+        except Exception:
+            self.service._logger.exception("Error looking up barcode %s, it will be retried on the next run", barcode)
+            self.progress.add("failed")
+            return
+        else:
+            self._albums.append(album)
+        if len(self._albums) + len(self._misses) >= self.batch_size:
+            await self.flush()
+
+    async def flush(self) -> None:
+        """Writes the buffered results in one transaction per table, then checkpoints them"""
+        async with self._flush_lock:
+            albums, self._albums = self._albums, []
+            misses, self._misses = self._misses, []
+            if albums:
+                await self.service._add_many_to_cache(albums)
+            if misses and self.service._config.negative_cache_ttl > 0:
+                rows = [
+                    self.service._row_values(AlbumLookupMiss(barcode=barcode, stage=exc.STAGE, detail=str(exc)))
+                    for barcode, exc in misses
+                ]
+                await self.service._upsert(AlbumLookupMiss, rows)
+            self.checkpoint.writelines(f"{album.barcode}\tcached\n" for album in albums)
+            self.checkpoint.writelines(f"{barcode}\tnot_found\n" for barcode, _ in misses)
+            self.checkpoint.flush()
+            for _ in albums:
+                self.progress.add("cached")
+            for _ in misses:
+                self.progress.add("not_found")
+
+
+async def warmup(  # noqa: PLR0913
+    config: Config,
+    barcodes: list[str],
+    checkpoint_path: Path,
+    *,
+    concurrency: int,
+    batch_size: int,
+    progress_interval: float,
+) -> dict[str, int]:
+    logger = structlog.stdlib.get_logger("app")
+    checkpointed = read_checkpoint(checkpoint_path)
+    try:
+        async with sessionmanager.session() as db_session:
+            service = AlbumService(config, logger, db_session)
+            with checkpoint_path.open("a", encoding="utf-8") as checkpoint:
+                remaining = [barcode for barcode in barcodes if barcode not in checkpointed]
+                progress = Progress(0, progress_interval)
+                runner = Warmup(service, checkpoint, progress, concurrency=concurrency, batch_size=batch_size)
+                existing = await runner.existing(remaining)
+                remaining = [barcode for barcode in remaining if barcode not in existing]
+                print(
+                    f"{len(barcodes)} barcodes, {len(checkpointed)} checkpointed, {len(existing)} already cached, "
+                    f"{len(remaining)} to look up",
+                    file=sys.stderr,
+                )
+                progress.total = len(remaining)
+                await runner.run(remaining)
+                return progress.counts
+    finally:
+        await httpclientmanager.close()
+        await sessionmanager.close()
+
+
+def main() -> None:
+    config = get_config()
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("barcodes", help="file with one barcode per line, - reads from stdin")
+    parser.add_argument("--concurrency", type=int, default=config.batch_lookup_concurrency)
+    parser.add_argument("--batch-size", type=int, default=100, help="results written per transaction")
+    parser.add_argument("--checkpoint", type=Path, help="defaults to the barcodes file with a .checkpoint suffix")
+    parser.add_argument("--progress-interval", type=float, default=5.0, help="seconds between progress lines")
+    args = parser.parse_args()
+
+    if args.barcodes == "-":
+        barcodes = read_barcodes(sys.stdin)
+        checkpoint_path = args.checkpoint or Path("warmup.checkpoint")
+    else:
+        with open(args.barcodes, encoding="utf-8") as source:
+            barcodes = read_barcodes(source)
+        checkpoint_path = args.checkpoint or Path(f"{args.barcodes}.checkpoint")
+
+    configure_logger(enable_json_logs=config.log_json, log_level=config.log_level.value.upper())
+    counts = asyncio.run(
+        warmup(
+            config,
+            barcodes,
+            checkpoint_path,
+            concurrency=args.concurrency,
+            batch_size=args.batch_size,
+            progress_interval=args.progress_interval,
+        )
+    )
+    if counts["failed"]:
+        sys.exit(1)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,95 @@
+"""
+Shared setup for the benchmarks
+
+Importing this module points the api at a throwaway sqlite database and sets dummy upstream credentials, so it must
+be imported before anything from barcode_api.
+"""
+
+import os
+import statistics
+import tempfile
+import time
+from collections.abc import Awaitable, Callable
+
+BENCHMARK_DIR = tempfile.mkdtemp(prefix="barcode_api_benchmark_")
+
+os.environ.setdefault("ba_spotify_client_id", "benchmark")
+os.environ.setdefault("ba_spotify_client_secret", "benchmark")
+os.environ.setdefault("ba_discogs_token", "benchmark")
+os.environ.setdefault("ba_log_level", "warn")
+# sqlalchemy_url is built as driver:// + sqlite_path, the extra / makes the path absolute
+os.environ.setdefault("ba_sqlite_path", "/" + os.path.join(BENCHMARK_DIR, "benchmark.db"))
+# the benchmarks measure the api, not the upstream rate limits. Set these to benchmark with the real limits
+for provider in ("discogs", "spotify"):
+    os.environ.setdefault(f"ba_{provider}_requests_per_minute", "6000000")
+    os.environ.setdefault(f"ba_{provider}_burst", "100000")
+
+from httpx import ASGITransport, AsyncClient
+
+from barcode_api.core.database import sessionmanager
+from barcode_api.core.http_client import httpclientmanager
+from barcode_api.models import Album, Base
+
+
+async def reset_database() -> None:
+    async with sessionmanager.connect() as connection:
+        await connection.run_sync(Base.metadata.drop_all)
+        await connection.run_sync(Base.metadata.create_all)
+
+
+async def seed_albums(count: int, prefix: str = "seed") -> list[str]:
+    """Inserts count albums and returns their barcodes"""
+    barcodes = [f"{prefix}{i:08d}" for i in range(count)]
+    async with sessionmanager.session() as session, session.begin():
+        session.add_all(
+            Album(
+                barcode=barcode,
+                artist=f"Artist {barcode}",
+                name=f"Album {barcode}",
+                year="1999",
+                genres=["Rock", "Pop"],
+                spotify_id="4aawyAB9vmqN3uQ7FjRGTy",
+                discogs_url="https://www.discogs.com/master/1",
+                cover_image_url="https://i.discogs.com/1.jpg",
+            )
+            for barcode in barcodes
+        )
+    return barcodes
+
+
+async def use_fake_upstream(app) -> None:
+    """Sends all of the api's Discogs and Spotify calls to app (see benchmarks.fake_upstream) in-process"""
+    await httpclientmanager.close()
+    httpclientmanager.client_kwargs["transport"] = ASGITransport(app=app)
+
+
+def asgi_client(app) -> AsyncClient:
+    """An httpx client that calls app in-process"""
+    return AsyncClient(transport=ASGITransport(app=app), base_url="http://benchmark")
+
+
+async def time_calls(call: Callable[[], Awaitable], iterations: int) -> list[float]:
+    """Runs call iterations times and returns each call's latency in seconds"""
+    latencies = []
+    for _ in range(iterations):
+        start = time.perf_counter()
+        await call()
+        latencies.append(time.perf_counter() - start)
+    return latencies
+
+
+def percentile(values: list[float], pct: float) -> float:
+    ordered = sorted(values)
+    index = min(int(round(pct / 100 * (len(ordered) - 1))), len(ordered) - 1)
+    return ordered[index]
+
+
+def summarize(latencies: list[float]) -> dict[str, float]:
+    """Latency summary in milliseconds"""
+    return {
+        "count": len(latencies),
+        "mean_ms": statistics.fmean(latencies) * 1000,
+        "p50_ms": percentile(latencies, 50) * 1000,
+        "p95_ms": percentile(latencies, 95) * 1000,
+        "p99_ms": percentile(latencies, 99) * 1000,
+    }
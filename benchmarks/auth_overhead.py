@@ -0,0 +1,74 @@
+"""
+Per-request cost of api token auth on a cache-hit /album/search
+
+Runs the same request with auth disabled, with a token answered from the verified token cache, and with the cache
+cleared before every request, so the token is read from the database and its hash checked each time.
+
+    python -m benchmarks.auth_overhead --iterations 2000
+"""
+
+import argparse
+import asyncio
+from collections.abc import Callable
+
+# the harness configures the environment, it has to be imported before barcode_api
+from benchmarks._harness import asgi_client, reset_database, seed_albums, summarize, time_calls
+
+# isort: split
+import structlog
+
+from barcode_api.core.cache import token_cache
+from barcode_api.core.config import get_config
+from barcode_api.core.database import sessionmanager
+from barcode_api.main import app
+from barcode_api.services import TokenService
+
+
+async def create_token() -> str:
+    async with sessionmanager.session() as db_session:
+        _, token = await TokenService(get_config(), structlog.stdlib.get_logger("app"), db_session).create("benchmark")
+    return token
+
+
+async def measure(
+    barcode: str, iterations: int, warmup: int, headers: dict[str, str], before: Callable[[], None] | None = None
+) -> dict[str, float]:
+    async with asgi_client(app) as client:
+
+        async def call() -> None:
+            if before is not None:
+                before()
+            response = await client.get("/album/search", params={"barcode": barcode}, headers=headers)
+            response.raise_for_status()
+
+        await time_calls(call, warmup)
+        return summarize(await time_calls(call, iterations))
+
+
+async def main(iterations: int, uncached_iterations: int, warmup: int) -> None:
+    config = get_config()
+    await reset_database()
+    (barcode,) = await seed_albums(1)
+    headers = {"Authorization": f"Bearer {await create_token()}"}
+
+    results = dict()
+    config.auth_enabled = False
+    results["no auth"] = await measure(barcode, iterations, warmup, {})
+    config.auth_enabled = True
+    results["cached token"] = await measure(barcode, iterations, warmup, headers)
+    results["uncached token"] = await measure(barcode, uncached_iterations, 1, headers, before=token_cache.clear)
+
+    for name, summary in results.items():
+        print(f"{name:>16}: " + "  ".join(f"{key}={value:.3f}" for key, value in summary.items() if key != "count"))
+    for name in ("cached token", "uncached token"):
+        overhead = results[name]["mean_ms"] - results["no auth"]["mean_ms"]
+        print(f"{name + ' overhead':>25}: {overhead * 1000:.1f}us")
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--iterations", type=int, default=2000)
+    parser.add_argument("--uncached-iterations", type=int, default=2000)
+    parser.add_argument("--warmup", type=int, default=200)
+    args = parser.parse_args()
+    asyncio.run(main(args.iterations, args.uncached_iterations, args.warmup))
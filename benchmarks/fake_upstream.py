@@ -0,0 +1,97 @@
+"""
+A local stand-in for the Discogs and Spotify apis
+
+Serves the three endpoints the api uses (Discogs database search, Spotify token and Spotify search) with injectable
+latency and error rates. Results are deterministic per barcode so runs are comparable. It is normally mounted
+in-process by the benchmarks, but can also be run on its own:
+
+    python -m benchmarks.fake_upstream --port 8081 --latency 0.2 --error-rate 0.01
+"""
+
+import argparse
+import asyncio
+import random
+import zlib
+
+from starlette.applications import Starlette
+from starlette.requests import Request
+from starlette.responses import JSONResponse
+from starlette.routing import Route
+
+
+class FakeUpstream:
+    def __init__(
+        self,
+        latency: float = 0.0,
+        jitter: float = 0.0,
+        error_rate: float = 0.0,
+        not_found_rate: float = 0.0,
+    ):
+        """
+        latency and jitter are in seconds, each response waits latency +/- up to jitter.
+        error_rate is the fraction of requests answered with a 500, not_found_rate the fraction of barcodes
+        Discogs doesn't know about.
+        """
+        self.latency = latency
+        self.jitter = jitter
+        self.error_rate = error_rate
+        self.not_found_rate = not_found_rate
+        self.requests = {"discogs_search": 0, "spotify_token": 0, "spotify_search": 0}
+        self.app = Starlette(
+            routes=[
+                Route("/database/search", self.discogs_search),
+                Route("/api/token", self.spotify_token, methods=["POST"]),
+                Route("/v1/search", self.spotify_search),
+            ]
+        )
+
+    async def _respond(self, endpoint: str, body: dict) -> JSONResponse:
+        self.requests[endpoint] += 1
+        delay = self.latency + random.uniform(-self.jitter, self.jitter)  # noqa: S311
+        if delay > 0:
+            await asyncio.sleep(delay)
+        if random.random() < self.error_rate:  # noqa: S311
+            return JSONResponse({"message": "injected error"}, status_code=500)
+        return JSONResponse(body)
+
+    def _is_unknown(self, barcode: str) -> bool:
+        return zlib.crc32(barcode.encode()) % 10_000 < self.not_found_rate * 10_000
+
+    async def discogs_search(self, request: Request) -> JSONResponse:
+        barcode = request.query_params.get("barcode", "")
+        results = []
+        if not self._is_unknown(barcode):
+            results.append(
+                {
+                    "title": f"Artist {barcode} - Album {barcode}",
+                    "year": "1999",
+                    "genre": ["Rock", "Pop"],
+                    "master_url": f"https://api.discogs.com/masters/{zlib.crc32(barcode.encode())}",
+                    "cover_image": f"https://i.discogs.com/{barcode}.jpg",
+                }
+            )
+        return await self._respond("discogs_search", {"results": results})
+
+    async def spotify_token(self, request: Request) -> JSONResponse:
+        return await self._respond(
+            "spotify_token", {"access_token": "fake", "token_type": "Bearer", "expires_in": 3600}
+        )
+
+    async def spotify_search(self, request: Request) -> JSONResponse:
+        album_id = f"{zlib.crc32(request.query_params.get('q', '').encode()):022d}"
+        return await self._respond("spotify_search", {"albums": {"items": [{"id": album_id}]}})
+
+
+if __name__ == "__main__":
+    import uvicorn
+
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--host", default="127.0.0.1")
+    parser.add_argument("--port", type=int, default=8081)
+    parser.add_argument("--latency", type=float, default=0.0)
+    parser.add_argument("--jitter", type=float, default=0.0)
+    parser.add_argument("--error-rate", type=float, default=0.0)
+    parser.add_argument("--not-found-rate", type=float, default=0.0)
+    args = parser.parse_args()
+    upstream = FakeUpstream(args.latency, args.jitter, args.error_rate, args.not_found_rate)
+    uvicorn.run(upstream.app, host=args.host, port=args.port)
@@ -0,0 +1,157 @@
+"""
+Load test for /album/search against local Discogs/Spotify stand-ins
+
+Runs the full app in-process, with every upstream call answered by benchmarks.fake_upstream, and drives it with
+concurrent clients for each workload:
+
+    cache-hit   every request is for an album that is already cached
+    cache-miss  every request is for a new barcode, so it goes all the way to the fake upstreams
+    mixed       --hit-ratio of requests are cache hits, the rest are misses
+
+Latency percentiles and requests/sec for each workload are printed and written to --output as JSON. Pass an
+earlier results file with --compare to see how this run differs from it.
+
+    python -m benchmarks.load --requests 2000 --concurrency 32 --latency 0.05 --output after.json --compare before.json
+"""
+
+import argparse
+import asyncio
+import json
+import platform
+import random
+import time
+from collections import Counter
+from collections.abc import Callable
+from datetime import UTC, datetime
+from importlib import metadata
+
+# the harness configures the environment, it has to be imported before barcode_api
+from benchmarks._harness import asgi_client, reset_database, seed_albums, summarize, use_fake_upstream
+
+# isort: split
+from barcode_api.main import app
+from benchmarks.fake_upstream import FakeUpstream
+
+COMPARED_METRICS = ("p50_ms", "p95_ms", "p99_ms", "requests_per_sec")
+
+
+async def run_workload(next_barcode: Callable[[], str], requests: int, concurrency: int) -> dict[str, float]:
+    latencies: list[float] = []
+    statuses: Counter[int] = Counter()
+    remaining = requests
+
+    async with asgi_client(app) as client:
+
+        async def worker() -> None:
+            nonlocal remaining
+            while remaining > 0:
+                remaining -= 1
+                barcode = next_barcode()
+                start = time.perf_counter()
+                response = await client.get("/album/search", params={"barcode": barcode})
+                latencies.append(time.perf_counter() - start)
+                statuses[response.status_code] += 1
+
+        started = time.perf_counter()
+        await asyncio.gather(*(worker() for _ in range(concurrency)))
+        elapsed = time.perf_counter() - started
+
+    return {
+        **summarize(latencies),
+        "requests_per_sec": len(latencies) / elapsed,
+        "statuses": {str(status): count for status, count in sorted(statuses.items())},
+    }
+
+
+async def run(args: argparse.Namespace) -> dict:
+    upstream = FakeUpstream(args.latency, args.jitter, args.error_rate, args.not_found_rate)
+    await use_fake_upstream(upstream.app)
+    await reset_database()
+    cached = await seed_albums(args.seed)
+    misses = (f"miss{i:010d}" for i in range(10**10))
+
+    def hit() -> str:
+        return random.choice(cached)  # noqa: S311
+
+    def miss() -> str:
+        return next(misses)
+
+    def mixed() -> str:
+        return hit() if random.random() < args.hit_ratio else miss()  # noqa: S311
+
+    workloads = {"cache-hit": hit, "cache-miss": miss, "mixed": mixed}
+    results = {}
+    for name in args.workloads:
+        results[name] = await run_workload(workloads[name], args.requests, args.concurrency)
+        print_summary(name, results[name])
+
+    return {
+        "meta": {
+            "timestamp": datetime.now(UTC).isoformat(),
+            "version": package_version(),
+            "python": platform.python_version(),
+            "parameters": {
+                key: value for key, value in vars(args).items() if key not in {"output", "compare", "workloads"}
+            },
+            "upstream_requests": upstream.requests,
+        },
+        "results": results,
+    }
+
+
+def package_version() -> str:
+    try:
+        return metadata.version("home-barcode-api")
+    except metadata.PackageNotFoundError:
+        return "unknown"
+
+
+def print_summary(name: str, result: dict) -> None:
+    print(
+        f"{name:>10}: "
+        + "  ".join(f"{metric}={result[metric]:.2f}" for metric in COMPARED_METRICS)
+        + f"  statuses={result['statuses']}"
+    )
+
+
+def print_comparison(baseline: dict, current: dict) -> None:
+    print(f"\ncompared to {baseline['meta']['timestamp']} ({baseline['meta']['version']})")
+    for name, result in current["results"].items():
+        previous = baseline["results"].get(name)
+        if previous is None:
+            continue
+        changes = []
+        for metric in COMPARED_METRICS:
+            before, after = previous[metric], result[metric]
+            change = (after - before) / before * 100 if before else 0.0
+            changes.append(f"{metric}={before:.2f}->{after:.2f} ({change:+.1f}%)")
+        print(f"{name:>10}: " + "  ".join(changes))
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument(
+        "--workloads",
+        nargs="+",
+        choices=["cache-hit", "cache-miss", "mixed"],
+        default=["cache-hit", "cache-miss", "mixed"],
+    )
+    parser.add_argument("--requests", type=int, default=1000, help="requests per workload")
+    parser.add_argument("--concurrency", type=int, default=16)
+    parser.add_argument("--seed", type=int, default=500, help="albums cached before the run")
+    parser.add_argument("--hit-ratio", type=float, default=0.9, help="fraction of cache hits in the mixed workload")
+    parser.add_argument("--latency", type=float, default=0.05, help="fake upstream latency in seconds")
+    parser.add_argument("--jitter", type=float, default=0.02, help="fake upstream latency jitter in seconds")
+    parser.add_argument("--error-rate", type=float, default=0.0, help="fraction of upstream calls that fail")
+    parser.add_argument("--not-found-rate", type=float, default=0.0, help="fraction of barcodes discogs won't know")
+    parser.add_argument("--output", default="benchmark_results.json")
+    parser.add_argument("--compare", help="an earlier --output file to compare against")
+    args = parser.parse_args()
+
+    results = asyncio.run(run(args))
+    with open(args.output, "w", encoding="utf-8") as output:
+        json.dump(results, output, indent=2)
+    print(f"\nresults written to {args.output}")
+    if args.compare:
+        with open(args.compare, encoding="utf-8") as baseline:
+            print_comparison(json.load(baseline), results)
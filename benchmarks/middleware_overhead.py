@@ -0,0 +1,119 @@
+"""
+Per-request middleware overhead on a cache-hit /album/search
+
+Compares the app's pure ASGI middleware stack with the BaseHTTPMiddleware implementations it replaced, which are
+reproduced below. Both apps serve the same routes from the same warm cache, so the difference is the middleware.
+
+    python -m benchmarks.middleware_overhead --iterations 5000
+"""
+
+import argparse
+import asyncio
+import time
+from collections.abc import Callable
+
+# the harness configures the environment, it has to be imported before barcode_api
+from benchmarks._harness import asgi_client, reset_database, seed_albums, summarize, time_calls
+
+# isort: split
+import structlog
+from asgi_correlation_id import CorrelationIdMiddleware, correlation_id
+from fastapi import FastAPI
+from starlette.middleware.base import BaseHTTPMiddleware
+from starlette.requests import Request
+from starlette.responses import Response
+from uvicorn.protocols.utils import get_path_with_query_string
+
+from barcode_api.controller import CONTROLLERS
+from barcode_api.core.config import Config, get_config
+from barcode_api.core.logging import configure_logger
+from barcode_api.main import app as current_app
+
+
+class BaseHTTPConfigMiddleware(BaseHTTPMiddleware):
+    def __init__(self, app, config: Config | None = None):
+        super().__init__(app)
+        self.config = config if config is not None else get_config()
+
+    async def dispatch(self, request: Request, call_next: Callable) -> Response:
+        request.state.config = self.config
+        return await call_next(request)
+
+
+class BaseHTTPLoggingMiddleware(BaseHTTPMiddleware):
+    def __init__(self, app, enable_json_logs: bool = False, log_level: str = "INFO"):
+        super().__init__(app)
+        configure_logger(enable_json_logs=enable_json_logs, log_level=log_level)
+        self.access_logger = structlog.stdlib.get_logger("api.access")
+        self.api_error_logger = structlog.stdlib.get_logger("api.error")
+        self.app_logger = structlog.stdlib.get_logger("app")
+
+    async def dispatch(self, request: Request, call_next: Callable) -> Response:
+        request.state.logger = self.app_logger
+        request.state.error_logger = self.api_error_logger
+        structlog.contextvars.clear_contextvars()
+        request_id = correlation_id.get()
+        structlog.contextvars.bind_contextvars(request_id=request_id)
+        start_time = time.perf_counter_ns()
+        response: Response = await call_next(request)
+        process_time = time.perf_counter_ns() - start_time
+        url = get_path_with_query_string(request.scope)
+        self.access_logger.info(
+            f"""{request.client.host} - "{request.method} {url} HTTP/{request.scope["http_version"]}" {response.status_code}""",
+            http={
+                "url": str(request.url),
+                "status_code": response.status_code,
+                "method": request.method,
+                "request_id": request_id,
+                "version": request.scope["http_version"],
+            },
+            network={"ip": request.client.host},
+            duration=process_time,
+        )
+        response.headers["X-Process-Time"] = str(process_time / 10**9)
+        return response
+
+
+def build_base_http_app() -> FastAPI:
+    config = get_config()
+    app = FastAPI(title=config.api_name, docs_url=config.docs_url)
+    app.add_middleware(BaseHTTPConfigMiddleware, config=config)
+    app.add_middleware(
+        BaseHTTPLoggingMiddleware, enable_json_logs=config.log_json, log_level=config.log_level.value.upper()
+    )
+    app.add_middleware(CorrelationIdMiddleware)
+    for controller in CONTROLLERS:
+        app.include_router(controller)
+    return app
+
+
+async def measure(app: FastAPI, barcode: str, iterations: int, warmup: int) -> dict[str, float]:
+    async with asgi_client(app) as client:
+
+        async def call():
+            response = await client.get("/album/search", params={"barcode": barcode})
+            response.raise_for_status()
+
+        await time_calls(call, warmup)
+        return summarize(await time_calls(call, iterations))
+
+
+async def main(iterations: int, warmup: int) -> None:
+    await reset_database()
+    (barcode,) = await seed_albums(1)
+    results = {
+        "BaseHTTPMiddleware": await measure(build_base_http_app(), barcode, iterations, warmup),
+        "pure ASGI": await measure(current_app, barcode, iterations, warmup),
+    }
+    for name, summary in results.items():
+        print(f"{name:>20}: " + "  ".join(f"{key}={value:.3f}" for key, value in summary.items() if key != "count"))
+    saved = results["BaseHTTPMiddleware"]["mean_ms"] - results["pure ASGI"]["mean_ms"]
+    print(f"{'saved per request':>20}: {saved * 1000:.1f}us")
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--iterations", type=int, default=2000)
+    parser.add_argument("--warmup", type=int, default=200)
+    args = parser.parse_args()
+    asyncio.run(main(args.iterations, args.warmup))
@@ -0,0 +1,105 @@
+"""
+Per-hit serialization cost of /album/search responses
+
+Compares building the body the way FastAPI does for a response model (validate the AlbumDTO, serialize it through the
+route's response field, JSON encode it) with the pre-encoded body from the response cache. The first section times
+just the body building in CPU time, the second full cache-hit requests with the response cache on and off.
+
+    python -m benchmarks.response_serialization --iterations 20000
+"""
+
+import argparse
+import asyncio
+import time
+from collections.abc import Callable
+
+# the harness configures the environment, it has to be imported before barcode_api
+from benchmarks._harness import asgi_client, reset_database, seed_albums, summarize, time_calls
+
+# isort: split
+from fastapi.responses import JSONResponse
+from fastapi.routing import APIRoute, serialize_response
+
+from barcode_api.controller.albums_controller import RawJSONResponse, album_body
+from barcode_api.core.cache import l1_cache, response_cache
+from barcode_api.main import app
+from barcode_api.schemas.dto.albums_dto import Album as AlbumDTO
+
+
+def cpu_per_call(call: Callable[[], object], iterations: int) -> float:
+    """Mean CPU time per call in microseconds"""
+    start = time.process_time()
+    for _ in range(iterations):
+        call()
+    return (time.process_time() - start) / iterations * 10**6
+
+
+async def measure_requests(barcode: str, iterations: int, warmup: int) -> dict[str, float]:
+    async with asgi_client(app) as client:
+
+        async def call():
+            response = await client.get("/album/search", params={"barcode": barcode})
+            response.raise_for_status()
+
+        await time_calls(call, warmup)
+        cpu_start = time.process_time()
+        summary = summarize(await time_calls(call, iterations))
+        summary["cpu_us"] = (time.process_time() - cpu_start) / iterations * 10**6
+        return summary
+
+
+async def main(iterations: int, warmup: int) -> None:
+    await reset_database()
+    (barcode,) = await seed_albums(1)
+    async with asgi_client(app) as client:
+        (await client.get("/album/search", params={"barcode": barcode})).raise_for_status()
+    # the request left the album in the l1 cache, as it is on every cache hit
+    album = l1_cache.get(("albums", "barcode", barcode))
+    route = next(route for route in app.routes if isinstance(route, APIRoute) and route.path == "/album/search")
+
+    async def response_model() -> bytes:
+        content = await serialize_response(field=route.response_field, response_content=AlbumDTO.model_validate(album))
+        return JSONResponse(content).body
+
+    def pre_encoded() -> bytes:
+        body, _ = album_body(album)
+        return RawJSONResponse(body).body
+
+    # serialize_response is a coroutine that never awaits, drive it without an event loop so only its cost is timed
+    def run_to_completion() -> bytes:
+        coroutine = response_model()
+        try:
+            coroutine.send(None)
+        except StopIteration as stop:
+            return stop.value
+        err_msg = "serialize_response awaited something"
+        raise RuntimeError(err_msg)
+
+    assert run_to_completion() == pre_encoded(), "both paths must produce the same body"  # noqa: S101
+    body_costs = {
+        "response model": cpu_per_call(run_to_completion, iterations),
+        "pre-encoded": cpu_per_call(pre_encoded, iterations),
+    }
+    print("body building, CPU per hit")
+    for name, cost in body_costs.items():
+        print(f"{name:>16}: {cost:.1f}us")
+    print(f"{'saved':>16}: {body_costs['response model'] - body_costs['pre-encoded']:.1f}us")
+
+    request_iterations = max(iterations // 10, 1)
+    enabled = await measure_requests(barcode, request_iterations, warmup)
+    maxsize = response_cache.maxsize
+    response_cache.maxsize = 0
+    response_cache.clear()
+    disabled = await measure_requests(barcode, request_iterations, warmup)
+    response_cache.maxsize = maxsize
+    print("\ncache-hit requests")
+    for name, summary in {"response cache off": disabled, "response cache on": enabled}.items():
+        print(f"{name:>20}: " + "  ".join(f"{key}={value:.3f}" for key, value in summary.items() if key != "count"))
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--iterations", type=int, default=20000)
+    parser.add_argument("--warmup", type=int, default=200)
+    args = parser.parse_args()
+    asyncio.run(main(args.iterations, args.warmup))
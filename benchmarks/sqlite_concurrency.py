@@ -0,0 +1,113 @@
+"""
+Concurrent read/write throughput on the albums table with the default and tuned sqlite engine profiles
+
+The default profile is what DatabaseSessionManager used to build (rollback journal, default pool and pragmas), the
+tuned profile is the one built from Config (WAL, synchronous=NORMAL, busy_timeout, mmap, cache size, pool sizing).
+Each profile gets its own database file seeded with the same albums.
+
+    python -m benchmarks.sqlite_concurrency --readers 8 --writers 2 --duration 10
+"""
+
+import argparse
+import asyncio
+import os
+import random
+import time
+
+# the harness configures the environment, it has to be imported before barcode_api
+from benchmarks._harness import BENCHMARK_DIR
+
+# isort: split
+from sqlalchemy import select
+from sqlalchemy.exc import OperationalError
+
+from barcode_api.core.config import get_config
+from barcode_api.core.database import DatabaseSessionManager, engine_kwargs_from_config
+from barcode_api.models import Album, Base
+
+
+def build_profiles() -> dict[str, DatabaseSessionManager]:
+    config = get_config()
+
+    def url(name: str) -> str:
+        return f"{config.sqlalchemy_driver}:///{os.path.join(BENCHMARK_DIR, name)}.db"
+
+    return {
+        "default": DatabaseSessionManager(url("default"), {"echo": False}),
+        "tuned": DatabaseSessionManager(
+            url("tuned"), engine_kwargs_from_config(config), sqlite_pragmas=config.sqlite_pragmas
+        ),
+    }
+
+
+def new_album(barcode: str) -> Album:
+    return Album(
+        barcode=barcode,
+        artist=f"Artist {barcode}",
+        name=f"Album {barcode}",
+        year="1999",
+        genres=["Rock", "Pop"],
+        spotify_id="4aawyAB9vmqN3uQ7FjRGTy",
+    )
+
+
+async def seed(manager: DatabaseSessionManager, count: int) -> list[str]:
+    async with manager.connect() as connection:
+        await connection.run_sync(Base.metadata.drop_all)
+        await connection.run_sync(Base.metadata.create_all)
+    barcodes = [f"seed{i:08d}" for i in range(count)]
+    async with manager.session() as session, session.begin():
+        session.add_all(new_album(barcode) for barcode in barcodes)
+    return barcodes
+
+
+async def run_profile(
+    manager: DatabaseSessionManager, readers: int, writers: int, duration: float, seed_count: int
+) -> dict[str, float]:
+    barcodes = await seed(manager, seed_count)
+    counts = {"reads": 0, "writes": 0, "errors": 0}
+    deadline = time.perf_counter() + duration
+
+    async def reader() -> None:
+        while time.perf_counter() < deadline:
+            try:
+                async with manager.session() as session:
+                    await session.scalar(select(Album).where(Album.barcode == random.choice(barcodes)))  # noqa: S311
+                counts["reads"] += 1
+            except OperationalError:
+                counts["errors"] += 1
+
+    async def writer(number: int) -> None:
+        written = 0
+        while time.perf_counter() < deadline:
+            try:
+                async with manager.session() as session, session.begin():
+                    session.add(new_album(f"writer{number}-{written:08d}"))
+                written += 1
+                counts["writes"] += 1
+            except OperationalError:
+                counts["errors"] += 1
+
+    await asyncio.gather(*(reader() for _ in range(readers)), *(writer(i) for i in range(writers)))
+    await manager.close()
+    return {
+        "reads_per_sec": counts["reads"] / duration,
+        "writes_per_sec": counts["writes"] / duration,
+        "errors": counts["errors"],
+    }
+
+
+async def main(readers: int, writers: int, duration: float, seed_count: int) -> None:
+    for name, manager in build_profiles().items():
+        result = await run_profile(manager, readers, writers, duration, seed_count)
+        print(f"{name:>8}: " + "  ".join(f"{key}={value:.1f}" for key, value in result.items()))
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--readers", type=int, default=8)
+    parser.add_argument("--writers", type=int, default=2)
+    parser.add_argument("--duration", type=float, default=10.0)
+    parser.add_argument("--seed", type=int, default=1000, help="albums to seed before the run")
+    args = parser.parse_args()
+    asyncio.run(main(args.readers, args.writers, args.duration, args.seed))
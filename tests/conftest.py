@@ -1,8 +1,84 @@
+import time
+from pathlib import Path
+
 import pytest
+import pytest_asyncio
+from alembic import command
+from alembic.config import Config as AlembicConfig
 
 from barcode_api.core.config import get_config
+from barcode_api.core.database import DatabaseSessionManager
+from barcode_api.models import Base
+
+
+class FakeClock:
+    """Stands in for the time module of the modules it is installed in, monotonic time only moves when a test moves it"""
+
+    def __init__(self) -> None:
+        self.now = 1000.0
+
+    def monotonic(self) -> float:
+        return self.now
+
+    @staticmethod
+    def time() -> float:
+        return time.time()
+
+
+@pytest.fixture
+def fake_clock(monkeypatch):
+    """Installs one FakeClock as the time module of every module passed to it, and returns the clock"""
+    clock = FakeClock()
+
+    def install(*modules) -> FakeClock:
+        for module in modules:
+            monkeypatch.setattr(module, "time", clock)
+        return clock
+
+    return install
 
 
 @pytest.fixture
 def app_config():
     return get_config()
+
+
+@pytest_asyncio.fixture
+async def session_manager(tmp_path):
+    manager = DatabaseSessionManager(f"sqlite+aiosqlite:///{tmp_path / 'test.db'}")
+    async with manager.connect() as connection:
+        await connection.run_sync(Base.metadata.create_all)
+    yield manager
+    await manager.close()
+
+
+@pytest_asyncio.fixture
+async def db_session(session_manager):
+    async with session_manager.session() as session:
+        yield session
+
+
+@pytest.fixture
+def migrated_database(tmp_path, monkeypatch):
+    """The path of a sqlite database built by the migrations, rather than by create_all"""
+    path = tmp_path / "migrated.db"
+    # sqlalchemy_url puts the path after sqlite://, an absolute path needs a fourth slash
+    monkeypatch.setenv("ba_sqlite_path", f"/{path}")
+    get_config.cache_clear()
+    root = Path(__file__).parent.parent
+    alembic_config = AlembicConfig(root / "alembic.ini")
+    alembic_config.set_main_option("script_location", str(root / "barcode_api" / "migrations"))
+    alembic_config.attributes["configure_logger"] = False
+    try:
+        command.upgrade(alembic_config, "head")
+    finally:
+        get_config.cache_clear()
+    return path
+
+
+@pytest_asyncio.fixture
+async def migrated_db_session(migrated_database):
+    manager = DatabaseSessionManager(f"sqlite+aiosqlite:///{migrated_database}")
+    async with manager.session() as session:
+        yield session
+    await manager.close()
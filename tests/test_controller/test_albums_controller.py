@@ -0,0 +1,174 @@
+import asyncio
+import json
+from contextlib import asynccontextmanager
+from datetime import UTC, datetime
+from http import HTTPStatus
+
+import httpx
+import pytest
+from starlette.datastructures import Headers
+
+from barcode_api.controller import albums_controller
+from barcode_api.controller.albums_controller import (
+    album_body,
+    batch_result,
+    get_album_service,
+    get_lookup_job_service,
+)
+from barcode_api.core import http_cache
+from barcode_api.core.cache import LRUCache
+from barcode_api.main import app
+from barcode_api.models import Album
+from barcode_api.services import AlbumService
+from barcode_api.services.album_service import HttpxService
+
+LAST_UPDATE = datetime(2024, 1, 1, 12, 0, 0)
+
+
+def album(barcode: str, name: str | None = None, last_update: datetime = LAST_UPDATE) -> Album:
+    return Album(
+        barcode=barcode,
+        artist="Artist",
+        name=name or f"Album {barcode}",
+        year="1999",
+        genres=["Rock"],
+        spotify_id="4aawyAB9vmqN3uQ7FjRGTy",
+        last_update=last_update,
+    )
+
+
+def test_album_body_is_cached_per_barcode():
+    cache = LRUCache(maxsize=16)
+    # albums from the write behind buffer have no id yet
+    first, second = album("111"), album("222")
+    first_body, _ = album_body(first, cache)
+    second_body, _ = album_body(second, cache)
+
+    assert b"Album 111" in first_body
+    assert b"Album 222" in second_body
+    assert album_body(first, cache)[0] is first_body
+
+
+def test_album_rewritten_in_the_same_second_gets_a_new_body_and_etag():
+    cache = LRUCache(maxsize=16)
+    before_body, before_tag = album_body(album("111", name="Before"), cache)
+    # sqlite stores last_update to the second, the rewritten row has the same one
+    after_body, after_tag = album_body(album("111", name="After"), cache)
+
+    assert b"Before" in before_body
+    assert b"After" in after_body
+    assert before_tag != after_tag
+
+
+def test_is_not_modified_compares_etags():
+    row = album("111")
+    _, tag = album_body(row, LRUCache(maxsize=16))
+
+    assert http_cache.is_not_modified(Headers({"if-none-match": tag}), row, tag)
+    assert http_cache.is_not_modified(Headers({"if-none-match": f'"other", W/{tag}'}), row, tag)
+    assert not http_cache.is_not_modified(Headers({"if-none-match": '"other"'}), row, tag)
+    assert http_cache.is_not_modified(Headers({"if-modified-since": "Mon, 01 Jan 2024 12:00:00 GMT"}), row, tag)
+    assert not http_cache.is_not_modified(Headers({"if-modified-since": "Mon, 01 Jan 2024 11:59:59 GMT"}), row, tag)
+
+
+def test_batch_result_hides_unexpected_errors():
+    result = batch_result("111", RuntimeError("connection to postgres://user:secret@db failed"))
+
+    assert result.status_code == HTTPStatus.INTERNAL_SERVER_ERROR
+    assert result.error == "Internal Server Error"
+    assert result.album is None
+
+
+def test_batch_result_reports_service_errors():
+    not_found = batch_result("111", AlbumService.NotFoundError("No album found for barcode 111"))
+    upstream = batch_result("111", HttpxService.UpstreamError("Discogs returned a 500"))
+    unavailable = batch_result("111", HttpxService.RateLimitedError("Discogs is rate limited", retry_after=1))
+
+    assert (not_found.status_code, not_found.error) == (HTTPStatus.NOT_FOUND, "No album found for barcode 111")
+    assert (upstream.status_code, upstream.error) == (HTTPStatus.BAD_GATEWAY, "Discogs returned a 500")
+    assert unavailable.status_code == HTTPStatus.SERVICE_UNAVAILABLE
+
+
+def test_batch_result_for_an_album():
+    result = batch_result("111", album("111"))
+
+    assert result.status_code == HTTPStatus.OK
+    assert result.album.name == "Album 111"
+    assert result.error is None
+
+
+class FakeAlbumService:
+    def __init__(self, cached: Album | None) -> None:
+        self.cached = cached
+        self.calls: list[str] = []
+
+    async def search(self, barcode: str) -> Album:
+        self.calls.append("search")
+        await asyncio.sleep(0)
+        return album(barcode)
+
+    async def search_cached(self, barcode: str) -> Album | None:
+        self.calls.append("search_cached")
+        await asyncio.sleep(0)
+        return self.cached
+
+
+@pytest.fixture
+def client_for():
+    @asynccontextmanager
+    async def client(album_service: FakeAlbumService):
+        app.dependency_overrides[get_album_service] = lambda: album_service
+        app.dependency_overrides[get_lookup_job_service] = lambda: None
+        try:
+            async with httpx.AsyncClient(transport=httpx.ASGITransport(app=app), base_url="http://test") as client:
+                yield client
+        finally:
+            app.dependency_overrides.clear()
+
+    return client
+
+
+@pytest.mark.asyncio
+async def test_respond_async_serves_a_cached_album_with_one_lookup(client_for):
+    album_service = FakeAlbumService(cached=album("111"))
+    async with client_for(album_service) as client:
+        response = await client.get("/album/search", params={"barcode": "111"}, headers={"Prefer": "respond-async"})
+
+    assert response.status_code == HTTPStatus.OK
+    assert response.json()["name"] == "Album 111"
+    assert album_service.calls == ["search_cached"]
+
+
+@pytest.mark.asyncio
+async def test_search_without_respond_async_doesnt_check_the_cache_twice(client_for):
+    album_service = FakeAlbumService(cached=None)
+    async with client_for(album_service) as client:
+        response = await client.get("/album/search", params={"barcode": "111"})
+
+    assert response.status_code == HTTPStatus.OK
+    assert album_service.calls == ["search"]
+
+
+@pytest.mark.asyncio
+async def test_stream_albums_by_barcodes(session_manager, monkeypatch):
+    monkeypatch.setattr(albums_controller, "sessionmanager", session_manager)
+    async with session_manager.session() as db_session, db_session.begin():
+        # fresh, so serving it doesn't start a background refresh
+        db_session.add(album("streamed-1", last_update=datetime.now(UTC).replace(tzinfo=None)))
+
+    async def not_found(self, barcode):
+        await asyncio.sleep(0)
+        raise AlbumService.NoDiscogsAlbumFoundError(AlbumService.NoDiscogsAlbumFoundError.ERROR_TEXT % barcode)
+
+    monkeypatch.setattr(AlbumService, "_lookup_and_cache", not_found)
+    body = f"streamed-1\r\n\n   streamed-2\n{'9' * 100}\n".encode()
+    async with httpx.AsyncClient(transport=httpx.ASGITransport(app=app), base_url="http://test") as client:
+        response = await client.post("/album/search/stream", content=body)
+
+    assert response.status_code == HTTPStatus.OK
+    assert response.headers["content-type"] == "application/x-ndjson"
+    results = {result["barcode"]: result for result in map(json.loads, response.text.splitlines())}
+    assert results["streamed-1"]["album"]["name"] == "Album streamed-1"
+    assert results["streamed-2"]["status_code"] == HTTPStatus.NOT_FOUND
+    (too_long,) = (result for barcode, result in results.items() if barcode.startswith("999"))
+    assert too_long["status_code"] == HTTPStatus.UNPROCESSABLE_ENTITY
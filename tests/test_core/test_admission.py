@@ -0,0 +1,172 @@
+import asyncio
+
+import pytest
+
+from barcode_api.core import admission as admission_module
+from barcode_api.core.admission import AdmissionController
+
+
+@pytest.fixture
+def clock(fake_clock):
+    return fake_clock(admission_module)
+
+
+async def hold(admission: AdmissionController, release: asyncio.Event, order: list[str] | None = None, name=""):
+    async with admission.admit():
+        if order is not None:
+            order.append(name)
+        await release.wait()
+
+
+@pytest.mark.asyncio
+async def test_admits_up_to_concurrency_and_queues_the_rest(clock):
+    admission = AdmissionController("test", concurrency=2, max_queue=2, max_wait=5)
+    release = asyncio.Event()
+    tasks = [asyncio.create_task(hold(admission, release)) for _ in range(4)]
+    await asyncio.sleep(0)
+
+    assert admission.running == 2
+    assert admission.queue_depth == 2
+
+    clock.now += 2
+    release.set()
+    await asyncio.gather(*tasks)
+    assert admission.stats() == {
+        "running": 0,
+        "queue_depth": 0,
+        "admitted": 4,
+        "shed": 0,
+        "timed_out": 0,
+        # the two queued callers held their slots for no time, which isn't averaged in
+        "hold_seconds_avg": 2.0,
+    }
+
+
+@pytest.mark.asyncio
+async def test_slot_is_handed_to_the_next_waiter_in_order():
+    admission = AdmissionController("test", concurrency=1, max_queue=5, max_wait=5)
+    releases = [asyncio.Event() for _ in range(3)]
+    order: list[str] = []
+    tasks = [asyncio.create_task(hold(admission, release, order, str(i))) for i, release in enumerate(releases)]
+    await asyncio.sleep(0)
+    assert order == ["0"]
+
+    releases[0].set()
+    await asyncio.sleep(0.01)
+    # the slot went straight to the first waiter, it was never free for anyone else
+    assert order == ["0", "1"]
+    assert admission.running == 1
+
+    for release in releases:
+        release.set()
+    await asyncio.gather(*tasks)
+    assert order == ["0", "1", "2"]
+    assert admission.running == 0
+
+
+@pytest.mark.asyncio
+async def test_sheds_when_the_queue_is_full():
+    admission = AdmissionController("test", concurrency=1, max_queue=1, max_wait=5)
+    release = asyncio.Event()
+    tasks = [asyncio.create_task(hold(admission, release)) for _ in range(2)]
+    await asyncio.sleep(0)
+
+    with pytest.raises(AdmissionController.RejectedError) as exc_info:
+        async with admission.admit():
+            pass
+    assert exc_info.value.retry_after >= 1
+    assert admission.shed == 1
+
+    release.set()
+    await asyncio.gather(*tasks)
+
+
+@pytest.mark.asyncio
+async def test_times_out_while_queued():
+    admission = AdmissionController("test", concurrency=1, max_queue=5, max_wait=0.01)
+    release = asyncio.Event()
+    holder = asyncio.create_task(hold(admission, release))
+    await asyncio.sleep(0)
+
+    with pytest.raises(AdmissionController.RejectedError):
+        async with admission.admit():
+            pass
+    assert admission.timed_out == 1
+    assert admission.queue_depth == 0
+
+    release.set()
+    await holder
+    assert admission.running == 0
+
+
+@pytest.mark.asyncio
+async def test_cancelled_waiter_leaves_the_queue():
+    admission = AdmissionController("test", concurrency=1, max_queue=5, max_wait=5)
+    release = asyncio.Event()
+    holder = asyncio.create_task(hold(admission, release))
+    waiter = asyncio.create_task(hold(admission, release))
+    await asyncio.sleep(0)
+    assert admission.queue_depth == 1
+
+    waiter.cancel()
+    await asyncio.gather(waiter, return_exceptions=True)
+    assert admission.queue_depth == 0
+
+    release.set()
+    await holder
+    assert admission.running == 0
+
+
+@pytest.mark.asyncio
+async def test_cancelled_waiter_passes_on_a_slot_it_was_just_granted():
+    admission = AdmissionController("test", concurrency=1, max_queue=5, max_wait=5)
+    first_release = asyncio.Event()
+    release = asyncio.Event()
+    holder = asyncio.create_task(hold(admission, first_release))
+    granted = asyncio.create_task(hold(admission, release))
+    order: list[str] = []
+    next_waiter = asyncio.create_task(hold(admission, release, order, "next"))
+    await asyncio.sleep(0)
+
+    # the holder finishes and hands its slot to granted, which is cancelled before it gets to run
+    first_release.set()
+    await holder
+    granted.cancel()
+    await asyncio.gather(granted, return_exceptions=True)
+
+    await asyncio.sleep(0)
+    assert order == ["next"]
+    assert admission.running == 1
+
+    release.set()
+    await next_waiter
+    assert admission.running == 0
+    assert admission.queue_depth == 0
+
+
+@pytest.mark.asyncio
+async def test_zero_concurrency_admits_everyone():
+    admission = AdmissionController("test", concurrency=0, max_queue=0, max_wait=0)
+    release = asyncio.Event()
+    tasks = [asyncio.create_task(hold(admission, release)) for _ in range(10)]
+    await asyncio.sleep(0)
+    release.set()
+    await asyncio.gather(*tasks)
+    assert admission.shed == 0
+
+
+@pytest.mark.asyncio
+async def test_retry_after_follows_hold_times_and_the_queue(clock):
+    admission = AdmissionController("test", concurrency=1, max_queue=5, max_wait=5)
+    async with admission.admit():
+        clock.now += 4
+    assert admission.retry_after == 4.0
+
+    release = asyncio.Event()
+    tasks = [asyncio.create_task(hold(admission, release)) for _ in range(3)]
+    await asyncio.sleep(0)
+    # two callers queued ahead of a new one, each holding the only slot for about 4 seconds
+    assert admission.retry_after == 12.0
+
+    release.set()
+    await asyncio.gather(*tasks)
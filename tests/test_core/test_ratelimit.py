@@ -0,0 +1,192 @@
+import asyncio
+import time
+from datetime import UTC, datetime, timedelta
+from email.utils import format_datetime
+
+import pytest
+from httpx import Response
+
+from barcode_api.core import ratelimit
+from barcode_api.core.ratelimit import Priority, UpstreamScheduler, parse_retry_after
+
+
+@pytest.fixture
+def clock(fake_clock):
+    return fake_clock(ratelimit)
+
+
+@pytest.mark.parametrize(
+    ("value", "expected"),
+    [(None, 5.0), ("3", 3.0), ("1.5", 1.5), ("-2", 0.0), ("soon", 5.0)],
+)
+def test_parse_retry_after_seconds(value, expected):
+    assert parse_retry_after(value, default=5.0) == expected
+
+
+def test_parse_retry_after_http_date():
+    value = format_datetime(datetime.now(UTC) + timedelta(seconds=30), usegmt=True)
+    assert 28 <= parse_retry_after(value, default=5.0) <= 30
+    past = format_datetime(datetime.now(UTC) - timedelta(seconds=30), usegmt=True)
+    assert parse_retry_after(past, default=5.0) == 0.0
+
+
+def test_refill_is_capped_at_burst(clock):
+    scheduler = UpstreamScheduler("test", requests_per_minute=60, burst=5)
+    scheduler._tokens = 0.0
+    clock.now += 2
+    scheduler._refill(clock.now)
+    assert scheduler.stats()["tokens"] == pytest.approx(2.0)
+    clock.now += 60
+    scheduler._refill(clock.now)
+    assert scheduler.stats()["tokens"] == 5
+
+
+@pytest.mark.asyncio
+async def test_higher_priority_waiters_go_first():
+    scheduler = UpstreamScheduler("test", requests_per_minute=6000, burst=1)
+    await scheduler.acquire()
+    order: list[str] = []
+
+    async def acquire(name: str, priority: Priority) -> None:
+        await scheduler.acquire(priority)
+        order.append(name)
+
+    await asyncio.gather(
+        acquire("background", Priority.BACKGROUND),
+        acquire("interactive 1", Priority.INTERACTIVE),
+        acquire("interactive 2", Priority.INTERACTIVE),
+    )
+    assert order == ["interactive 1", "interactive 2", "background"]
+    assert scheduler.stats()["requests"] == 4
+
+
+@pytest.mark.asyncio
+async def test_cancelled_waiters_dont_use_a_token():
+    scheduler = UpstreamScheduler("test", requests_per_minute=6000, burst=1)
+    await scheduler.acquire()
+    cancelled = asyncio.create_task(scheduler.acquire())
+    await asyncio.sleep(0)
+    cancelled.cancel()
+    await scheduler.acquire()
+    assert scheduler.stats()["requests"] == 2
+    assert scheduler.queue_depth == 0
+
+
+@pytest.mark.asyncio
+async def test_429_pauses_and_retries():
+    scheduler = UpstreamScheduler("test", requests_per_minute=6000, burst=10, max_retries=2)
+    responses = [Response(429, headers={"Retry-After": "0.05"}), Response(200)]
+    sent_at: list[float] = []
+
+    async def send() -> Response:
+        sent_at.append(time.monotonic())
+        await asyncio.sleep(0)
+        return responses.pop(0)
+
+    response = await scheduler.request(send)
+
+    assert response.status_code == 200
+    assert scheduler.rate_limited == 1
+    assert sent_at[1] - sent_at[0] >= 0.05
+
+
+@pytest.mark.asyncio
+async def test_last_429_is_returned_after_max_retries():
+    scheduler = UpstreamScheduler("test", requests_per_minute=6000, burst=10, max_retries=1)
+    calls = 0
+
+    async def send() -> Response:
+        nonlocal calls
+        calls += 1
+        await asyncio.sleep(0)
+        return Response(429, headers={"Retry-After": "0"})
+
+    response = await scheduler.request(send)
+    assert response.status_code == 429
+    assert calls == 2
+
+
+def test_pause_empties_the_bucket(clock):
+    scheduler = UpstreamScheduler("test", requests_per_minute=60, burst=5)
+    scheduler.observe(Response(429, headers={"Retry-After": "10"}))
+    assert scheduler.retry_after == 10
+    assert scheduler.stats()["tokens"] == 0
+    # nothing refills while paused
+    clock.now += 5
+    scheduler._refill(clock.now)
+    assert scheduler.stats()["tokens"] == 0
+
+
+def test_remaining_header_clamps_tokens(clock):
+    scheduler = UpstreamScheduler(
+        "test", requests_per_minute=60, burst=5, limit_header="X-Limit", remaining_header="X-Remaining"
+    )
+    scheduler.observe(Response(200, headers={"X-Remaining": "2"}))
+    assert scheduler.stats()["tokens"] == 2
+    # remaining never adds tokens
+    scheduler.observe(Response(200, headers={"X-Remaining": "50"}))
+    assert scheduler.stats()["tokens"] == 2
+
+
+def test_limit_header_sets_rate():
+    scheduler = UpstreamScheduler("test", requests_per_minute=60, burst=5, limit_header="X-Limit")
+    scheduler.observe(Response(200, headers={"X-Limit": "30"}))
+    assert scheduler.rate == 0.5
+    scheduler.observe(Response(200, headers={"X-Limit": "bogus"}))
+    assert scheduler.rate == 0.5
+
+
+@pytest.mark.asyncio
+async def test_interactive_callers_dont_wait_out_a_long_pause():
+    scheduler = UpstreamScheduler("test", requests_per_minute=6000, burst=10, max_pause_wait=2)
+    scheduler.pause(3600)
+
+    async with asyncio.timeout(0.5):
+        with pytest.raises(UpstreamScheduler.PausedError) as exc_info:
+            await scheduler.acquire()
+    assert exc_info.value.retry_after == pytest.approx(3600, abs=1)
+
+
+@pytest.mark.asyncio
+async def test_retry_after_longer_than_the_deadline_fails_the_request():
+    scheduler = UpstreamScheduler("test", requests_per_minute=6000, burst=10, max_retries=2, max_pause_wait=10)
+    calls = 0
+
+    async def send() -> Response:
+        nonlocal calls
+        calls += 1
+        await asyncio.sleep(0)
+        return Response(429, headers={"Retry-After": "5"})
+
+    async with asyncio.timeout(0.5):
+        with pytest.raises(UpstreamScheduler.PausedError) as exc_info:
+            await scheduler.request(send, max_wait=1)
+    assert calls == 1
+    assert scheduler.rate_limited == 1
+    assert exc_info.value.retry_after == pytest.approx(5, abs=0.5)
+
+
+@pytest.mark.asyncio
+async def test_background_callers_wait_out_the_pause():
+    scheduler = UpstreamScheduler("test", requests_per_minute=6000, burst=10, max_pause_wait=0)
+    scheduler.pause(0.05)
+    started = time.monotonic()
+    await scheduler.acquire(Priority.BACKGROUND)
+    assert time.monotonic() - started >= 0.05
+
+
+@pytest.mark.asyncio
+async def test_queued_interactive_callers_are_failed_when_a_long_pause_starts():
+    scheduler = UpstreamScheduler("test", requests_per_minute=600, burst=1, max_pause_wait=2)
+    await scheduler.acquire()
+    interactive = asyncio.create_task(scheduler.acquire(Priority.INTERACTIVE))
+    background = asyncio.create_task(scheduler.acquire(Priority.BACKGROUND))
+    await asyncio.sleep(0)
+    scheduler.pause(3600)
+
+    async with asyncio.timeout(1):
+        with pytest.raises(UpstreamScheduler.PausedError):
+            await interactive
+    assert not background.done()
+    assert scheduler.queue_depth == 1
+    background.cancel()
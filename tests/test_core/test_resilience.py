@@ -0,0 +1,207 @@
+import asyncio
+
+import pytest
+
+from barcode_api.core import resilience
+from barcode_api.core.resilience import CircuitBreaker, CircuitState, LatencyTracker, hedged
+
+
+@pytest.fixture
+def clock(fake_clock):
+    return fake_clock(resilience)
+
+
+@pytest.fixture
+def breaker(clock):
+    return CircuitBreaker("test", error_rate=0.5, min_requests=4, window=30, reset_timeout=10)
+
+
+def fail(breaker: CircuitBreaker, times: int) -> None:
+    for _ in range(times):
+        breaker.record_failure(breaker.allow())
+
+
+def test_opens_once_the_error_rate_is_reached(breaker):
+    breaker.record_success(breaker.allow())
+    fail(breaker, 2)
+    assert breaker.state == CircuitState.CLOSED
+    fail(breaker, 1)
+    assert breaker.state == CircuitState.OPEN
+    assert breaker.allow() is None
+    assert breaker.retry_after == 10
+    assert breaker.stats() == {"state": CircuitState.OPEN, "opened": 1, "rejected": 1}
+
+
+def test_old_outcomes_leave_the_window(breaker, clock):
+    fail(breaker, 3)
+    clock.now += 31
+    fail(breaker, 1)
+    assert breaker.state == CircuitState.CLOSED
+
+
+def test_trial_success_closes(breaker, clock):
+    fail(breaker, 4)
+    clock.now += 10
+    trial = breaker.allow()
+    assert trial.trial
+    assert breaker.state == CircuitState.HALF_OPEN
+    # only one trial at a time
+    assert breaker.allow() is None
+    breaker.record_success(trial)
+    assert breaker.state == CircuitState.CLOSED
+    assert breaker.allow() is not None
+
+
+def test_trial_failure_reopens(breaker, clock):
+    fail(breaker, 4)
+    clock.now += 10
+    breaker.record_failure(breaker.allow())
+    assert breaker.state == CircuitState.OPEN
+    assert breaker.retry_after == 10
+    assert breaker.opened == 2
+
+
+def test_released_trial_lets_another_through(breaker, clock):
+    fail(breaker, 4)
+    clock.now += 10
+    breaker.release(breaker.allow())
+    assert breaker.allow() is not None
+
+
+def test_calls_in_flight_when_the_circuit_opened_are_ignored(breaker, clock):
+    in_flight = [breaker.allow() for _ in range(3)]
+    fail(breaker, 4)
+    assert breaker.state == CircuitState.OPEN
+
+    clock.now += 5
+    # a late failure doesn't push the trial back
+    breaker.record_failure(in_flight[0])
+    assert breaker.retry_after == 5
+    assert breaker.opened == 1
+
+    clock.now += 5
+    trial = breaker.allow()
+    # nor does a late success close the circuit, or a late failure reopen it, while the trial is running
+    breaker.record_success(in_flight[1])
+    assert breaker.state == CircuitState.HALF_OPEN
+    breaker.record_failure(in_flight[2])
+    assert breaker.state == CircuitState.HALF_OPEN
+    breaker.record_success(trial)
+    assert breaker.state == CircuitState.CLOSED
+
+
+def test_calls_from_before_a_close_dont_count(breaker, clock):
+    in_flight = [breaker.allow() for _ in range(4)]
+    fail(breaker, 4)
+    clock.now += 10
+    breaker.record_success(breaker.allow())
+    for call in in_flight:
+        breaker.record_failure(call)
+    assert breaker.state == CircuitState.CLOSED
+
+
+def test_latency_percentile():
+    latencies = LatencyTracker(window_size=100)
+    for latency in range(1, 101):
+        latencies.record(latency / 1000)
+    assert latencies.percentile(50) == 0.051
+    assert latencies.percentile(100) == 0.1
+
+
+@pytest.mark.asyncio
+async def test_hedged_without_a_delay_calls_once():
+    calls = 0
+
+    async def call():
+        nonlocal calls
+        calls += 1
+        await asyncio.sleep(0)
+        return calls
+
+    assert await hedged(call, None) == 1
+    assert calls == 1
+
+
+@pytest.mark.asyncio
+async def test_fast_call_is_not_hedged():
+    hedge_calls = 0
+
+    async def call():
+        await asyncio.sleep(0)
+        return "first"
+
+    async def hedge():
+        nonlocal hedge_calls
+        hedge_calls += 1
+        await asyncio.sleep(0)
+        return "hedge"
+
+    assert await hedged(call, 1.0, hedge) == "first"
+    assert hedge_calls == 0
+
+
+@pytest.mark.asyncio
+async def test_hedge_wins_and_cancels_the_first_call():
+    first_cancelled = asyncio.Event()
+
+    async def slow():
+        try:
+            await asyncio.sleep(10)
+        except asyncio.CancelledError:
+            first_cancelled.set()
+            raise
+        return "first"
+
+    async def hedge():
+        await asyncio.sleep(0)
+        return "hedge"
+
+    assert await asyncio.wait_for(hedged(slow, 0.01, hedge), 1) == "hedge"
+    await asyncio.wait_for(first_cancelled.wait(), 1)
+
+
+@pytest.mark.asyncio
+async def test_first_call_wins_and_cancels_the_hedge():
+    hedge_cancelled = asyncio.Event()
+
+    async def first():
+        await asyncio.sleep(0.05)
+        return "first"
+
+    async def hedge():
+        try:
+            await asyncio.sleep(10)
+        except asyncio.CancelledError:
+            hedge_cancelled.set()
+            raise
+        return "hedge"
+
+    assert await asyncio.wait_for(hedged(first, 0.01, hedge), 1) == "first"
+    await asyncio.wait_for(hedge_cancelled.wait(), 1)
+
+
+@pytest.mark.asyncio
+async def test_a_failed_call_loses_to_the_other():
+    async def first():
+        await asyncio.sleep(0.02)
+        raise ValueError
+
+    async def hedge():
+        await asyncio.sleep(0.04)
+        return "hedge"
+
+    assert await hedged(first, 0.01, hedge) == "hedge"
+
+
+@pytest.mark.asyncio
+async def test_first_failure_is_raised_when_both_fail():
+    async def first():
+        await asyncio.sleep(0.02)
+        raise ValueError
+
+    async def hedge():
+        await asyncio.sleep(0.03)
+        raise KeyError
+
+    with pytest.raises(ValueError):
+        await hedged(first, 0.01, hedge)
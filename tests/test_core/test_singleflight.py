@@ -0,0 +1,122 @@
+import asyncio
+
+import pytest
+
+from barcode_api.core.singleflight import SingleFlight
+
+
+@pytest.mark.asyncio
+async def test_concurrent_calls_share_one_result():
+    flight = SingleFlight()
+    calls = 0
+    release = asyncio.Event()
+
+    async def work():
+        nonlocal calls
+        calls += 1
+        await release.wait()
+        return calls
+
+    tasks = [asyncio.create_task(flight.do("key", work)) for _ in range(5)]
+    await asyncio.sleep(0)
+    release.set()
+
+    assert await asyncio.gather(*tasks) == [1] * 5
+    assert calls == 1
+    assert len(flight) == 0
+
+
+@pytest.mark.asyncio
+async def test_different_keys_run_separately():
+    flight = SingleFlight()
+
+    async def work(value):
+        await asyncio.sleep(0)
+        return value
+
+    assert await asyncio.gather(flight.do("a", lambda: work(1)), flight.do("b", lambda: work(2))) == [1, 2]
+
+
+@pytest.mark.asyncio
+async def test_concurrent_calls_share_an_exception():
+    flight = SingleFlight()
+    calls = 0
+    release = asyncio.Event()
+
+    async def work():
+        nonlocal calls
+        calls += 1
+        await release.wait()
+        raise ValueError
+
+    tasks = [asyncio.create_task(flight.do("key", work)) for _ in range(3)]
+    await asyncio.sleep(0)
+    release.set()
+
+    results = await asyncio.gather(*tasks, return_exceptions=True)
+    assert all(isinstance(result, ValueError) for result in results)
+    assert calls == 1
+    assert len(flight) == 0
+
+
+@pytest.mark.asyncio
+async def test_later_calls_run_again():
+    flight = SingleFlight()
+    calls = 0
+
+    async def work():
+        nonlocal calls
+        calls += 1
+        await asyncio.sleep(0)
+        return calls
+
+    assert await flight.do("key", work) == 1
+    assert await flight.do("key", work) == 2
+
+
+@pytest.mark.asyncio
+async def test_cancelled_leader_hands_off_to_a_waiter():
+    flight = SingleFlight()
+    started: list[str] = []
+    release = asyncio.Event()
+
+    def work(name):
+        async def run():
+            started.append(name)
+            await release.wait()
+            return name
+
+        return run
+
+    leader = asyncio.create_task(flight.do("key", work("leader")))
+    await asyncio.sleep(0)
+    waiter = asyncio.create_task(flight.do("key", work("waiter")))
+    await asyncio.sleep(0)
+    leader.cancel()
+    await asyncio.sleep(0)
+    release.set()
+
+    assert await waiter == "waiter"
+    assert leader.cancelled()
+    assert started == ["leader", "waiter"]
+
+
+@pytest.mark.asyncio
+async def test_cancelled_waiter_leaves_the_leader_running():
+    flight = SingleFlight()
+    release = asyncio.Event()
+
+    async def work():
+        await release.wait()
+        return "done"
+
+    leader = asyncio.create_task(flight.do("key", work))
+    await asyncio.sleep(0)
+    waiter = asyncio.create_task(flight.do("key", work))
+    await asyncio.sleep(0)
+    waiter.cancel()
+    await asyncio.sleep(0)
+    release.set()
+
+    assert await leader == "done"
+    assert waiter.cancelled()
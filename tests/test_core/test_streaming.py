@@ -0,0 +1,53 @@
+import asyncio
+
+import pytest
+
+from barcode_api.core.streaming import TooLongLine, read_lines
+
+
+async def chunked(*chunks: bytes):
+    for chunk in chunks:
+        await asyncio.sleep(0)
+        yield chunk
+
+
+async def read(*chunks: bytes, max_line_length: int = 5, max_batch_size: int = 10) -> list[list[str]]:
+    return [batch async for batch in read_lines(chunked(*chunks), max_line_length, max_batch_size)]
+
+
+@pytest.mark.asyncio
+async def test_lines_split_across_chunks_are_joined():
+    assert await read(b"12", b"3\n45", b"6\n7") == [["123"], ["456"], ["7"]]
+
+
+@pytest.mark.asyncio
+async def test_crlf_and_blank_lines():
+    assert await read(b"123\r\n\r\n  \n456\r\n") == [["123", "456"]]
+
+
+@pytest.mark.asyncio
+async def test_whitespace_doesnt_count_towards_the_length():
+    assert await read(b"   1234\n", b"      123\n", b"12345   \n") == [["1234"], ["123"], ["12345"]]
+    assert await read(b"  ", b"  1", b"23  ", b"  \n") == [["123"]]
+
+
+@pytest.mark.asyncio
+async def test_lines_that_are_too_long():
+    batches = await read(b"123456\n", b"1   ", b"     2\n", b"12345", b"   ", b"6\n", b"ok\n")
+    lines = [line for batch in batches for line in batch]
+
+    assert lines[-1] == "ok"
+    assert [type(line) for line in lines[:-1]] == [TooLongLine] * 3
+    assert lines[0] == "12345…"
+
+
+@pytest.mark.asyncio
+async def test_a_long_line_isnt_buffered():
+    (batch,) = await read(b"1" * 100_000, b"\n", max_line_length=64)
+    assert batch == [TooLongLine("1" * 64 + "…")]
+
+
+@pytest.mark.asyncio
+async def test_batches_are_at_most_max_batch_size_lines():
+    assert await read(b"1\n2\n3\n4\n5", max_batch_size=2) == [["1", "2"], ["3", "4"], ["5"]]
+    assert await read(b"1\n2\n", b"3\n", max_batch_size=2) == [["1", "2"], ["3"]]
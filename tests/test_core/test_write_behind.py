@@ -0,0 +1,120 @@
+import asyncio
+
+import pytest
+
+from barcode_api.core.write_behind import WriteBehindBuffer
+
+
+class Writer:
+    def __init__(self) -> None:
+        self.batches: list[list[str]] = []
+        self.fail = False
+        self.release: asyncio.Event | None = None
+
+    async def __call__(self, items: list[str]) -> None:
+        if self.release is not None:
+            await self.release.wait()
+        if self.fail:
+            raise RuntimeError
+        await asyncio.sleep(0)
+        self.batches.append(items)
+
+
+@pytest.fixture
+def writer():
+    return Writer()
+
+
+@pytest.mark.asyncio
+async def test_pending_items_are_readable_until_written(writer):
+    buffer = WriteBehindBuffer("test", writer, interval=60, max_rows=10)
+    await buffer.add("a", "first")
+    await buffer.add("a", "second")
+
+    assert buffer.get("a") == "second"
+    assert len(buffer) == 1
+
+    await buffer.flush()
+    assert writer.batches == [["second"]]
+    assert buffer.get("a") is None
+    assert buffer.stats() == {"pending": 0, "flushes": 1, "rows_written": 1, "failures": 0}
+
+
+@pytest.mark.asyncio
+async def test_flushes_in_the_background_at_max_rows(writer):
+    buffer = WriteBehindBuffer("test", writer, interval=60, max_rows=3)
+    for key in "ab":
+        await buffer.add(key, key)
+    await asyncio.sleep(0.01)
+    assert writer.batches == []
+
+    await buffer.add("c", "c")
+    await asyncio.sleep(0.01)
+    assert writer.batches == [["a", "b", "c"]]
+    assert len(buffer) == 0
+
+
+@pytest.mark.asyncio
+async def test_add_waits_for_a_flush_at_twice_max_rows(writer):
+    writer.release = asyncio.Event()
+    buffer = WriteBehindBuffer("test", writer, interval=60, max_rows=2)
+    for key in "abc":
+        await buffer.add(key, key)
+    adding = asyncio.create_task(buffer.add("d", "d"))
+    await asyncio.sleep(0.01)
+    assert not adding.done()
+
+    writer.release.set()
+    await adding
+    assert len(buffer) == 0
+    assert sorted(item for batch in writer.batches for item in batch) == ["a", "b", "c", "d"]
+
+
+@pytest.mark.asyncio
+async def test_flushes_every_interval(writer):
+    buffer = WriteBehindBuffer("test", writer, interval=0.01, max_rows=100)
+    buffer.start()
+    await buffer.add("a", "a")
+    await asyncio.sleep(0.05)
+    assert writer.batches == [["a"]]
+    await buffer.close()
+
+
+@pytest.mark.asyncio
+async def test_failed_rows_are_kept_for_the_next_flush(writer):
+    buffer = WriteBehindBuffer("test", writer, interval=60, max_rows=10)
+    await buffer.add("a", "a")
+    writer.fail = True
+    with pytest.raises(RuntimeError):
+        await buffer.flush()
+    assert buffer.get("a") == "a"
+    assert buffer.failures == 1
+
+    writer.fail = False
+    await buffer.flush()
+    assert writer.batches == [["a"]]
+    assert len(buffer) == 0
+
+
+@pytest.mark.asyncio
+async def test_item_replaced_while_being_written_stays_pending(writer):
+    writer.release = asyncio.Event()
+    buffer = WriteBehindBuffer("test", writer, interval=60, max_rows=10)
+    await buffer.add("a", "first")
+    flushing = asyncio.create_task(buffer.flush())
+    await asyncio.sleep(0)
+    await buffer.add("a", "second")
+    writer.release.set()
+    await flushing
+
+    assert writer.batches == [["first"]]
+    assert buffer.get("a") == "second"
+
+
+@pytest.mark.asyncio
+async def test_close_writes_whatever_is_pending(writer):
+    buffer = WriteBehindBuffer("test", writer, interval=60, max_rows=10)
+    buffer.start()
+    await buffer.add("a", "a")
+    await buffer.close()
+    assert writer.batches == [["a"]]
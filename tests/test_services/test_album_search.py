@@ -0,0 +1,134 @@
+import logging
+
+import pytest
+from sqlalchemy import delete, update
+
+from barcode_api.core.cache import LRUCache
+from barcode_api.models import Album
+from barcode_api.services import AlbumService
+
+
+def album(barcode: str, artist: str, name: str, genres: list[str] | None = None) -> Album:
+    return Album(
+        barcode=barcode,
+        artist=artist,
+        name=name,
+        year="1999",
+        genres=genres if genres is not None else ["Rock"],
+        spotify_id="4aawyAB9vmqN3uQ7FjRGTy",
+    )
+
+
+@pytest.fixture
+def service(app_config, migrated_db_session):
+    return AlbumService(app_config, logging.getLogger("test"), migrated_db_session, LRUCache(maxsize=16))
+
+
+async def found(service: AlbumService, query: str, **kwargs) -> list[str]:
+    return [album.barcode for album in await service.find(query, **kwargs)]
+
+
+@pytest.mark.asyncio
+async def test_find_follows_inserts_updates_and_deletes(service, migrated_db_session):
+    await service._add_to_cache(album("111", "Radiohead", "OK Computer"))
+    assert await found(service, "computer") == ["111"]
+
+    # rewritten by the upsert
+    await service._add_to_cache(album("111", "Radiohead", "Kid A"))
+    assert await found(service, "computer") == []
+    assert await found(service, "kid") == ["111"]
+
+    async with migrated_db_session.begin():
+        await migrated_db_session.execute(delete(Album).where(Album.barcode == "111"))
+    assert await found(service, "radiohead") == []
+
+
+@pytest.mark.asyncio
+async def test_find_matches_every_word_as_a_prefix(service):
+    await service._add_many_to_cache(
+        [
+            album("111", "Radiohead", "OK Computer"),
+            album("222", "Radio Moscow", "Brain Cycles"),
+            album("333", "Portishead", "Dummy"),
+        ]
+    )
+
+    assert sorted(await found(service, "radio")) == ["111", "222"]
+    assert await found(service, "radio mos") == ["222"]
+    assert await found(service, "OK comp") == ["111"]
+    # query syntax is matched as plain words
+    assert await found(service, 'dummy" OR "radiohead') == []
+    assert await found(service, "***") == []
+
+
+@pytest.mark.asyncio
+async def test_find_ranks_artists_above_album_names_and_paginates(service, migrated_db_session):
+    await service._add_many_to_cache(
+        [
+            album("111", "Some Band", "Blue Train"),
+            album("222", "Blue Band", "Some Album"),
+            album("333", "Other Band", "Blue Lines"),
+            album("444", "Deleted", "Blue Deleted"),
+        ]
+    )
+    async with migrated_db_session.begin():
+        await migrated_db_session.execute(update(Album).where(Album.barcode == "444").values(is_deleted=True))
+
+    ranked = await found(service, "blue")
+    assert ranked[0] == "222"
+    assert sorted(ranked) == ["111", "222", "333"]
+    assert await found(service, "blue", limit=2) == ranked[:2]
+    assert await found(service, "blue", limit=2, offset=2) == ranked[2:]
+
+
+async def in_genre(service: AlbumService, genre: str, **kwargs) -> list[str]:
+    return [album.barcode for album in await service.by_genre(genre, **kwargs)]
+
+
+@pytest.mark.asyncio
+async def test_genres_follow_upserts_and_deletes(service, migrated_db_session):
+    await service._add_to_cache(album("111", "Radiohead", "OK Computer", genres=["Rock", "Electronic"]))
+    assert await in_genre(service, "Electronic") == ["111"]
+
+    # rewritten by the upsert with a different genre list
+    await service._add_to_cache(album("111", "Radiohead", "OK Computer", genres=["Rock", "Alternative"]))
+    assert await in_genre(service, "Electronic") == []
+    assert await in_genre(service, "Alternative") == ["111"]
+
+    async with migrated_db_session.begin():
+        await migrated_db_session.execute(delete(Album).where(Album.barcode == "111"))
+    assert await in_genre(service, "Rock") == []
+
+
+@pytest.mark.asyncio
+async def test_by_genre_matches_exactly(service):
+    await service._add_many_to_cache(
+        [
+            album("111", "Radiohead", "OK Computer", genres=["Rock"]),
+            album("222", "Portishead", "Dummy", genres=["Trip Hop", "Rock & Roll"]),
+            album("333", "Massive Attack", "Blue Lines", genres=["Rock", "Rock"]),
+        ]
+    )
+
+    assert await in_genre(service, "Rock") == ["333", "111"]
+    assert await in_genre(service, "rock") == []
+    assert await in_genre(service, "Roc") == []
+    assert await in_genre(service, "Trip Hop") == ["222"]
+
+
+@pytest.mark.asyncio
+async def test_by_genre_orders_by_artist_and_name_and_paginates(service, migrated_db_session):
+    await service._add_many_to_cache(
+        [
+            album("111", "B Artist", "A Album"),
+            album("222", "A Artist", "B Album"),
+            album("333", "A Artist", "A Album"),
+            album("444", "Deleted", "Album"),
+        ]
+    )
+    async with migrated_db_session.begin():
+        await migrated_db_session.execute(update(Album).where(Album.barcode == "444").values(is_deleted=True))
+
+    assert await in_genre(service, "Rock") == ["333", "222", "111"]
+    assert await in_genre(service, "Rock", limit=2) == ["333", "222"]
+    assert await in_genre(service, "Rock", limit=2, offset=2) == ["111"]
@@ -0,0 +1,201 @@
+import asyncio
+import logging
+from datetime import UTC, datetime, timedelta
+
+import httpx
+import pytest
+
+from barcode_api.core.background import refresh_pool
+from barcode_api.core.cache import LRUCache
+from barcode_api.core.http_client import HttpClientManager
+from barcode_api.core.ratelimit import UpstreamScheduler
+from barcode_api.core.resilience import policy_from_config
+from barcode_api.models.albums import Album, AlbumLookupMiss, CacheTable
+from barcode_api.services import AlbumService, album_service
+from barcode_api.services.album_service import DiscogsLookupService, HttpxService
+
+
+@pytest.mark.asyncio
+async def test_search_many_logs_unexpected_errors(app_config, db_session, monkeypatch, caplog):
+    service = AlbumService(app_config, logging.getLogger("test"), db_session, LRUCache(maxsize=16))
+
+    async def broken_lookup(barcode):
+        await asyncio.sleep(0)
+        err_msg = f"connection to postgres://user:secret@db failed looking up {barcode}"
+        raise RuntimeError(err_msg)
+
+    monkeypatch.setattr(service, "_lookup_and_cache", broken_lookup)
+    with caplog.at_level(logging.ERROR, logger="test"):
+        results = await service.search_many(["111"])
+
+    assert isinstance(results["111"], RuntimeError)
+    (record,) = caplog.records
+    assert record.getMessage() == "Error looking up barcode 111"
+    assert "secret" in record.exc_text
+
+
+@pytest.mark.asyncio
+async def test_long_retry_after_is_a_rate_limited_error(app_config):
+    requests: list[httpx.Request] = []
+
+    def handler(request: httpx.Request) -> httpx.Response:
+        requests.append(request)
+        return httpx.Response(429, headers={"Retry-After": "3600"})
+
+    service = DiscogsLookupService(
+        app_config,
+        logging.getLogger("test"),
+        HttpClientManager({"transport": httpx.MockTransport(handler)}),
+        UpstreamScheduler("discogs", requests_per_minute=60, burst=5, max_pause_wait=2),
+        policy=policy_from_config("discogs", app_config),
+    )
+    async with asyncio.timeout(1):
+        with pytest.raises(HttpxService.RateLimitedError) as exc_info:
+            await service.search("123")
+    assert len(requests) == 1
+    assert exc_info.value.retry_after == pytest.approx(3600, abs=1)
+
+
+class FakeUpstream:
+    """Stands in for AlbumService._lookup_album, counting lookups and returning a new album or raising error"""
+
+    def __init__(self) -> None:
+        self.calls = 0
+        self.error: Exception | None = None
+
+    async def __call__(self, barcode: str) -> Album:
+        self.calls += 1
+        await asyncio.sleep(0)
+        if self.error is not None:
+            raise self.error
+        return Album(barcode=barcode, artist="Artist", name="Fresh", year="2000", genres=[], spotify_id="spotify")
+
+
+@pytest.fixture
+def upstream(monkeypatch, session_manager):
+    upstream = FakeUpstream()
+    monkeypatch.setattr(AlbumService, "_lookup_album", upstream)
+    # background refreshes open their own session, and remember their failures across services
+    monkeypatch.setattr(album_service, "sessionmanager", session_manager)
+    monkeypatch.setattr(AlbumService, "_refresh_failures", LRUCache(maxsize=16))
+    return upstream
+
+
+def service_for(config, db_session, **ttls) -> AlbumService:
+    return AlbumService(config.model_copy(update=ttls), logging.getLogger("test"), db_session, LRUCache(maxsize=16))
+
+
+async def store(db_session, row: CacheTable, age: float) -> None:
+    """Writes row to the database as if it was last updated age seconds ago"""
+    row.last_update = datetime.now(UTC).replace(tzinfo=None) - timedelta(seconds=age)
+    async with db_session.begin():
+        db_session.add(row)
+
+
+def stale_album(barcode: str = "111") -> Album:
+    return Album(barcode=barcode, artist="Artist", name="Stale", year="2000", genres=[], spotify_id="spotify")
+
+
+async def finish_refresh(barcode: str) -> None:
+    await refresh_pool._tasks["refresh", barcode]
+
+
+@pytest.mark.asyncio
+async def test_misses_are_negatively_cached(app_config, db_session, upstream):
+    service = service_for(app_config, db_session, negative_cache_ttl=60)
+    upstream.error = AlbumService.NoDiscogsAlbumFoundError("No Discogs album found for barcode 111")
+
+    for _ in range(2):
+        with pytest.raises(AlbumService.NoDiscogsAlbumFoundError, match="barcode 111"):
+            await service.search("111")
+    assert upstream.calls == 1
+
+
+@pytest.mark.asyncio
+async def test_expired_misses_are_looked_up_again(app_config, db_session, upstream):
+    service = service_for(app_config, db_session, negative_cache_ttl=60)
+    await store(db_session, AlbumLookupMiss(barcode="111", stage="spotify", detail="No spotify album found"), 30)
+    await store(db_session, AlbumLookupMiss(barcode="222", stage="spotify", detail="No spotify album found"), 60)
+
+    with pytest.raises(AlbumService.NoSpotifyFoundError):
+        await service.search("111")
+    assert upstream.calls == 0
+    assert (await service.search("222")).name == "Fresh"
+    assert upstream.calls == 1
+
+
+@pytest.mark.asyncio
+async def test_negative_cache_can_be_turned_off(app_config, db_session, upstream):
+    service = service_for(app_config, db_session, negative_cache_ttl=0)
+    upstream.error = AlbumService.NoDiscogsAlbumFoundError("No Discogs album found for barcode 111")
+
+    for _ in range(2):
+        with pytest.raises(AlbumService.NoDiscogsAlbumFoundError):
+            await service.search("111")
+    assert upstream.calls == 2
+
+
+@pytest.mark.asyncio
+async def test_fresh_album_is_served_as_is(app_config, db_session, upstream):
+    service = service_for(app_config, db_session, album_soft_ttl=100, album_hard_ttl=200)
+    await store(db_session, stale_album(), 99)
+
+    assert (await service.search("111")).name == "Stale"
+    assert ("refresh", "111") not in refresh_pool
+    assert upstream.calls == 0
+
+
+@pytest.mark.asyncio
+async def test_past_soft_ttl_serves_stale_and_refreshes_in_the_background(app_config, db_session, upstream):
+    service = service_for(app_config, db_session, album_soft_ttl=100, album_hard_ttl=0)
+    await store(db_session, stale_album(), 100)
+
+    assert (await service.search("111")).name == "Stale"
+    await finish_refresh("111")
+    assert upstream.calls == 1
+
+    fresh = service_for(app_config, db_session, album_soft_ttl=100, album_hard_ttl=0)
+    assert (await fresh.search("111")).name == "Fresh"
+
+
+@pytest.mark.asyncio
+async def test_failed_background_refresh_waits_before_retrying(app_config, db_session, upstream, fake_clock):
+    clock = fake_clock(album_service)
+    service = service_for(app_config, db_session, album_soft_ttl=100, album_hard_ttl=0, refresh_retry_after=60)
+    await store(db_session, stale_album(), 100)
+    upstream.error = HttpxService.UpstreamError("Discogs is down")
+
+    await service.search("111")
+    await finish_refresh("111")
+    assert upstream.calls == 1
+
+    clock.now += 59
+    assert (await service.search("111")).name == "Stale"
+    assert ("refresh", "111") not in refresh_pool
+
+    clock.now += 1
+    await service.search("111")
+    await finish_refresh("111")
+    assert upstream.calls == 2
+
+
+@pytest.mark.asyncio
+async def test_past_hard_ttl_refreshes_inline(app_config, db_session, upstream):
+    service = service_for(app_config, db_session, album_soft_ttl=100, album_hard_ttl=200)
+    await store(db_session, stale_album(), 200)
+
+    assert await service.search_cached("111") is None
+    assert (await service.search("111")).name == "Fresh"
+    assert ("refresh", "111") not in refresh_pool
+    assert upstream.calls == 1
+
+
+@pytest.mark.asyncio
+async def test_failed_inline_refresh_serves_stale(app_config, db_session, upstream, caplog):
+    service = service_for(app_config, db_session, album_soft_ttl=100, album_hard_ttl=200)
+    await store(db_session, stale_album(), 200)
+    upstream.error = HttpxService.UpstreamTimeoutError("Discogs timed out")
+
+    with caplog.at_level(logging.WARNING, logger="test"):
+        assert (await service.search("111")).name == "Stale"
+    assert caplog.messages == ["Serving stale album for 111, refresh failed: Discogs timed out"]
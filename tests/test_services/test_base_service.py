@@ -0,0 +1,103 @@
+import logging
+from datetime import datetime
+from types import SimpleNamespace
+
+import pytest
+from sqlalchemy import func, select, update
+
+from barcode_api.core.cache import LRUCache
+from barcode_api.core.errors import BarcodeAPIBaseDBException
+from barcode_api.models import Album
+from barcode_api.services._base import BarcodeServiceBase
+
+WRITTEN_AT = datetime(2024, 1, 1, 12, 0, 0, 123456)
+
+
+class AlbumCache(BarcodeServiceBase):
+    MODEL = Album
+
+
+def album(barcode: str, name: str | None = None) -> Album:
+    return Album(
+        barcode=barcode,
+        artist="Artist",
+        name=name or f"Album {barcode}",
+        year="1999",
+        genres=["Rock"],
+        spotify_id="4aawyAB9vmqN3uQ7FjRGTy",
+    )
+
+
+@pytest.fixture
+def l1():
+    return LRUCache(maxsize=16)
+
+
+@pytest.fixture
+def service(app_config, db_session, l1):
+    return AlbumCache(app_config, logging.getLogger("test"), db_session, l1)
+
+
+async def stored(db_session) -> list[Album]:
+    async with db_session.begin():
+        return list(await db_session.scalars(select(Album).order_by(Album.barcode)))
+
+
+@pytest.mark.asyncio
+async def test_upsert_inserts_new_rows_and_updates_existing_ones(service, db_session, l1):
+    inserted = await service._add_to_cache(album("111", name="Before"))
+    assert inserted.id is not None
+
+    updated = await service._add_to_cache(album("111", name="After"))
+    assert updated.id == inserted.id
+    assert updated.name == "After"
+    assert [row.name for row in await stored(db_session)] == ["After"]
+    assert l1.get(("albums", "barcode", "111")) is updated
+
+
+@pytest.mark.asyncio
+async def test_upsert_revives_deleted_rows_and_refreshes_last_update(service, db_session):
+    await service._add_to_cache(album("111"))
+    async with db_session.begin():
+        await db_session.execute(update(Album).values(is_deleted=True, last_update=WRITTEN_AT))
+
+    revived = await service._add_to_cache(album("111"))
+    assert revived.is_deleted is False
+    assert revived.last_update > WRITTEN_AT
+
+
+@pytest.mark.asyncio
+async def test_rows_from_the_write_behind_buffer_keep_their_last_update(service, db_session):
+    await service._add_to_cache(album("111", name="Before"))
+    # _add_to_cache stamps buffered rows with the time they were buffered
+    buffered = [album("111", name="After"), album("222")]
+    for row in buffered:
+        row.last_update = WRITTEN_AT
+
+    await service._write_pending([(row, "barcode") for row in buffered])
+
+    rows = await stored(db_session)
+    assert [(row.barcode, row.name) for row in rows] == [("111", "After"), ("222", "Album 222")]
+    assert [row.last_update for row in rows] == [WRITTEN_AT, WRITTEN_AT]
+
+
+@pytest.mark.asyncio
+async def test_the_last_row_for_a_key_wins_within_a_batch(service, db_session):
+    written = await service._add_many_to_cache([album("111", name="First"), album("222"), album("111", name="Last")])
+
+    assert sorted((row.barcode, row.name) for row in written) == [("111", "Last"), ("222", "Album 222")]
+    async with db_session.begin():
+        assert await db_session.scalar(select(func.count()).select_from(Album)) == 2
+
+
+@pytest.mark.asyncio
+async def test_upserting_nothing_skips_the_database(service):
+    assert await service._add_many_to_cache([]) == []
+
+
+def test_upserts_need_a_supported_dialect(app_config):
+    session = SimpleNamespace(bind=SimpleNamespace(dialect=SimpleNamespace(name="mysql")))
+    service = AlbumCache(app_config, logging.getLogger("test"), session)
+
+    with pytest.raises(BarcodeAPIBaseDBException, match="mysql"):
+        service._upsert_statement(Album, [service._row_values(album("111"))], "barcode")
@@ -0,0 +1,174 @@
+import asyncio
+import logging
+from datetime import UTC, datetime, timedelta
+
+import pytest
+from sqlalchemy import update
+
+from barcode_api.models import LookupJob, LookupJobStatus
+from barcode_api.services import LookupJobService, job_service
+from barcode_api.services.job_service import LookupJobWorkers
+
+LEASE = 300
+
+
+@pytest.fixture
+def workers():
+    return LookupJobWorkers(concurrency=1, max_pending=10, max_attempts=3, lease=LEASE)
+
+
+@pytest.fixture
+def service_for(app_config, session_manager, workers):
+    def service(db_session):
+        return LookupJobService(app_config, logging.getLogger("test"), db_session, workers=workers)
+
+    return service
+
+
+async def set_job(session_manager, job_id: str, **values) -> None:
+    async with session_manager.session() as db_session, db_session.begin():
+        await db_session.execute(update(LookupJob).where(LookupJob.id == job_id).values(**values))
+
+
+@pytest.mark.asyncio
+async def test_only_one_worker_starts_a_job(session_manager, service_for):
+    async with session_manager.session() as db_session:
+        job = await service_for(db_session).create("123")
+
+    async with session_manager.session() as first, session_manager.session() as second:
+        started = await asyncio.gather(service_for(first).start(job.id), service_for(second).start(job.id))
+
+    assert sorted(job is None for job in started) == [False, True]
+    running = next(job for job in started if job is not None)
+    assert running.status == LookupJobStatus.running
+    assert running.attempts == 1
+
+
+@pytest.mark.asyncio
+async def test_requeue_leaves_jobs_running_within_their_lease(session_manager, service_for):
+    async with session_manager.session() as db_session:
+        service = service_for(db_session)
+        pending = await service.create("111")
+        running = await service.create("222")
+        lost = await service.create("333")
+        await service.start(running.id)
+        await service.start(lost.id)
+    stale = datetime.now(UTC).replace(tzinfo=None) - timedelta(seconds=LEASE * 2)
+    await set_job(session_manager, lost.id, last_update=stale)
+
+    async with session_manager.session() as db_session:
+        service = service_for(db_session)
+        assert sorted(await service.requeue()) == sorted([pending.id, lost.id])
+        assert (await service.get(running.id)).status == LookupJobStatus.running
+        assert (await service.get(lost.id)).status == LookupJobStatus.pending
+
+
+@pytest.mark.asyncio
+async def test_wait_sees_a_job_that_finishes_while_it_is_read(session_manager, service_for, workers):
+    async with session_manager.session() as db_session:
+        job = await service_for(db_session).create("123")
+
+    async with session_manager.session() as db_session:
+        service = service_for(db_session)
+        get = service.get
+
+        async def get_then_finish(job_id):
+            read = await get(job_id)
+            if read.status == LookupJobStatus.pending:
+                # the job finishes after it was read, before the wait starts
+                await set_job(session_manager, job_id, status=LookupJobStatus.succeeded)
+                workers._notify(job_id)
+            return read
+
+        service.get = get_then_finish
+        async with asyncio.timeout(1):
+            waited = await service.wait(job.id, max_wait=30)
+
+    assert waited.status == LookupJobStatus.succeeded
+
+
+@pytest.mark.asyncio
+async def test_wait_gives_up_after_max_wait(session_manager, service_for):
+    async with session_manager.session() as db_session:
+        service = service_for(db_session)
+        job = await service.create("123")
+        waited = await service.wait(job.id, max_wait=0.01)
+    assert waited.status == LookupJobStatus.pending
+
+
+@pytest.mark.asyncio
+async def test_wait_for_an_unknown_job(db_session, service_for):
+    with pytest.raises(LookupJobService.NotFoundError):
+        await service_for(db_session).wait("missing", max_wait=1)
+
+
+@pytest.mark.asyncio
+async def test_jobs_interrupted_by_shutdown_are_requeued_on_the_next_start(
+    app_config, session_manager, service_for, workers, monkeypatch
+):
+    monkeypatch.setattr(job_service, "sessionmanager", session_manager)
+    searching = asyncio.Event()
+
+    async def search(self, barcode):
+        searching.set()
+        await asyncio.Event().wait()
+
+    monkeypatch.setattr(job_service.AlbumService, "search", search)
+    async with session_manager.session() as db_session:
+        job = await service_for(db_session).create("123")
+
+    await workers.start(app_config)
+    async with asyncio.timeout(1):
+        await searching.wait()
+    await workers.close(app_config)
+
+    async with session_manager.session() as db_session:
+        service = service_for(db_session)
+        interrupted = await service.get(job.id)
+        assert interrupted.status == LookupJobStatus.pending
+        assert interrupted.attempts == 0
+        assert await service.requeue() == [job.id]
+
+
+@pytest.mark.asyncio
+async def test_prune_deletes_finished_jobs_past_their_ttl(app_config, session_manager, service_for):
+    async with session_manager.session() as db_session:
+        service = service_for(db_session)
+        old = await service.create("111")
+        recent = await service.create("222")
+        active = await service.create("333")
+    expired = datetime.now(UTC).replace(tzinfo=None) - timedelta(seconds=app_config.lookup_job_ttl * 2)
+    await set_job(session_manager, old.id, status=LookupJobStatus.succeeded, last_update=expired)
+    await set_job(session_manager, recent.id, status=LookupJobStatus.failed)
+    await set_job(session_manager, active.id, last_update=expired)
+
+    async with session_manager.session() as db_session:
+        service = service_for(db_session)
+        await service.prune()
+        with pytest.raises(LookupJobService.NotFoundError):
+            await service.get(old.id)
+        assert (await service.get(recent.id)).status == LookupJobStatus.failed
+        assert (await service.get(active.id)).status == LookupJobStatus.pending
+
+
+@pytest.mark.asyncio
+async def test_a_failed_prune_doesnt_stop_pruning(app_config, session_manager, workers, monkeypatch):
+    monkeypatch.setattr(job_service, "sessionmanager", session_manager)
+    monkeypatch.setattr(job_service, "PRUNE_INTERVAL", 0.01)
+    prunes = 0
+    pruned_again = asyncio.Event()
+
+    async def prune(self):
+        nonlocal prunes
+        prunes += 1
+        await asyncio.sleep(0)
+        if prunes == 1:
+            err_msg = "database is locked"
+            raise RuntimeError(err_msg)
+        pruned_again.set()
+
+    monkeypatch.setattr(LookupJobService, "prune", prune)
+    pruning = asyncio.create_task(workers._prune(app_config))
+    async with asyncio.timeout(5):
+        await pruned_again.wait()
+    pruning.cancel()
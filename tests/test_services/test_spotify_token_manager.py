@@ -0,0 +1,116 @@
+import asyncio
+
+import pytest
+
+from barcode_api.services import album_service
+from barcode_api.services.album_service import SpotifyTokenManager
+
+
+class Fetcher:
+    """Hands out token-1, token-2, ... each valid for expires_in seconds"""
+
+    def __init__(self, expires_in: int = 3600) -> None:
+        self.expires_in = expires_in
+        self.calls = 0
+        self.release: asyncio.Event | None = None
+        self.fail = False
+
+    async def __call__(self) -> tuple[str, int]:
+        self.calls += 1
+        if self.release is not None:
+            await self.release.wait()
+        await asyncio.sleep(0)
+        if self.fail:
+            raise RuntimeError
+        return f"token-{self.calls}", self.expires_in
+
+
+@pytest.fixture
+def clock(fake_clock):
+    return fake_clock(album_service)
+
+
+@pytest.fixture
+def fetch():
+    return Fetcher()
+
+
+@pytest.mark.asyncio
+async def test_reuses_the_token_until_it_nears_expiry(clock, fetch):
+    manager = SpotifyTokenManager()
+    assert await manager.get_token(fetch, refresh_margin=60) == "token-1"
+    clock.now += 3000
+    assert await manager.get_token(fetch, refresh_margin=60) == "token-1"
+    assert fetch.calls == 1
+
+
+@pytest.mark.asyncio
+async def test_refreshes_in_the_background_shortly_before_expiry(clock, fetch):
+    manager = SpotifyTokenManager()
+    await manager.get_token(fetch, refresh_margin=60)
+    fetch.release = asyncio.Event()
+    clock.now += 3550
+
+    # the current token is still handed out while the refresh runs
+    assert await manager.get_token(fetch, refresh_margin=60) == "token-1"
+    assert await manager.get_token(fetch, refresh_margin=60) == "token-1"
+    fetch.release.set()
+    await manager._refresh_task
+    assert await manager.get_token(fetch, refresh_margin=60) == "token-2"
+    assert fetch.calls == 2
+
+
+@pytest.mark.asyncio
+async def test_an_expired_token_is_waited_for(clock, fetch):
+    manager = SpotifyTokenManager()
+    await manager.get_token(fetch)
+    clock.now += 3600
+    assert await manager.get_token(fetch) == "token-2"
+
+
+@pytest.mark.asyncio
+async def test_concurrent_callers_share_one_refresh(clock, fetch):
+    manager = SpotifyTokenManager()
+    fetch.release = asyncio.Event()
+    callers = [asyncio.create_task(manager.get_token(fetch)) for _ in range(5)]
+    await asyncio.sleep(0)
+    fetch.release.set()
+
+    assert await asyncio.gather(*callers) == ["token-1"] * 5
+    assert fetch.calls == 1
+
+
+@pytest.mark.asyncio
+async def test_a_cancelled_caller_doesnt_cancel_the_refresh(clock, fetch):
+    manager = SpotifyTokenManager()
+    fetch.release = asyncio.Event()
+    cancelled = asyncio.create_task(manager.get_token(fetch))
+    waiting = asyncio.create_task(manager.get_token(fetch))
+    await asyncio.sleep(0)
+    cancelled.cancel()
+    fetch.release.set()
+
+    assert await waiting == "token-1"
+    assert fetch.calls == 1
+
+
+@pytest.mark.asyncio
+async def test_a_failed_refresh_is_retried_by_the_next_caller(clock, fetch):
+    manager = SpotifyTokenManager()
+    fetch.fail = True
+    with pytest.raises(RuntimeError):
+        await manager.get_token(fetch)
+
+    fetch.fail = False
+    assert await manager.get_token(fetch) == "token-2"
+
+
+@pytest.mark.asyncio
+async def test_invalidate_only_drops_the_token_it_was_given(clock, fetch):
+    manager = SpotifyTokenManager()
+    await manager.get_token(fetch)
+    manager.invalidate("token-0")
+    assert await manager.get_token(fetch) == "token-1"
+
+    manager.invalidate("token-1")
+    assert await manager.get_token(fetch) == "token-2"
@@ -0,0 +1,62 @@
+import logging
+
+import pytest
+
+from barcode_api.core.cache import LRUCache
+from barcode_api.services.token_service import TokenService, hash_secret, token_digest, verify_secret
+
+
+@pytest.fixture
+def verified():
+    return LRUCache(maxsize=16, ttl=60)
+
+
+@pytest.fixture
+def token_service(app_config, db_session, verified):
+    return TokenService(app_config, logging.getLogger("test"), db_session, verified=verified)
+
+
+def test_verify_secret():
+    hashed = hash_secret("secret")
+    assert verify_secret("secret", hashed)
+    assert not verify_secret("other", hashed)
+    assert not verify_secret("secret", "md5$" + hashed.partition("$")[2])
+
+
+@pytest.mark.asyncio
+async def test_verify_caches_valid_tokens(token_service, verified):
+    token, presented = await token_service.create("test")
+    assert await token_service.verify(presented) == token.id
+    assert verified.get(token_digest(presented)) == token.id
+
+
+@pytest.mark.asyncio
+@pytest.mark.parametrize(
+    "presented",
+    ["1.wrong", "nodot", "x.secret", "1.", "²1.secret", "99999999999999999999999.secret", "9" * 5000 + ".secret"],
+)
+async def test_verify_rejects_invalid_tokens(token_service, verified, presented):
+    await token_service.create("test")
+    assert await token_service.verify(presented) is None
+    assert len(verified) == 0
+
+
+@pytest.mark.asyncio
+async def test_revoke_invalidates_cache(token_service, verified):
+    token, presented = await token_service.create("test")
+    other, other_presented = await token_service.create("other")
+    await token_service.verify(presented)
+    await token_service.verify(other_presented)
+
+    await token_service.revoke(token.id)
+
+    assert verified.get(token_digest(presented)) is None
+    assert verified.get(token_digest(other_presented)) == other.id
+    assert await token_service.verify(presented) is None
+    assert await token_service.revoked_since(token.created) == [token.id]
+
+
+@pytest.mark.asyncio
+async def test_revoke_unknown_token(token_service):
+    with pytest.raises(TokenService.NotFoundError):
+        await token_service.revoke(42)
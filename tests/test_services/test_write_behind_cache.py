@@ -0,0 +1,64 @@
+import logging
+
+import pytest
+
+from barcode_api.core.cache import LRUCache
+from barcode_api.core.write_behind import WriteBehindBuffer
+from barcode_api.models import Album
+from barcode_api.services._base import BarcodeServiceBase
+
+
+class AlbumCache(BarcodeServiceBase):
+    MODEL = Album
+
+
+def album(barcode: str) -> Album:
+    return Album(
+        barcode=barcode,
+        artist=f"Artist {barcode}",
+        name=f"Album {barcode}",
+        year="1999",
+        genres=["Rock"],
+        spotify_id="4aawyAB9vmqN3uQ7FjRGTy",
+    )
+
+
+@pytest.fixture
+def l1():
+    return LRUCache(maxsize=16)
+
+
+@pytest.fixture
+def buffer(app_config, session_manager, l1):
+    async def write(items):
+        async with session_manager.session() as db_session:
+            await AlbumCache(app_config, logging.getLogger("test"), db_session, l1)._write_pending(items)
+
+    return WriteBehindBuffer("test", write, interval=60, max_rows=100)
+
+
+@pytest.mark.asyncio
+async def test_reads_see_buffered_writes(app_config, db_session, l1, buffer):
+    service = AlbumCache(app_config, logging.getLogger("test"), db_session, l1, write_buffer=buffer)
+
+    written = await service._add_to_cache(album("123"))
+    assert written.id is None
+
+    assert await service._get_fom_cache(value="123") is written
+    assert await service._get_many_from_cache(["123", "456"]) == {"123": written}
+
+
+@pytest.mark.asyncio
+async def test_flushed_rows_are_read_back_from_the_database(app_config, session_manager, l1, buffer):
+    async with session_manager.session() as db_session:
+        service = AlbumCache(app_config, logging.getLogger("test"), db_session, l1, write_buffer=buffer)
+        written = await service._add_to_cache(album("123"))
+        await buffer.flush()
+
+    l1.clear()
+    async with session_manager.session() as db_session:
+        stored = await AlbumCache(app_config, logging.getLogger("test"), db_session, l1)._get_fom_cache(value="123")
+    assert stored.id is not None
+    assert stored.name == "Album 123"
+    # the row keeps the time it was buffered, so its ETag doesn't change when it is written
+    assert stored.last_update == written.last_update
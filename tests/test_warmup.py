@@ -0,0 +1,54 @@
+import asyncio
+import io
+import logging
+
+import pytest
+
+from barcode_api.core.cache import LRUCache
+from barcode_api.core.ratelimit import Priority, upstream_priority
+from barcode_api.models import Album
+from barcode_api.services import AlbumService
+from barcode_api.services.album_service import HttpxService
+from barcode_api.warmup import Progress, Warmup
+
+
+def album(barcode: str) -> Album:
+    return Album(
+        barcode=barcode,
+        artist="Artist",
+        name=f"Album {barcode}",
+        year="1999",
+        genres=["Rock"],
+        spotify_id="4aawyAB9vmqN3uQ7FjRGTy",
+    )
+
+
+@pytest.mark.asyncio
+async def test_a_failing_barcode_doesnt_stop_the_run(app_config, db_session, monkeypatch):
+    service = AlbumService(app_config, logging.getLogger("test"), db_session, LRUCache(maxsize=16))
+    priorities: list[Priority] = []
+
+    async def lookup_album(barcode: str) -> Album:
+        priorities.append(upstream_priority.get())
+        await asyncio.sleep(0)
+        if barcode == "broken":
+            # what DiscogsAlbum.from_api_result raises for a title without " - "
+            raise IndexError
+        if barcode == "unavailable":
+            raise HttpxService.UpstreamError
+        if barcode == "missing":
+            raise AlbumService.NoDiscogsAlbumFoundError(AlbumService.NoDiscogsAlbumFoundError.ERROR_TEXT % barcode)
+        return album(barcode)
+
+    monkeypatch.setattr(service, "_lookup_album", lookup_album)
+    checkpoint = io.StringIO()
+    progress = Progress(5, output=io.StringIO())
+    runner = Warmup(service, checkpoint, progress, concurrency=2, batch_size=10)
+
+    await runner.run(["111", "broken", "unavailable", "missing", "222"])
+
+    assert progress.counts == {"cached": 2, "not_found": 1, "failed": 2}
+    assert sorted(checkpoint.getvalue().splitlines()) == ["111\tcached", "222\tcached", "missing\tnot_found"]
+    assert set(priorities) == {Priority.BACKGROUND}
+    # the caller's own priority is left alone
+    assert upstream_priority.get() == Priority.INTERACTIVE